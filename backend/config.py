@@ -25,9 +25,80 @@ class Settings(BaseSettings):
     # Admin
     ADMIN_EMAIL: str
 
+    # Lab calendar
+    LAB_CLOSED_WEEKDAYS: str = ""  # comma-separated day names, e.g. "Saturday"
+    LAB_HOLIDAYS: str = ""  # comma-separated ISO dates, e.g. "2025-10-21,2025-11-01"
+
     # AI
     OPENAI_API_KEY: str = ""
     GEMINI_API_KEY: str = ""
+    OPENAI_BASE_URL: str = "https://api.openai.com/v1"  # point at a local fake server for tests
+    OPENAI_MODEL: str = "gpt-4o-mini"
+    GEMINI_BASE_URL: str = "https://generativelanguage.googleapis.com/v1beta"
+    GEMINI_MODEL: str = "gemini-2.0-flash-exp"
+    LLM_CONNECT_TIMEOUT: float = 3.0
+    LLM_READ_TIMEOUT: float = 20.0
+    LLM_MAX_CONCURRENCY: int = 4  # in-flight requests per provider
+    LLM_BREAKER_FAILURES: int = 3  # consecutive failures that open a provider's circuit
+    LLM_BREAKER_RESET: float = 30.0  # seconds before an open circuit lets a probe through
+    LLM_HEDGE_PERCENTILE: float = 0.0  # e.g. 95: race the next provider once a call is slower than p95
+    LLM_CACHE_MAX_ENTRIES: int = 1024
+    LLM_CACHE_DISK: bool = False  # also keep responses in ai-models/llm_cache.sqlite
+
+    # Agent batch runner
+    AGENT_BATCH_ENABLED: bool = True
+    AGENT_BATCH_HOUR: int = 2  # Nepal time; runs every member through the agents nightly
+    AGENT_BATCH_CONCURRENCY: int = 4
+
+    # Background log writer (audit logs, agent actions)
+    LOG_WRITER_QUEUE_SIZE: int = 10000
+    LOG_WRITER_BATCH_SIZE: int = 200
+    LOG_WRITER_FLUSH_INTERVAL: float = 1.0  # seconds
+    LOG_WRITER_FULL_POLICY: str = "drop"  # "drop" or "block" when the queue is full
+
+    # Background report exports (files in exports/, removed with their job)
+    EXPORT_JOB_TTL_HOURS: float = 24.0
+
+    # Retention (raw events older than this are rolled up into daily aggregates)
+    AUDIT_RETENTION_DAYS: int = 90
+    AGENT_ACTION_RETENTION_DAYS: int = 30
+    RETENTION_INTERVAL_HOURS: float = 6.0
+
+    # Anomaly detection
+    ANOMALY_DECAY: float = 1.0  # 1.0 = plain Welford, < 1.0 fades old check-ins
+    ANOMALY_ALERT_THRESHOLD: float = 0.8
+
+    # Presence broadcasting over Socket.IO
+    LAB_ID: str = "main"
+    PRESENCE_DEBOUNCE_MS: int = 200  # quiet period that ends a burst of check-ins
+    PRESENCE_MAX_DELAY_MS: int = 750  # longest a change waits during a continuous burst
+
+    # Logging (JSON lines on stdout, written by a background thread)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" or "text"
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_RATE_LIMIT_BURST: int = 5  # same warning/error template at most this often...
+    LOG_RATE_LIMIT_WINDOW: float = 60.0  # ...per this many seconds
+
+    # Metrics (Prometheus text format at /metrics)
+    METRICS_ENABLED: bool = True
+
+    # Request profiling (admins send X-Profile: 1; results at /admin/profiles)
+    PROFILING_ENABLED: bool = True
+    PROFILING_SAMPLE_RATE: float = 0.0  # share of all requests profiled, 0 = on demand only
+    PROFILING_MAX_PROFILES: int = 50
+    PROFILING_N_PLUS_ONE_THRESHOLD: int = 10  # same collection+operation this many times in one request
+
+    # Slow query log (results at /admin/slow-queries)
+    SLOW_QUERY_LOG_ENABLED: bool = True
+    SLOW_QUERY_MS: float = 100.0
+    SLOW_QUERY_ROWS: int = 1000  # result sets this large are logged however fast they were
+
+    # Shared state across uvicorn workers ("local" = this process only; "ipc" =
+    # a broker process on this host owns the database, events and Socket.IO fan-out)
+    SHARED_STATE_BACKEND: str = "local"
+    SHARED_STATE_ADDRESS: str = ""  # Unix socket path or loopback host:port, default <tmpdir>/<DB_NAME>-shared-state.sock
+    SHARED_STATE_IDLE_EXIT: float = 60.0  # seconds the broker outlives its last worker (keeps data across restarts)
 
     class Config:
         env_file = ".env"
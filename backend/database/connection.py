@@ -1,22 +1,40 @@
 from mongomock_motor import AsyncMongoMockClient
 from backend.config import get_settings
+from backend.utils.logger import get_logger
+from backend.database.instrumentation import InstrumentedDatabase
+from backend.database.remote import RemoteDatabase
+from backend.database.slow_queries import SlowQueryLog
+from backend.utils.shared_state import shared_state
 
 settings = get_settings()
 
+logger = get_logger(__name__)
+
 class Database:
     client = None
     db = None
+    slow_queries = None
 
     def connect(self):
-        print("Using In-Memory Mock Database (MongoDB not found)")
-        self.client = AsyncMongoMockClient()
-        self.db = self.client[settings.DB_NAME]
-        print("Connected to Mock MongoDB")
+        if shared_state.enabled:
+            # One in-memory database for every worker, held by the shared-state broker
+            logger.info("Using shared In-Memory Mock Database at %s", shared_state.address)
+            self.client = None
+            self.db = RemoteDatabase(shared_state, settings.DB_NAME)
+        else:
+            logger.info("Using In-Memory Mock Database (MongoDB not found)")
+            self.client = AsyncMongoMockClient()
+            self.db = self.client[settings.DB_NAME]
+        if settings.SLOW_QUERY_LOG_ENABLED:
+            self.slow_queries = SlowQueryLog(settings.SLOW_QUERY_MS, settings.SLOW_QUERY_ROWS)
+        if settings.METRICS_ENABLED or settings.PROFILING_ENABLED or self.slow_queries is not None:
+            self.db = InstrumentedDatabase(self.db, observer=self.slow_queries)
+        logger.info("Connected to Mock MongoDB")
 
     def close(self):
         if self.client:
             self.client.close()
-            print("Disconnected from MongoDB")
+            logger.info("Disconnected from MongoDB")
 
 db = Database()
 
@@ -0,0 +1,183 @@
+"""
+Instrumented Database
+Thin proxies around the Motor database, collections and cursors that
+count and time every operation into the metrics registry and, when a
+query observer is attached, hand slow operations to it. Everything else
+(attributes, cursor chaining) passes straight through.
+"""
+import inspect
+import time
+from typing import Any, Dict, Optional
+
+from backend.utils.metrics import db_errors, db_latency, db_operations
+from backend.utils.profiling import record_db_call
+
+def _record(collection: str, op: str, started: float, failed: bool) -> float:
+    elapsed = time.perf_counter() - started
+    db_operations.inc(collection, op)
+    record_db_call(collection, op)
+    db_latency.observe(elapsed, collection, op)
+    if failed:
+        db_errors.inc(collection, op)
+    return elapsed
+
+def _result_size(result: Any) -> Optional[int]:
+    """Documents returned (lists, single documents) or touched (write results)"""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        return 1
+    if result is None:
+        return 0
+    for attribute in ("modified_count", "deleted_count"):
+        value = getattr(result, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+def _is_cursor(value: Any) -> bool:
+    return hasattr(value, "to_list") and hasattr(value, "__aiter__")
+
+def _query_of(args: tuple, kwargs: dict) -> Dict[str, Any]:
+    query_filter = args[0] if args else kwargs.get("filter")
+    return {"filter": query_filter if isinstance(query_filter, dict) else None, "sort": kwargs.get("sort")}
+
+class InstrumentedCursor:
+    """
+    Cursor proxy: chained calls (sort, limit, skip, ...) return the proxy,
+    and the round trip is timed when the cursor is consumed
+    """
+
+    def __init__(self, cursor, collection: "InstrumentedCollection", op: str, query: Dict[str, Any]):
+        self._cursor = cursor
+        self._owner = collection
+        self._op = op
+        self._query = query
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            if name == "sort" and args:
+                self._query["sort"] = [(args[0], args[1] if len(args) > 1 else 1)] if isinstance(args[0], str) else list(args[0])
+            elif name == "limit" and args:
+                self._query["limit"] = args[0]
+            result = attr(*args, **kwargs)
+            if result is self._cursor:
+                return self
+            return result
+        return call
+
+    async def to_list(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            documents = await self._cursor.to_list(*args, **kwargs)
+        except BaseException:
+            _record(self._owner._name, self._op, started, True)
+            raise
+        self._owner._finish(self._op, started, self._query, len(documents))
+        return documents
+
+    async def __aiter__(self):
+        started = time.perf_counter()
+        failed = False
+        rows = 0
+        try:
+            async for document in self._cursor:
+                rows += 1
+                yield document
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if failed:
+                _record(self._owner._name, self._op, started, True)
+            else:
+                self._owner._finish(self._op, started, self._query, rows)
+
+class InstrumentedCollection:
+    """Collection proxy timing coroutine methods and wrapping returned cursors"""
+
+    def __init__(self, collection, observer=None):
+        self._collection = collection
+        self._name = collection.name
+        self._observer = observer
+
+    def _finish(self, op: str, started: float, query: Dict[str, Any], rows: Optional[int]):
+        elapsed_ms = _record(self._name, op, started, False) * 1000
+        if self._observer is not None and self._observer.is_slow(elapsed_ms, rows):
+            self._observer.observe(self._collection, op, query, elapsed_ms, rows)
+
+    async def _timed(self, op: str, awaitable, query: Dict[str, Any]):
+        started = time.perf_counter()
+        try:
+            result = await awaitable
+        except BaseException:
+            _record(self._name, op, started, True)
+            raise
+        self._finish(op, started, query, _result_size(result))
+        return result
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._collection, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if inspect.isawaitable(result):
+                return self._timed(name, result, _query_of(args, kwargs))
+            if _is_cursor(result):
+                return InstrumentedCursor(result, self, name, _query_of(args, kwargs))
+            return result
+        return call
+
+    @property
+    def unwrapped(self):
+        return self._collection
+
+class InstrumentedDatabase:
+    """Database proxy handing out instrumented collections"""
+
+    def __init__(self, database, observer=None):
+        self._database = database
+        self._observer = observer
+        self._collections = {}
+
+    def _collection(self, name: str) -> InstrumentedCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = InstrumentedCollection(self._database[name], self._observer)
+        return collection
+
+    def __getitem__(self, name: str) -> InstrumentedCollection:
+        return self._collection(name)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            return getattr(self._database, name)
+        attr = getattr(self._database, name)
+        if not callable(attr):
+            # Motor resolves unknown attributes to collections (db.users)
+            return self._collection(name) if hasattr(attr, "find") else attr
+
+        async def timed(awaitable):
+            started = time.perf_counter()
+            try:
+                value = await awaitable
+            except BaseException:
+                _record("_database", name, started, True)
+                raise
+            _record("_database", name, started, False)
+            return value
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return timed(result) if inspect.isawaitable(result) else result
+        return call
+
+    @property
+    def unwrapped(self):
+        return self._database
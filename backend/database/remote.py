@@ -0,0 +1,113 @@
+"""
+Remote Database
+Motor-shaped proxies over the shared-state broker, so the routes keep
+using `db.users.find(...).sort(...).to_list(...)` while the data lives in
+the broker process shared by all workers. Cursors fetch in batches;
+writes and single-document reads are one round trip each.
+"""
+from typing import Any, List, Optional, Tuple
+
+from backend.utils.broker import DEFAULT_BATCH
+
+# Collection methods that return a cursor instead of a coroutine
+CURSOR_METHODS = {"find", "aggregate"}
+
+class RemoteCursor:
+    """Lazy find/aggregate: chained calls are recorded and replayed in the broker"""
+
+    def __init__(self, collection: "RemoteCollection", method: str, args: tuple, kwargs: dict):
+        self._collection = collection
+        self._method = method
+        self._args = args
+        self._kwargs = kwargs
+        self._chain: List[Tuple[str, tuple, dict]] = []
+        self._batch_size = DEFAULT_BATCH
+
+    def batch_size(self, size: int) -> "RemoteCursor":
+        self._batch_size = max(int(size), 1)
+        return self
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def chained(*args, **kwargs):
+            self._chain.append((name, args, kwargs))
+            return self
+        return chained
+
+    async def _open(self, size: int):
+        return await self._collection._state.request(
+            "cursor", self._collection.name, self._method, self._args, self._kwargs, self._chain, size,
+        )
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        size = length if length else self._batch_size
+        documents, cursor_id = await self._open(size)
+        state = self._collection._state
+        while cursor_id and (not length or len(documents) < length):
+            batch, cursor_id = await state.request("getmore", cursor_id, self._batch_size)
+            documents.extend(batch)
+        if cursor_id:
+            await state.request("killcursor", cursor_id)
+        return documents[:length] if length else documents
+
+    async def __aiter__(self):
+        state = self._collection._state
+        batch, cursor_id = await self._open(self._batch_size)
+        try:
+            while True:
+                for document in batch:
+                    yield document
+                if not cursor_id:
+                    return
+                batch, cursor_id = await state.request("getmore", cursor_id, self._batch_size)
+        finally:
+            if cursor_id:
+                await state.request("killcursor", cursor_id)
+
+    async def explain(self):
+        return await self._collection._state.request(
+            "explain", self._collection.name, self._method, self._args, self._kwargs, self._chain,
+        )
+
+class RemoteCollection:
+    def __init__(self, state, name: str):
+        self._state = state
+        self.name = name
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in CURSOR_METHODS:
+            return lambda *args, **kwargs: RemoteCursor(self, name, args, kwargs)
+
+        async def call(*args, **kwargs):
+            return await self._state.request("collection", self.name, name, args, kwargs)
+        return call
+
+class RemoteDatabase:
+    def __init__(self, state, name: str):
+        self._state = state
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> RemoteCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = RemoteCollection(self._state, name)
+        return collection
+
+    def get_collection(self, name: str) -> RemoteCollection:
+        return self[name]
+
+    async def list_collection_names(self, *args, **kwargs) -> List[str]:
+        return await self._state.request("database", "list_collection_names", args, kwargs)
+
+    async def drop_collection(self, name: str):
+        return await self._state.request("database", "drop_collection", (name,), {})
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
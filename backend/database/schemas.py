@@ -37,3 +37,11 @@ class Attendance(BaseModel):
 
     class Config:
         orm_mode = True
+
+class WorkLogCreate(BaseModel):
+    raw_input: str
+    date: Optional[str] = None  # ISO date, defaults to today (Nepal time)
+    tags: List[str] = []
+
+class WorkLogBatch(BaseModel):
+    logs: List[WorkLogCreate]
@@ -0,0 +1,139 @@
+"""
+Slow Query Log
+Query observer for the instrumented database: operations slower than
+SLOW_QUERY_MS (or returning more than SLOW_QUERY_ROWS documents) are
+recorded with their filter, sort and result size, grouped by query shape,
+and get an explain() plan captured once per shape when the backend
+supports it.
+"""
+import asyncio
+import json
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Set
+
+import pytz
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+# Operations whose filter can be replayed through find().explain()
+EXPLAINABLE_OPS = {"find", "find_one", "count_documents", "update_one", "update_many",
+                   "delete_one", "delete_many", "replace_one", "find_one_and_update"}
+
+def query_shape(value: Any) -> Any:
+    """
+    Filter/sort with literal values replaced by "?", keeping field names and operators
+
+    {"user_id": "42", "date": {"$gte": "2024-01-01"}} -> {"date": {"$gte": "?"}, "user_id": "?"}
+    """
+    if isinstance(value, dict):
+        return {key: query_shape(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        shapes = [query_shape(v) for v in value]
+        # $in: [1, 2, 3] and $in: [1] are the same shape
+        return [shapes[0]] if shapes and all(s == "?" for s in shapes) else shapes
+    return "?"
+
+def _jsonable(value: Any) -> Any:
+    return json.loads(json.dumps(value, default=str))
+
+class SlowQueryLog:
+    """Recent slow operations plus per-shape aggregates"""
+
+    def __init__(self, threshold_ms: float, row_threshold: int, max_recent: int = 200, max_shapes: int = 500):
+        self.threshold_ms = threshold_ms
+        self.row_threshold = row_threshold
+        self.max_shapes = max_shapes
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=max_recent)
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+        self._explain_tasks: Set[asyncio.Task] = set()
+        self.observed = 0
+
+    def is_slow(self, duration_ms: float, rows: Optional[int]) -> bool:
+        return duration_ms >= self.threshold_ms or (rows is not None and rows >= self.row_threshold)
+
+    def observe(self, collection, op: str, query: Dict[str, Any], duration_ms: float, rows: Optional[int]):
+        """
+        Record one slow operation
+
+        `collection` is the raw (unwrapped) collection so the explain()
+        replay is not itself instrumented.
+        """
+        self.observed += 1
+        name = collection.name
+        shape = {"filter": query_shape(query.get("filter") or {}), "sort": _jsonable(query.get("sort") or [])}
+        key = json.dumps([name, op, shape], sort_keys=True)
+
+        self._recent.appendleft({
+            "collection": name,
+            "op": op,
+            "filter": _jsonable(query.get("filter")),
+            "sort": _jsonable(query.get("sort")),
+            "limit": query.get("limit"),
+            "rows": rows,
+            "duration_ms": round(duration_ms, 2),
+            "at": datetime.now(NEPAL_TZ).isoformat(),
+        })
+
+        entry = self._shapes.get(key)
+        if entry is None:
+            if len(self._shapes) >= self.max_shapes:
+                return
+            entry = self._shapes[key] = {
+                "collection": name, "op": op, "shape": shape,
+                "count": 0, "total_ms": 0.0, "max_ms": 0.0, "max_rows": 0,
+                "explain": None,
+            }
+            if op in EXPLAINABLE_OPS:
+                self._schedule_explain(entry, collection, query)
+        entry["count"] += 1
+        entry["total_ms"] += duration_ms
+        entry["max_ms"] = max(entry["max_ms"], duration_ms)
+        entry["max_rows"] = max(entry["max_rows"], rows or 0)
+
+    def _schedule_explain(self, entry: Dict[str, Any], collection, query: Dict[str, Any]):
+        try:
+            task = asyncio.get_running_loop().create_task(self._explain(entry, collection, query))
+        except RuntimeError:
+            return
+        self._explain_tasks.add(task)
+        task.add_done_callback(self._explain_tasks.discard)
+
+    async def _explain(self, entry: Dict[str, Any], collection, query: Dict[str, Any]):
+        """Replay the filter as find().explain(); in-memory backends don't support it"""
+        try:
+            cursor = collection.find(query.get("filter") or {})
+            if query.get("sort"):
+                cursor = cursor.sort(query["sort"])
+            plan = await cursor.explain()
+            entry["explain"] = _jsonable(plan.get("queryPlanner", plan))
+        except Exception as e:
+            entry["explain"] = {"unsupported": f"{type(e).__name__}: {e}"}
+
+    def top(self, limit: int = 20, by: str = "total_ms") -> List[Dict[str, Any]]:
+        rows = []
+        for entry in self._shapes.values():
+            rows.append({
+                **entry,
+                "total_ms": round(entry["total_ms"], 2),
+                "max_ms": round(entry["max_ms"], 2),
+                "avg_ms": round(entry["total_ms"] / entry["count"], 2),
+            })
+        rows.sort(key=lambda r: r.get(by, 0), reverse=True)
+        return rows[:limit]
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return list(self._recent)[:limit]
+
+    def reset(self):
+        self._recent.clear()
+        self._shapes.clear()
+        self.observed = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "row_threshold": self.row_threshold,
+            "observed": self.observed,
+            "shapes": len(self._shapes),
+        }
@@ -1,7 +1,14 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from backend.config import get_settings
 from backend.database.connection import db
+from backend.utils.log_writer import log_writer
+from backend.utils.logger import RequestIdMiddleware, setup_logging, flush_logging
+from backend.utils.metrics import MetricsMiddleware, render_metrics
+from backend.utils.profiling import ProfilingMiddleware
+from backend.utils.shared_state import shared_state
 import socketio
 
 settings = get_settings()
@@ -23,8 +30,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Socket.IO
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+# Per-route latency, status and in-flight metrics
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# On-demand cProfile runs and per-request DB call counts (N+1 detection)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Request ids for log correlation (outermost, so every layer below sees it)
+app.add_middleware(RequestIdMiddleware)
+
+# Socket.IO (with several workers, emits and room changes are relayed through
+# the shared-state broker; clients should connect with the websocket transport
+# since long-polling needs sticky sessions)
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*',
+                           client_manager=shared_state.socketio_manager())
+
+# Live presence: snapshot on connect, debounced deltas per lab/role room
+from backend.modules.presence.service import presence_hub
+presence_hub.attach(sio)
 socket_app = socketio.ASGIApp(sio, app)
 
 # Routers
@@ -37,6 +62,7 @@ from backend.modules.ai.agent_routes import router as agent_router
 from backend.modules.analytics.routes import router as analytics_router
 from backend.modules.admin.routes import router as admin_router
 from backend.modules.advanced.routes import router as advanced_router
+from backend.modules.worklogs.routes import router as worklogs_router
 
 app.include_router(auth_router, prefix=f"{settings.API_PREFIX}/auth")
 app.include_router(face_router, prefix=f"{settings.API_PREFIX}/face")
@@ -47,21 +73,50 @@ app.include_router(agent_router, prefix=f"{settings.API_PREFIX}/agents")
 app.include_router(analytics_router, prefix=f"{settings.API_PREFIX}/analytics")
 app.include_router(admin_router, prefix=f"{settings.API_PREFIX}/admin")
 app.include_router(advanced_router, prefix=f"{settings.API_PREFIX}/advanced")
+app.include_router(worklogs_router, prefix=f"{settings.API_PREFIX}/worklogs")
+
+# Long-running tasks started with the app and cancelled on shutdown
+background_tasks = []
 
 @app.on_event("startup")
 async def startup_db_client():
+    setup_logging()
+    await shared_state.start()
     db.connect()
     from backend.seed_db import seed_admin
     await seed_admin()
+    log_writer.start()
+    from backend.modules.ai.forecast import ensure_forecast_model
+    background_tasks.append(asyncio.create_task(ensure_forecast_model()))
+    from backend.utils.retention import retention_loop
+    background_tasks.append(asyncio.create_task(retention_loop()))
+    if settings.AGENT_BATCH_ENABLED:
+        from backend.modules.ai.batch import agent_batch_loop
+        from backend.modules.ai.agent_routes import llm_client
+        background_tasks.append(asyncio.create_task(agent_batch_loop(llm_client)))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
+    from backend.modules.ai.llm import llm_service
+    from backend.modules.ai.agent_routes import llm_client
+    await llm_service.close()
+    await llm_client.close()
+    await log_writer.drain()
     db.close()
+    await shared_state.stop()
+    flush_logging()
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to Cortex AI Attendance System"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Mount Socket.IO app (Note: Uvicorn should run 'socket_app' if using pure ASGI, 
 # but for simplicity in development we often just run 'app' and mount socketio differently 
 # or use a specific runner. Here we return app, but in production setup might need adjustment)
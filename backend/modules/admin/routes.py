@@ -1,6 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends
-from backend.database.connection import get_database
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from backend.database.connection import get_database, db as database
 from backend.utils.security import get_current_user
+from backend.utils import events
+from backend.utils.cache import cached_json, response_cache
+from backend.utils.log_writer import log_writer
+from backend.utils.logger import logging_stats
+from backend.utils.shared_state import shared_state
+from backend.modules.presence.service import presence_hub
+from backend.utils.retention import run_retention, get_retention_status
+from backend.utils.profiling import profile_store, format_stats, dump_stats
 from datetime import datetime
 import pytz
 
@@ -9,31 +17,142 @@ router = APIRouter(tags=["Admin"])
 NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
 
 @router.get("/stats")
-async def get_admin_stats(current_user = Depends(get_current_user)):
+async def get_admin_stats(request: Request, current_user = Depends(get_current_user)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    db = await get_database()
+    async def build_stats():
+        db = await get_database()
+        
+        # Count users by role
+        total_admins = await db.users.count_documents({"role": "admin"})
+        total_members = await db.users.count_documents({"role": "member"})
+        
+        # Today's attendance
+        today_start = datetime.now(NEPAL_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+        present_today = await db.attendance.count_documents({
+            "timestamp": {"$gte": today_start},
+            "status": "present"
+        })
+        
+        return {
+            "total_admins": total_admins,
+            "total_members": total_members,
+            "present_today": present_today,
+            "max_admins": 2,
+            "max_members": 10
+        }
+    
+    today = datetime.now(NEPAL_TZ).date()
+    return await cached_json(request, build_stats, tags=(events.USERS, events.ATTENDANCE), key_extra=(today,))
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_user = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return response_cache.stats()
+
+@router.get("/log-writer/stats")
+async def get_log_writer_stats(current_user = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Count users by role
-    total_admins = await db.users.count_documents({"role": "admin"})
-    total_members = await db.users.count_documents({"role": "member"})
+    return log_writer.stats()
+
+@router.get("/logging/stats")
+async def get_logging_stats(current_user = Depends(get_current_user)):
+    """Application log queue depth, dropped and rate-limited records"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Today's attendance
-    today_start = datetime.now(NEPAL_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
-    present_today = await db.attendance.count_documents({
-        "timestamp": {"$gte": today_start},
-        "status": "present"
-    })
+    return logging_stats()
+
+@router.get("/retention")
+async def get_retention(current_user = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return get_retention_status()
+
+@router.post("/retention/run")
+async def trigger_retention(current_user = Depends(get_current_user)):
+    """Compact old audit logs and agent actions into daily rollups now"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        return await run_retention()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/profiles")
+async def list_profiles(limit: int = 50, flagged: bool = False, current_user = Depends(get_current_user)):
+    """Recent request profiles; flagged=true keeps only suspected N+1 requests"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {"profiles": profile_store.list(limit, flagged_only=flagged), "stats": profile_store.stats()}
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: int, format: str = "json", current_user = Depends(get_current_user)):
+    """One profile as JSON, a pstats text report (format=text) or a raw .prof file (format=pstats)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "json":
+        return profile
+    
+    stats = profile_store.get_stats(profile_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Request was flagged but not profiled")
+    if format == "text":
+        return Response(content=format_stats(stats), media_type="text/plain")
+    if format == "pstats":
+        return Response(
+            content=dump_stats(stats),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.prof"'}
+        )
+    raise HTTPException(status_code=400, detail="format must be json, text or pstats")
+
+@router.delete("/profiles")
+async def clear_profiles(current_user = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    profile_store.clear()
+    return {"message": "Profiles cleared"}
+
+@router.get("/slow-queries")
+async def get_slow_queries(limit: int = 20, by: str = "total_ms", current_user = Depends(get_current_user)):
+    """Top slow query shapes (by total_ms, max_ms, count or max_rows) and the latest slow calls"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if database.slow_queries is None:
+        raise HTTPException(status_code=404, detail="Slow query log is disabled")
+    if by not in ("total_ms", "max_ms", "count", "max_rows"):
+        raise HTTPException(status_code=400, detail="by must be total_ms, max_ms, count or max_rows")
     
     return {
-        "total_admins": total_admins,
-        "total_members": total_members,
-        "present_today": present_today,
-        "max_admins": 2,
-        "max_members": 10
+        "stats": database.slow_queries.stats(),
+        "top": database.slow_queries.top(limit, by=by),
+        "recent": database.slow_queries.recent(limit)
     }
 
+@router.delete("/slow-queries")
+async def reset_slow_queries(current_user = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if database.slow_queries is not None:
+        database.slow_queries.reset()
+    return {"message": "Slow query log cleared"}
+
 @router.get("/members")
 async def get_all_members(current_user = Depends(get_current_user)):
     if current_user.get("role") != "admin":
@@ -49,6 +168,25 @@ async def get_all_members(current_user = Depends(get_current_user)):
     
     return members
 
+@router.get("/presence")
+async def get_presence(current_user = Depends(get_current_user)):
+    """Current presence snapshot (same payload as the Socket.IO presence:snapshot event)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {**await presence_hub.snapshot("admin"), "stats": presence_hub.stats()}
+
+@router.get("/shared-state")
+async def get_shared_state(current_user = Depends(get_current_user)):
+    """Which shared-state backend this worker uses and, for the broker, its workers, channels and leases"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        return await shared_state.stats()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Shared-state broker unavailable: {e}")
+
 @router.get("/attendance/today")
 async def get_today_attendance(current_user = Depends(get_current_user)):
     if current_user.get("role") != "admin":
@@ -79,6 +217,7 @@ async def approve_member(user_id: str, current_user = Depends(get_current_user))
         {"_id": user_id},
         {"$set": {"is_active": True}}
     )
+    events.publish(events.USERS, user_id=user_id)
     
     return {"message": "Member approved"}
 
@@ -89,5 +228,6 @@ async def remove_member(user_id: str, current_user = Depends(get_current_user)):
     
     db = await get_database()
     await db.users.delete_one({"_id": user_id})
+    events.publish(events.USERS, user_id=user_id)
     
     return {"message": "Member removed"}
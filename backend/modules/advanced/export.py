@@ -0,0 +1,288 @@
+"""
+Attendance report export
+Streams rows from a database cursor in fixed-size chunks into CSV, XLSX
+or PDF writers so memory stays flat no matter how long the date range is
+"""
+import asyncio
+import csv
+import io
+import os
+import uuid
+import zlib
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+
+import pytz
+from openpyxl import Workbook
+from reportlab.lib.pagesizes import A4, landscape
+
+from backend.config import get_settings
+from backend.database.connection import get_database
+from backend.utils.logger import get_logger
+
+settings = get_settings()
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+logger = get_logger(__name__)
+
+EXPORT_DIR = "exports"
+CHUNK_SIZE = 500
+
+EXPORT_COLUMNS = ["date", "user_id", "user_name", "status", "check_in", "check_out", "source"]
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "pdf": ("application/pdf", "pdf"),
+}
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+async def iter_attendance_rows(start: Optional[str] = None, end: Optional[str] = None,
+                               chunk_size: int = CHUNK_SIZE) -> AsyncIterator[List[Tuple[str, ...]]]:
+    """Yield attendance rows (in EXPORT_COLUMNS order) in chunks straight off the cursor"""
+    db = await get_database()
+    query: Dict[str, Any] = {}
+    if start or end:
+        # Face/kiosk records have no `date`, only a timestamp
+        by_date: Dict[str, Any] = {}
+        by_timestamp: Dict[str, Any] = {}
+        if start:
+            by_date["$gte"] = start
+            by_timestamp["$gte"] = NEPAL_TZ.localize(datetime.combine(date.fromisoformat(start), datetime.min.time()))
+        if end:
+            by_date["$lte"] = end
+            by_timestamp["$lt"] = NEPAL_TZ.localize(datetime.combine(date.fromisoformat(end) + timedelta(days=1), datetime.min.time()))
+        query["$or"] = [{"date": by_date}, {"date": None, "timestamp": by_timestamp}]
+
+    projection = {column: 1 for column in EXPORT_COLUMNS}
+    projection["_id"] = 0
+    projection["timestamp"] = 1
+    cursor = db.attendance.find(query, projection).sort("timestamp", 1).batch_size(chunk_size)
+
+    chunk = []
+    async for record in cursor:
+        if record.get("date") is None and isinstance(record.get("timestamp"), datetime):
+            record["date"] = record["timestamp"].date().isoformat()
+        chunk.append(tuple(_cell(record.get(column)) for column in EXPORT_COLUMNS))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+async def stream_csv(rows: AsyncIterator[List[Tuple[str, ...]]]) -> AsyncIterator[bytes]:
+    """Encode row chunks as CSV, one bytes block per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for chunk in rows:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+async def write_xlsx(rows: AsyncIterator[List[Tuple[str, ...]]], path: str):
+    """Write rows with openpyxl's write-only workbook (rows are flushed, not kept)"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Attendance")
+    sheet.append(EXPORT_COLUMNS)
+    async for chunk in rows:
+        for row in chunk:
+            sheet.append(row)
+    await asyncio.to_thread(workbook.save, path)
+
+class PdfTableWriter:
+    """
+    Paginated table written straight to disk, one page at a time
+
+    reportlab's canvas keeps every finished page until save(); this emits
+    each page's objects as soon as it is full and only remembers their
+    byte offsets, so a long export never holds more than one page.
+    """
+
+    MARGIN = 36
+    LINE_HEIGHT = 14
+    # Objects written last, once every page is known
+    CATALOG, PAGES, FONT, FONT_BOLD = 1, 2, 3, 4
+
+    def __init__(self, path: str, title: str, columns: List[str]):
+        self.page_width, self.page_height = landscape(A4)
+        self.title = title
+        self.columns = columns
+        self.column_width = (self.page_width - 2 * self.MARGIN) / len(columns)
+        self.file = open(path, "wb")
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.offsets: Dict[int, int] = {}
+        self.page_ids: List[int] = []
+        self.next_id = self.FONT_BOLD + 1
+        self._start_page()
+
+    @staticmethod
+    def _text(value: str) -> str:
+        value = value.encode("latin-1", "replace").decode("latin-1")
+        return "(" + value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+    def _object(self, object_id: int, body: bytes):
+        self.offsets[object_id] = self.file.tell()
+        self.file.write(b"%d 0 obj\n" % object_id + body + b"\nendobj\n")
+
+    def _draw(self, font: str, size: int, x: float, y: float, value: str):
+        self.ops.append(f"BT /{font} {size} Tf {x:.2f} {y:.2f} Td {self._text(value)} Tj ET")
+
+    def _start_page(self):
+        self.ops: List[str] = []
+        top = self.page_height - self.MARGIN
+        self._draw("F2", 12, self.MARGIN, top, self.title)
+        self.y = top - 2 * self.LINE_HEIGHT
+        for i, column in enumerate(self.columns):
+            self._draw("F2", 8, self.MARGIN + i * self.column_width, self.y, column)
+        self.y -= self.LINE_HEIGHT
+
+    def _finish_page(self):
+        stream = zlib.compress("\n".join(self.ops).encode("latin-1"))
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self._object(content_id, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        self._object(page_id, (
+            f"<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {self.page_width:.2f} {self.page_height:.2f}] "
+            f"/Resources << /Font << /F1 {self.FONT} 0 R /F2 {self.FONT_BOLD} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode())
+        self.page_ids.append(page_id)
+
+    def add_rows(self, rows: List[Tuple[str, ...]]):
+        for row in rows:
+            if self.y < self.MARGIN:
+                self._finish_page()
+                self._start_page()
+            for i, value in enumerate(row):
+                self._draw("F1", 8, self.MARGIN + i * self.column_width, self.y, value[:28])
+            self.y -= self.LINE_HEIGHT
+
+    def close(self):
+        self._finish_page()
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._object(self.CATALOG, f"<< /Type /Catalog /Pages {self.PAGES} 0 R >>".encode())
+        self._object(self.PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        self._object(self.FONT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        self._object(self.FONT_BOLD, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        xref = self.file.tell()
+        size = self.next_id
+        self.file.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for object_id in range(1, size):
+            self.file.write(b"%010d 00000 n \n" % self.offsets[object_id])
+        self.file.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, self.CATALOG, xref))
+        self.file.close()
+
+async def write_pdf(rows: AsyncIterator[List[Tuple[str, ...]]], path: str, title: str = "Attendance Report"):
+    """Write rows as a paginated PDF table; drawing runs in a worker thread, chunk by chunk"""
+    writer = await asyncio.to_thread(PdfTableWriter, path, title, EXPORT_COLUMNS)
+    try:
+        async for chunk in rows:
+            await asyncio.to_thread(writer.add_rows, chunk)
+        await asyncio.to_thread(writer.close)
+    finally:
+        writer.file.close()
+
+# ---------------------------------------------------------------------------
+# Background export jobs
+# ---------------------------------------------------------------------------
+
+# Job state lives in the database so any worker can answer status and
+# download requests; the files sit in EXPORT_DIR on the shared host disk.
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error("Could not remove export file %s: %s", path, e)
+
+async def sweep_export_jobs() -> int:
+    """Forget finished jobs past their expiry and delete their files; returns how many went"""
+    db = await get_database()
+    now = datetime.now(NEPAL_TZ)
+    expired = await db.export_jobs.find(
+        {"expires_at": {"$ne": None, "$lte": now.isoformat()}}, {"path": 1}
+    ).to_list(length=None)
+    for job in expired:
+        await db.export_jobs.delete_one({"_id": job["_id"]})
+        _remove_file(job["path"])
+
+    # Files whose job was lost are aged out by modification time
+    if os.path.isdir(EXPORT_DIR):
+        tracked = {job["path"] for job in await db.export_jobs.find({}, {"path": 1}).to_list(length=None)}
+        cutoff = now.timestamp() - settings.EXPORT_JOB_TTL_HOURS * 3600
+        for name in os.listdir(EXPORT_DIR):
+            path = os.path.join(EXPORT_DIR, name)
+            if path not in tracked and os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                _remove_file(path)
+    return len(expired)
+
+async def get_export_job(job_id: str) -> Optional[Dict[str, Any]]:
+    db = await get_database()
+    return await db.export_jobs.find_one({"_id": job_id}, {"_id": 0})
+
+async def _update_export_job(job_id: str, **fields):
+    db = await get_database()
+    await db.export_jobs.update_one({"_id": job_id}, {"$set": fields})
+
+async def create_export_job(fmt: str, start: Optional[str], end: Optional[str], requested_by: str) -> Dict[str, Any]:
+    await sweep_export_jobs()
+    job_id = uuid.uuid4().hex
+    _, extension = EXPORT_FORMATS[fmt]
+    job = {
+        "job_id": job_id,
+        "format": fmt,
+        "start": start,
+        "end": end,
+        "status": "pending",
+        "requested_by": requested_by,
+        "path": os.path.join(EXPORT_DIR, f"attendance_{job_id}.{extension}"),
+        "created_at": datetime.now(NEPAL_TZ).isoformat(),
+        "finished_at": None,
+        "expires_at": None,
+        "error": None,
+    }
+    db = await get_database()
+    await db.export_jobs.insert_one(dict(job, _id=job_id))
+    return job
+
+async def write_export(fmt: str, start: Optional[str], end: Optional[str], path: str):
+    """Write a complete export file of the given format"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    rows = iter_attendance_rows(start, end)
+    if fmt == "csv":
+        with open(path, "wb") as out:
+            async for block in stream_csv(rows):
+                out.write(block)
+    elif fmt == "xlsx":
+        await write_xlsx(rows, path)
+    else:
+        await write_pdf(rows, path)
+
+async def run_export_job(job_id: str):
+    """Background task body: write the file and record the outcome on the job"""
+    job = await get_export_job(job_id)
+    await _update_export_job(job_id, status="running")
+    outcome = {"status": "done"}
+    try:
+        await write_export(job["format"], job["start"], job["end"], job["path"])
+    except Exception as e:
+        outcome = {"status": "failed", "error": str(e)}
+        logger.error("Export job %s failed: %s", job_id, e)
+    finally:
+        finished = datetime.now(NEPAL_TZ)
+        await _update_export_job(
+            job_id, **outcome, finished_at=finished.isoformat(),
+            expires_at=(finished + timedelta(hours=settings.EXPORT_JOB_TTL_HOURS)).isoformat(),
+        )
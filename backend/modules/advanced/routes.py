@@ -1,14 +1,27 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from backend.config import get_settings
 from backend.database.connection import get_database
 from backend.utils.security import get_current_user
-from datetime import datetime, timedelta
+from backend.utils import events
+from backend.utils.cache import cached_json
+from backend.utils.timezone import get_lab_closed_weekdays
+from backend.modules.analytics.records import PRESENT_STATUSES
+from backend.modules.analytics.streaks import get_user_streaks
+from backend.modules.advanced import export
+from datetime import datetime, timedelta, date
+import os
+import uuid
 import pytz
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 router = APIRouter(tags=["Advanced Features"])
 
 NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
 
+EXPORT_URL = f"{get_settings().API_PREFIX}/advanced/reports/export"
+
 def get_nepal_time():
     """Get current time in Nepal timezone"""
     return datetime.now(NEPAL_TZ)
@@ -31,19 +44,26 @@ async def get_lab_status():
     }
 
 @router.get("/lab/schedule")
-async def get_lab_schedule():
+async def get_lab_schedule(request: Request):
     """Get weekly lab schedule"""
-    days = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-    schedule = {}
-    
-    for day in days:
-        schedule[day] = {
-            "status": "OPEN",
-            "hours": "12:00 PM - 5:00 PM",
-            "timezone": "Asia/Kathmandu (GMT+5:45)"
-        }
+    async def build_schedule():
+        days = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+        schedule = {}
+        
+        closed_days = get_lab_closed_weekdays()
+        
+        for day in days:
+            is_closed = day in closed_days
+            schedule[day] = {
+                "status": "CLOSED" if is_closed else "OPEN",
+                "hours": None if is_closed else "12:00 PM - 5:00 PM",
+                "timezone": "Asia/Kathmandu (GMT+5:45)"
+            }
+        
+        return schedule
     
-    return schedule
+    # Only changes with configuration, so a long TTL is safe
+    return await cached_json(request, build_schedule, ttl=3600)
 
 @router.post("/attendance/mark-absent")
 async def mark_absent_for_no_shows(current_user = Depends(get_current_user)):
@@ -79,6 +99,7 @@ async def mark_absent_for_no_shows(current_user = Depends(get_current_user)):
                     "timestamp": get_nepal_time()
                 })
                 marked_absent.append(member.get("name", member["_id"]))
+                events.publish(events.ATTENDANCE, user_id=member["_id"], date=today)
         
         return {
             "message": f"Marked {len(marked_absent)} members absent",
@@ -96,10 +117,9 @@ async def get_member_detailed_stats(user_id: str, current_user = Depends(get_cur
     try:
         db = await get_database()
         
-        # Get all attendance records
-        records = await db.attendance.find({"user_id": user_id}).to_list(length=1000)
+        total = await db.attendance.count_documents({"user_id": user_id})
         
-        if not records:
+        if not total:
             return {
                 "total_days": 0,
                 "present_days": 0,
@@ -111,36 +131,24 @@ async def get_member_detailed_stats(user_id: str, current_user = Depends(get_cur
             }
         
         # Calculate stats
-        total = len(records)
-        present = len([r for r in records if r.get("status") == "Present"])
-        absent = len([r for r in records if r.get("status") == "Absent"])
+        present = await db.attendance.count_documents({"user_id": user_id, "status": {"$in": PRESENT_STATUSES}})
+        absent = await db.attendance.count_documents({"user_id": user_id, "status": "Absent"})
         percentage = (present / total * 100) if total > 0 else 0
         
-        # Calculate streak
-        sorted_records = sorted(records, key=lambda x: x.get("date", ""), reverse=True)
-        current_streak = 0
-        today = get_nepal_date()
-        
-        for record in sorted_records:
-            if record.get("status") == "Present":
-                record_date = record.get("date")
-                if isinstance(record_date, str):
-                    from datetime import date as dt_date
-                    record_date = dt_date.fromisoformat(record_date)
-                
-                if (today - record_date).days == current_streak:
-                    current_streak += 1
-                else:
-                    break
+        # Streaks come from the shared (cached, calendar-aware) streak engine
+        streaks = await get_user_streaks(user_id)
+        recent_records = await db.attendance.find(
+            {"user_id": user_id}, {"_id": 0}
+        ).sort("date", -1).limit(10).to_list(length=10)
         
         return {
             "total_days": total,
             "present_days": present,
             "absent_days": absent,
             "attendance_percentage": round(percentage, 2),
-            "current_streak": current_streak,
-            "longest_streak": current_streak,  # Simplified
-            "recent_records": sorted_records[:10]
+            "current_streak": streaks["current_streak"],
+            "longest_streak": streaks["longest_streak"],
+            "recent_records": recent_records
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -161,6 +169,7 @@ async def get_lab_resources(current_user = Depends(get_current_user)):
             {"name": "VR Headset", "status": "available", "current_user": None}
         ]
         await db.resources.insert_many(default_resources)
+        events.publish(events.RESOURCES)
     
     resources = await db.resources.find({}).to_list(length=100)
     return resources
@@ -185,6 +194,7 @@ async def checkout_resource(resource_id: str, current_user = Depends(get_current
             "checked_out_at": get_nepal_time()
         }}
     )
+    events.publish(events.RESOURCES, resource_id=resource_id)
     
     return {"message": "Resource checked out successfully"}
 
@@ -208,68 +218,154 @@ async def return_resource(resource_id: str, current_user = Depends(get_current_u
             "returned_at": get_nepal_time()
         }}
     )
+    events.publish(events.RESOURCES, resource_id=resource_id)
     
     return {"message": "Resource returned successfully"}
 
 @router.get("/reports/weekly")
-async def get_weekly_report(current_user = Depends(get_current_user)):
+async def get_weekly_report(request: Request, current_user = Depends(get_current_user)):
     """Get weekly attendance report"""
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    db = await get_database()
-    today = get_nepal_date()
-    week_start = (today - timedelta(days=today.weekday())).isoformat()
-    
-    records = await db.attendance.find({
-        "date": {"$gte": week_start}
-    }).to_list(length=1000)
-    
-    # Group by date
-    daily_stats = {}
-    for record in records:
-        date = record.get("date")
-        if date not in daily_stats:
-            daily_stats[date] = {"present": 0, "absent": 0, "total": 0}
+    async def build_report():
+        db = await get_database()
+        today = get_nepal_date()
+        week_start = (today - timedelta(days=today.weekday())).isoformat()
+    
+        records = await db.attendance.find({
+            "date": {"$gte": week_start}
+        }).to_list(length=1000)
+    
+        # Group by date
+        daily_stats = {}
+        for record in records:
+            date = record.get("date")
+            if date not in daily_stats:
+                daily_stats[date] = {"present": 0, "absent": 0, "total": 0}
         
-        daily_stats[date]["total"] += 1
-        if record.get("status") == "Present":
-            daily_stats[date]["present"] += 1
-        else:
-            daily_stats[date]["absent"] += 1
+            daily_stats[date]["total"] += 1
+            if record.get("status") in PRESENT_STATUSES:
+                daily_stats[date]["present"] += 1
+            else:
+                daily_stats[date]["absent"] += 1
     
-    return {
-        "week_start": week_start,
-        "daily_stats": daily_stats,
-        "total_records": len(records)
-    }
+        return {
+            "week_start": week_start,
+            "daily_stats": daily_stats,
+            "total_records": len(records)
+        }
+    
+    return await cached_json(request, build_report, tags=(events.ATTENDANCE,), key_extra=(get_nepal_date(),))
 
 @router.get("/reports/monthly")
-async def get_monthly_report(current_user = Depends(get_current_user)):
+async def get_monthly_report(request: Request, current_user = Depends(get_current_user)):
     """Get monthly attendance report"""
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    db = await get_database()
-    today = get_nepal_date()
-    month_start = today.replace(day=1).isoformat()
+    async def build_report():
+        db = await get_database()
+        today = get_nepal_date()
+        month_start = today.replace(day=1).isoformat()
     
-    records = await db.attendance.find({
-        "date": {"$gte": month_start}
-    }).to_list(length=10000)
+        records = await db.attendance.find({
+            "date": {"$gte": month_start}
+        }).to_list(length=10000)
     
-    # Calculate monthly stats
-    total_present = len([r for r in records if r.get("status") == "Present"])
-    total_absent = len([r for r in records if r.get("status") == "Absent"])
+        # Calculate monthly stats
+        total_present = len([r for r in records if r.get("status") in PRESENT_STATUSES])
+        total_absent = len([r for r in records if r.get("status") == "Absent"])
     
-    # Get unique members
-    unique_members = set(r.get("user_id") for r in records)
+        # Get unique members
+        unique_members = set(r.get("user_id") for r in records)
     
-    return {
-        "month_start": month_start,
-        "total_records": len(records),
-        "total_present": total_present,
-        "total_absent": total_absent,
-        "unique_members": len(unique_members),
-        "attendance_rate": round((total_present / len(records) * 100), 2) if records else 0
-    }
+        return {
+            "month_start": month_start,
+            "total_records": len(records),
+            "total_present": total_present,
+            "total_absent": total_absent,
+            "unique_members": len(unique_members),
+            "attendance_rate": round((total_present / len(records) * 100), 2) if records else 0
+        }
+    
+    return await cached_json(request, build_report, tags=(events.ATTENDANCE,), key_extra=(get_nepal_date(),))
+
+def _validate_export_range(start: Optional[str], end: Optional[str]):
+    for value in (start, end):
+        if value is None:
+            continue
+        try:
+            date.fromisoformat(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD")
+
+@router.get("/reports/export")
+async def export_report(
+    background_tasks: BackgroundTasks,
+    format: str = "csv",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    background: bool = False,
+    current_user = Depends(get_current_user)
+):
+    """Export attendance records as CSV, XLSX or PDF (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    fmt = format.lower()
+    if fmt not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Use one of: {', '.join(export.EXPORT_FORMATS)}")
+    _validate_export_range(start, end)
+    
+    # Long exports: hand back a job handle and write the file in the background
+    if background:
+        job = await export.create_export_job(fmt, start, end, current_user.get("_id"))
+        background_tasks.add_task(export.run_export_job, job["job_id"])
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "status_url": f"{EXPORT_URL}/{job['job_id']}",
+            "download_url": f"{EXPORT_URL}/{job['job_id']}/download"
+        }
+    
+    media_type, extension = export.EXPORT_FORMATS[fmt]
+    filename = f"attendance_{get_nepal_date().isoformat()}.{extension}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    
+    if fmt == "csv":
+        rows = export.iter_attendance_rows(start, end)
+        return StreamingResponse(export.stream_csv(rows), media_type=media_type, headers=headers)
+    
+    path = os.path.join(export.EXPORT_DIR, f"tmp_{uuid.uuid4().hex}.{extension}")
+    await export.write_export(fmt, start, end, path)
+    return FileResponse(path, media_type=media_type, filename=filename, background=BackgroundTask(os.remove, path))
+
+@router.get("/reports/export/{job_id}")
+async def get_export_job(job_id: str, current_user = Depends(get_current_user)):
+    """Get the status of a background export job (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    await export.sweep_export_jobs()
+    job = await export.get_export_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    
+    return {key: value for key, value in job.items() if key != "path"}
+
+@router.get("/reports/export/{job_id}/download")
+async def download_export(job_id: str, current_user = Depends(get_current_user)):
+    """Download the file produced by a finished export job (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    await export.sweep_export_jobs()
+    job = await export.get_export_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job['status']}")
+    
+    media_type, _ = export.EXPORT_FORMATS[job["format"]]
+    return FileResponse(job["path"], media_type=media_type, filename=os.path.basename(job["path"]))
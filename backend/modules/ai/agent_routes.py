@@ -1,104 +1,183 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from datetime import datetime, timedelta
+import pytz
 from backend.database.connection import get_database
 from backend.utils.security import get_current_user
-from backend.modules.ai.llm_client import LLMClient
-from backend.modules.ai.agents import (
-    AttendanceAgent, ProgressAgent, SecurityAgent, 
-    PredictionAgent, MessageAgent
-)
+from backend.modules.ai.llm_client import LLMClient, run_until_disconnected
+from backend.modules.ai.llm_cache import llm_cache
+from backend.modules.ai.forecast import train_forecast_model, get_model_info
+from backend.modules.ai.anomaly import get_anomaly_scores
+from backend.modules.ai.agents import MessageAgent, agent_flight
+from backend.modules.ai.batch import get_result, start_agent_batch, get_batch_status
 
 router = APIRouter(tags=["AI Agents"])
 
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
 # Initialize LLM client
 llm_client = LLMClient()
 
+async def agent_result(request: Request, job: str, current_user: dict, refresh: bool) -> dict:
+    """Stored batch result for the current user (recomputed with ?refresh=true), coalesced"""
+    return await run_until_disconnected(request, agent_flight.do(
+        (job, current_user.get("_id"), refresh),
+        lambda: get_result(job, current_user, llm_client, refresh=refresh)
+    ))
+
 @router.post("/agents/attendance/analyze")
-async def analyze_attendance_with_ai(current_user = Depends(get_current_user)):
+async def analyze_attendance_with_ai(request: Request, refresh: bool = False, current_user = Depends(get_current_user)):
     """Get AI-powered attendance insights"""
     try:
-        agent = AttendanceAgent("AttendanceAgent", llm_client)
-        insights = await agent.get_attendance_insights(
-            current_user.get("_id"),
-            current_user.get("name", f"User_{current_user.get('_id')}")
-        )
-        return {"insights": insights}
+        stored = await agent_result(request, "attendance_insights", current_user, refresh)
+        return {"insights": stored["result"], "generated_at": stored["generated_at"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/agents/attendance/detect-anomaly")
-async def detect_attendance_anomaly(current_user = Depends(get_current_user)):
+async def detect_attendance_anomaly(request: Request, refresh: bool = False, current_user = Depends(get_current_user)):
     """Detect anomalies in attendance pattern"""
     try:
-        agent = AttendanceAgent("AttendanceAgent", llm_client)
-        anomaly = await agent.detect_anomaly(
-            current_user.get("_id"),
-            current_user.get("name", f"User_{current_user.get('_id')}")
-        )
+        stored = await agent_result(request, "anomaly", current_user, refresh)
+        anomaly = stored["result"]
         return {
             "has_anomaly": anomaly is not None,
-            "anomaly": anomaly
+            "anomaly": anomaly,
+            "generated_at": stored["generated_at"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/agents/anomalies")
+async def get_lab_anomalies(current_user = Depends(get_current_user)):
+    """Anomaly scores for every member, computed in one batch (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        scores = await get_anomaly_scores()
+        flagged = sorted(scores.values(), key=lambda s: s["score"], reverse=True)
+        return {"anomalies": flagged}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/agents/learning/recommend")
-async def get_learning_recommendation(current_user = Depends(get_current_user)):
+async def get_learning_recommendation(request: Request, refresh: bool = False, current_user = Depends(get_current_user)):
     """Get AI-powered learning path recommendation"""
     try:
-        agent = ProgressAgent("ProgressAgent", llm_client)
-        recommendation = await agent.analyze_and_recommend(current_user.get("_id"))
-        return {"recommendation": recommendation}
+        stored = await agent_result(request, "learning", current_user, refresh)
+        return {"recommendation": stored["result"], "generated_at": stored["generated_at"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/agents/security/check")
-async def security_check(current_user = Depends(get_current_user)):
-    """Run AI security check on attendance pattern"""
+async def security_check(request: Request, refresh: bool = False, current_user = Depends(get_current_user)):
+    """Run security check on attendance pattern"""
     try:
-        agent = SecurityAgent("SecurityAgent", llm_client)
-        result = await agent.detect_suspicious_pattern(
-            current_user.get("_id"),
-            current_user.get("name", f"User_{current_user.get('_id')}")
-        )
+        stored = await agent_result(request, "security", current_user, refresh)
+        result = stored["result"]
         return {
-            "status": result,
-            "is_safe": "NORMAL" in result or "SAFE" in result
+            "status": result["status"],
+            "is_safe": result["status"] == "NORMAL",
+            "score": result["score"],
+            "reasons": result["reasons"],
+            "explanation": result.get("explanation"),
+            "generated_at": stored["generated_at"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/agents/prediction/forecast")
-async def forecast_attendance(current_user = Depends(get_current_user)):
-    """Get AI-powered attendance forecast"""
+async def forecast_attendance(request: Request, narrative: bool = False, refresh: bool = False, current_user = Depends(get_current_user)):
+    """Get attendance forecast with a 95% confidence interval"""
     try:
-        agent = PredictionAgent("PredictionAgent", llm_client)
-        prediction = await agent.predict_attendance_rate(current_user.get("_id"))
-        return {
-            "predicted_rate": round(prediction, 2),
-            "confidence": "high" if prediction > 0 else "low"
-        }
+        stored = await agent_result(request, "forecast_narrative" if narrative else "forecast", current_user, refresh)
+        return dict(stored["result"], generated_at=stored["generated_at"])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/agents/prediction/train")
+async def train_forecast(current_user = Depends(get_current_user)):
+    """Retrain the forecast model on all members and precompute forecasts (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        return await train_forecast_model()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/agents/prediction/model")
+async def get_forecast_model_info(current_user = Depends(get_current_user)):
+    """Get forecast model metadata"""
+    return get_model_info()
+
 @router.get("/agents/messages/urgent")
-async def get_urgent_messages_summary(current_user = Depends(get_current_user)):
+async def get_urgent_messages_summary(request: Request, current_user = Depends(get_current_user)):
     """Get AI summary of urgent messages (Admin only)"""
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     try:
         agent = MessageAgent("MessageAgent", llm_client)
-        summary = await agent.route_urgent()
+        summary = await run_until_disconnected(request, agent.coalesce(("urgent",), agent.route_urgent))
         return {"summary": summary}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/agents/batch/run")
+async def run_batch_now(current_user = Depends(get_current_user)):
+    """Start the agent batch for all members in the background (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    started = start_agent_batch(llm_client)
+    return {"message": "Agent batch started" if started else "Agent batch already running", "status": get_batch_status()}
+
+@router.get("/agents/batch/status")
+async def get_batch_run_status(current_user = Depends(get_current_user)):
+    """Progress of the current or last agent batch (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return get_batch_status()
+
+@router.get("/agents/llm/cache")
+async def get_llm_cache_stats(current_user = Depends(get_current_user)):
+    """LLM response cache hit rate and estimated cost saved (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return llm_cache.stats()
+
+@router.get("/agents/llm/health")
+async def get_llm_health(current_user = Depends(get_current_user)):
+    """LLM provider circuit states, EWMA latency/error scores and routing order (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return llm_client.router.status()
+
+@router.get("/agents/coalescing")
+async def get_coalescing_stats(current_user = Depends(get_current_user)):
+    """How many concurrent agent and LLM calls were served by an in-flight twin (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {"agents": agent_flight.stats(), "llm": llm_client.flight.stats()}
+
 @router.get("/agents/actions/history")
-async def get_agent_actions(current_user = Depends(get_current_user)):
-    """Get history of agent actions"""
+async def get_agent_actions(
+    days: int = Query(7, ge=1, le=365),
+    limit: int = Query(50, ge=1, le=500),
+    current_user = Depends(get_current_user)
+):
+    """Get recent agent actions (older ones are kept as daily rollups)"""
     try:
         db = await get_database()
-        actions = await db.agent_actions.find({}).sort("_id", -1).limit(50).to_list(length=50)
+        since = datetime.now(NEPAL_TZ) - timedelta(days=days)
+        actions = await db.agent_actions.find(
+            {"timestamp": {"$gte": since}}, {"_id": 0}
+        ).sort("timestamp", -1).limit(limit).to_list(length=limit)
         return {"actions": actions}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -4,12 +4,23 @@ Includes: AttendanceAgent, ProgressAgent, SecurityAgent, PredictionAgent
 """
 from backend.database.connection import get_database
 from backend.modules.ai.llm_client import LLMClient
-from datetime import datetime, timedelta, date
-import json
+from backend.modules.ai.forecast import get_forecast
+from backend.modules.ai.anomaly import get_user_anomaly
+from backend.modules.ai.context import build_user_context, context_budget, fit_text
+from backend.modules.worklogs.service import search_work_logs
+from backend.utils.singleflight import SingleFlight
+from backend.utils.log_writer import log_writer
+from backend.utils.logger import get_logger
+from datetime import datetime
 import pytz
 
 NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
 
+logger = get_logger(__name__)
+
+# Concurrent identical agent requests share one run (and one LLM call)
+agent_flight = SingleFlight()
+
 
 class Agent:
     """Base agent class"""
@@ -18,18 +29,21 @@ class Agent:
         self.name = name
         self.llm = llm
     
+    async def coalesce(self, key: tuple, fn):
+        """Share one in-flight run of `fn` between concurrent calls with the same key"""
+        return await agent_flight.do((self.name,) + key, fn)
+    
     async def log_action(self, action: str, payload: dict):
-        """Log agent action to database"""
+        """Log agent action to database (queued for the background log writer)"""
         try:
-            db = await get_database()
-            await db.agent_actions.insert_one({
+            await log_writer.write("agent_actions", {
                 "agent_name": self.name,
                 "action": action,
-                "payload": json.dumps(payload),
+                "payload": payload,
                 "timestamp": datetime.now(NEPAL_TZ)
             })
         except Exception as e:
-            print(f"Agent log error: {e}")
+            logger.error("Agent log error: %s", e)
 
 
 class AttendanceAgent(Agent):
@@ -37,11 +51,11 @@ class AttendanceAgent(Agent):
     
     async def self_heal_error(self, error: str, user_id: str, user_name: str) -> str:
         """🔧 Self-healing error recovery with AI"""
-        print(f'🔧 AUTO-HEAL: Attempting to resolve error for {user_name}...')
+        logger.warning("Auto-heal: attempting to resolve error for %s", user_name)
         try:
-            diagnosis = self.llm.chat(
+            diagnosis = await self.llm.chat(
                 f"Error occurred: {error}. Suggest recovery for user {user_name}. Be brief.",
-                max_tokens=50
+                max_tokens=50, agent=self.name
             )
             await self.log_action('self_heal', {
                 'user_id': user_id,
@@ -50,35 +64,33 @@ class AttendanceAgent(Agent):
             })
             return diagnosis
         except Exception as heal_err:
-            print(f'🔧 Self-heal failed: {heal_err}')
+            logger.error("Self-heal failed: %s", heal_err)
             return "Error recovery attempted. Please retry."
     
-    async def detect_anomaly(self, user_id: str, user_name: str) -> str:
-        """🧠 AI-powered anomaly detection"""
+    async def explain(self, user_name: str, anomaly: dict) -> str:
+        """Ask the LLM to explain an already-flagged anomaly in one or two lines"""
+        prompt = (
+            f"Explain briefly for the admin why {user_name}'s recent check-ins were flagged "
+            f"(score {anomaly['score']}): {'; '.join(anomaly['reasons']) or 'unusual pattern'}."
+        )
+        return await self.llm.chat(prompt, max_tokens=100, agent=self.name, user_id=anomaly['user_id'])
+    
+    async def detect_anomaly(self, user_id: str, user_name: str) -> dict:
+        """🧠 Anomaly detection from the batch statistical scores"""
         try:
-            db = await get_database()
-            recent = await db.attendance.find(
-                {"user_id": user_id}
-            ).sort("_id", -1).limit(20).to_list(length=20)
+            anomaly = await get_user_anomaly(user_id)
             
-            if len(recent) < 3:
+            if anomaly["status"] == "NORMAL":
                 return None
             
-            times_text = '\n'.join([
-                f"{r.get('check_in', 'N/A')} ({r.get('status', 'N/A')})"
-                for r in recent[:5]
-            ])
-            
-            anomaly = self.llm.detect_anomaly_ai(times_text)
-            
-            if 'NORMAL' not in anomaly.upper():
-                await self.log_action('anomaly_detected', {
-                    'user_id': user_id,
-                    'name': user_name,
-                    'anomaly': anomaly
-                })
-                return anomaly
-            return None
+            result = dict(anomaly, explanation=await self.explain(user_name, anomaly))
+            await self.log_action('anomaly_detected', {
+                'user_id': user_id,
+                'name': user_name,
+                'score': anomaly['score'],
+                'reasons': anomaly['reasons']
+            })
+            return result
         except Exception as e:
             await self.self_heal_error(str(e), user_id, user_name)
             return None
@@ -86,20 +98,9 @@ class AttendanceAgent(Agent):
     async def get_attendance_insights(self, user_id: str, user_name: str) -> str:
         """🧠 AI-driven insights"""
         try:
-            db = await get_database()
-            today = datetime.now(NEPAL_TZ).date().isoformat()
-            
-            today_count = await db.attendance.count_documents({
-                "user_id": user_id,
-                "date": today
-            })
-            
-            recent = await db.attendance.find(
-                {"user_id": user_id}
-            ).sort("_id", -1).limit(10).to_list(length=10)
-            
-            data = f"User: {user_name}, Today: {today_count} checkins, Recent: {[r.get('check_in', 'N/A') for r in recent[:3]]}"
-            insight = self.llm.analyze_attendance(data)
+            context = await build_user_context(user_id, agent=self.name)
+            data = f"User: {user_name}; {context}"
+            insight = await self.llm.analyze_attendance(data, agent=self.name, user_id=user_id)
             
             await self.log_action('attendance_insight', {
                 'user_id': user_id,
@@ -115,20 +116,32 @@ class AttendanceAgent(Agent):
 class ProgressAgent(Agent):
     """AI agent for learning progress and recommendations"""
     
+    # Retrieval query for logs that say something about skills being learned or used
+    LEARNING_QUERY = (
+        "learned studied practiced built implemented trained tuned debugged deployed "
+        "model data analysis python sql pandas numpy tensorflow pytorch api frontend backend"
+    )
+    
     async def analyze_and_recommend(self, user_id: str) -> str:
         """Analyze work logs and recommend learning path"""
         try:
-            db = await get_database()
-            logs = await db.work_logs.find(
-                {"user_id": user_id}
-            ).sort("_id", -1).limit(10).to_list(length=10)
-            
-            logs_text = '\n'.join([log.get('raw_input', '') for log in logs if log.get('raw_input')])
+            # Most relevant logs for a learning-path question, newest ones if nothing matches
+            logs = await search_work_logs(self.LEARNING_QUERY, user_id=user_id, limit=10, prefix=False)
+            if not logs:
+                db = await get_database()
+                logs = await db.work_logs.find(
+                    {"user_id": user_id}
+                ).sort("_id", -1).limit(10).to_list(length=10)
+            
+            logs_text = fit_text(
+                '\n'.join([log.get('raw_input', '') for log in logs if log.get('raw_input')]),
+                context_budget(self.name)
+            )
             
             if not logs_text:
                 rec = 'No logs found — suggest starting a beginner project in Python + Data.'
             else:
-                rec = self.llm.recommend_learning_path(logs_text)
+                rec = await self.llm.recommend_learning_path(logs_text, agent=self.name)
             
             await self.log_action('recommend_learning', {
                 'user_id': user_id,
@@ -136,82 +149,68 @@ class ProgressAgent(Agent):
             })
             return rec
         except Exception as e:
-            print(f"ProgressAgent error: {e}")
+            logger.error("ProgressAgent error: %s", e)
             return "Unable to generate recommendation at this time"
 
 
 class SecurityAgent(Agent):
-    """AI-powered security & anomaly detection"""
+    """Security & anomaly detection backed by the batch anomaly scores"""
     
-    async def detect_suspicious_pattern(self, user_id: str, user_name: str) -> str:
+    async def detect_suspicious_pattern(self, user_id: str, user_name: str) -> dict:
         """Detect suspicious attendance patterns"""
         try:
-            db = await get_database()
-            rows = await db.attendance.find(
-                {"user_id": user_id}
-            ).sort("_id", -1).limit(5).to_list(length=5)
+            result = dict(await get_user_anomaly(user_id))
             
-            if len(rows) < 2:
-                return 'SAFE'
-            
-            times_text = ','.join([
-                f"{r.get('check_in', 'N/A')}-{r.get('check_out', 'N/A')}"
-                for r in rows if r.get('check_in')
-            ])
-            
-            prompt = f"Analyze entry/exit pattern for {user_name}: {times_text}. Return 'NORMAL' or 'SUSPICIOUS' (anomaly type)"
-            result = self.llm.detect_anomaly_ai(times_text)
+            if result["status"] == "SUSPICIOUS":
+                prompt = (
+                    f"Entry/exit pattern for {user_name} was flagged: {'; '.join(result['reasons']) or 'unusual pattern'}. "
+                    "Explain the possible security concern in one line."
+                )
+                result["explanation"] = await self.llm.chat(prompt, max_tokens=80, agent=self.name, user_id=user_id)
             
             await self.log_action('security_check', {
                 'user_id': user_id,
                 'name': user_name,
-                'result': result
+                'status': result['status'],
+                'score': result['score']
             })
             return result
         except Exception as e:
-            print(f"SecurityAgent error: {e}")
-            return 'SAFE'
+            logger.error("SecurityAgent error: %s", e)
+            # Not checked is not the same as safe
+            return {"user_id": user_id, "score": 0.0, "status": "UNKNOWN", "reasons": [], "error": str(e)}
 
 
 class PredictionAgent(Agent):
-    """AI-powered attendance prediction & forecasting"""
+    """Attendance prediction & forecasting (local statistical model)"""
     
-    async def predict_attendance_rate(self, user_id: str) -> float:
-        """Predict next week attendance rate"""
+    async def forecast(self, user_id: str, narrative: bool = False) -> dict:
+        """Forecast next week attendance; the LLM only writes optional narrative text"""
         try:
-            db = await get_database()
+            result = dict(await get_forecast(user_id))
             
-            present_count = await db.attendance.count_documents({
-                "user_id": user_id,
-                "status": "Present"
-            })
+            if narrative:
+                prompt = (
+                    f"Attendance forecast: {result['predicted_rate']}% next week "
+                    f"(95% interval {result['lower']}-{result['upper']}%), current rate {result['current_rate']}%. "
+                    "Write one encouraging sentence for the member."
+                )
+                result["narrative"] = await self.llm.chat(prompt, max_tokens=60, agent=self.name, user_id=user_id)
             
-            total_count = await db.attendance.count_documents({
-                "user_id": user_id
+            await self.log_action('prediction', {
+                'user_id': user_id,
+                'current_rate': result['current_rate'],
+                'predicted_rate': result['predicted_rate']
             })
-            
-            if total_count == 0:
-                return 50.0
-            
-            rate = (present_count / total_count) * 100
-            
-            prompt = f"Predict next week attendance. Current rate: {rate:.1f}%. History length: {total_count} days. Return percentage."
-            prediction = self.llm.chat(prompt, max_tokens=50)
-            
-            try:
-                # Extract number from response
-                pred_value = float(''.join(filter(lambda x: x.isdigit() or x == '.', prediction.split('%')[0])))
-                await self.log_action('prediction', {
-                    'user_id': user_id,
-                    'current_rate': rate,
-                    'predicted_rate': pred_value
-                })
-                return pred_value
-            except:
-                return rate
+            return result
         except Exception as e:
-            print(f"PredictionAgent error: {e}")
-            return 0.0
+            logger.error("PredictionAgent error: %s", e)
+            return {"predicted_rate": 0.0, "lower": 0.0, "upper": 100.0, "confidence": "low"}
+    
+    async def predict_attendance_rate(self, user_id: str) -> float:
+        """Predict next week attendance rate"""
+        result = await self.forecast(user_id)
+        return result["predicted_rate"]
 
 
 class MessageAgent(Agent):
@@ -233,10 +232,10 @@ class MessageAgent(Agent):
                 for msg in messages
             ])
             
-            summary = self.llm.summarize(summary_text, max_tokens=200)
+            summary = await self.llm.summarize(summary_text, max_tokens=200, agent=self.name)
             
             await self.log_action('route_urgent', {'summary': summary})
             return summary
         except Exception as e:
-            print(f"MessageAgent error: {e}")
+            logger.error("MessageAgent error: %s", e)
             return "Unable to process messages"
@@ -0,0 +1,221 @@
+"""
+Batch anomaly scoring
+Robust (median/MAD) z-scores of check-in time and session length for
+every user in one vectorized pass, plus an optional lab-wide
+IsolationForest. Agents read structured scores and reasons from here
+and only ask the LLM to explain cases that are already flagged.
+"""
+import asyncio
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pytz
+
+from backend.database.connection import get_database
+from backend.modules.analytics.records import (
+    is_present, record_check_in_time, record_check_out_time, segment_starts
+)
+from backend.utils import events
+
+try:
+    from sklearn.ensemble import IsolationForest
+except ImportError:
+    IsolationForest = None
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+RECENT_RECORDS = 5          # latest check-ins inspected per user
+MIN_HISTORY = 5             # check-ins needed before a user's baseline is trusted
+ROBUST_Z_THRESHOLD = 3.5    # Iglewicz & Hoaglin modified z-score cut-off
+SUSPICIOUS_SCORE = 0.5
+# Rule signals add to the score per recent occurrence instead of flagging on their own
+OUTSIDE_HOURS_WEIGHT = 0.2
+MISSING_CHECK_OUT_WEIGHT = 0.15
+MIN_MISSING_CHECK_OUTS = 2
+MIN_ISOLATION_SAMPLES = 50
+LAB_OPEN_MINUTE = 12 * 60
+LAB_CLOSE_MINUTE = 17 * 60
+
+def group_median(codes: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """Median of `values` per group code (NaNs ignored) with one lexsort"""
+    medians = np.full(n_groups, np.nan)
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    if codes.size == 0:
+        return medians
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    starts = segment_starts(codes)
+    counts = np.diff(np.r_[starts, codes.size])
+    lo = starts + (counts - 1) // 2
+    hi = starts + counts // 2
+    medians[codes[starts]] = (values[lo] + values[hi]) / 2.0
+    return medians
+
+def robust_z(codes: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """Modified z-score of each value against its own group's median/MAD"""
+    median = group_median(codes, values, n_groups)
+    deviation = np.abs(values - median[codes])
+    mad = group_median(codes, deviation, n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = 0.6745 * (values - median[codes]) / mad[codes]
+    # Zero MAD means a perfectly regular user: any deviation is still notable
+    z = np.where(mad[codes] == 0, np.where(deviation > 0, np.sign(values - median[codes]) * ROBUST_Z_THRESHOLD, 0.0), z)
+    return np.nan_to_num(z, nan=0.0)
+
+def _flatten(records: List[dict], ids: Dict[Any, int]) -> Tuple[np.ndarray, ...]:
+    today = datetime.now(NEPAL_TZ).date()
+    codes, moments, minutes, durations, missing_out = [], [], [], [], []
+    for record in records:
+        uid = record.get("user_id")
+        check_in = record_check_in_time(record)
+        if uid not in ids or check_in is None or not is_present(record):
+            continue
+        check_out = record_check_out_time(record)
+        codes.append(ids[uid])
+        moments.append(check_in.timestamp())
+        minutes.append(check_in.hour * 60 + check_in.minute)
+        if check_out is not None:
+            durations.append((check_out - check_in).total_seconds() / 60.0)
+            missing_out.append(False)
+        else:
+            durations.append(np.nan)
+            # Face/kiosk marking has no check-out step, only the check-in route does
+            missing_out.append(record.get("check_in") is not None and check_in.date() != today)
+    return (
+        np.asarray(codes, dtype=np.int64), np.asarray(moments, dtype=np.float64),
+        np.asarray(minutes, dtype=np.float64), np.asarray(durations, dtype=np.float64),
+        np.asarray(missing_out, dtype=bool),
+    )
+
+def _isolation_scores(minutes: np.ndarray, durations: np.ndarray) -> Optional[np.ndarray]:
+    """Lab-wide IsolationForest outlier score in [0, 1] per check-in, if enough data"""
+    if IsolationForest is None or minutes.size < MIN_ISOLATION_SAMPLES:
+        return None
+    features = np.column_stack([minutes, np.nan_to_num(durations, nan=np.nanmedian(durations) if np.isfinite(durations).any() else 0.0)])
+    forest = IsolationForest(n_estimators=100, random_state=0).fit(features)
+    raw = -forest.score_samples(features)  # higher = more anomalous, roughly 0.3 .. 0.8
+    return np.clip((raw - 0.5) / 0.3, 0.0, 1.0)
+
+def score_records(records: List[dict], user_ids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+    """
+    Score every user's latest check-ins against their own history
+
+    Returns user_id -> {score, status, reasons, features}; scoring is a
+    fixed number of sorts and segment reductions regardless of lab size.
+    """
+    ids = {uid: i for i, uid in enumerate(dict.fromkeys(user_ids))}
+    for record in records:
+        ids.setdefault(record.get("user_id"), len(ids))
+    ids.pop(None, None)
+    n_users = len(ids)
+
+    codes, moments, minutes, durations, missing_out = _flatten(records, ids)
+    order = np.lexsort((moments, codes))
+    codes, minutes, durations, missing_out = codes[order], minutes[order], durations[order], missing_out[order]
+
+    z_check_in = robust_z(codes, minutes, n_users)
+    z_duration = robust_z(codes, durations, n_users)
+    isolation = _isolation_scores(minutes, durations)
+
+    # Position of each record counted from the user's newest one
+    starts = segment_starts(codes)
+    counts = np.zeros(n_users, dtype=np.int64)
+    if starts.size:
+        counts[codes[starts]] = np.diff(np.r_[starts, codes.size])
+    ends = np.zeros(n_users, dtype=np.int64)
+    if starts.size:
+        ends[codes[starts]] = np.r_[starts[1:], codes.size]
+    age = ends[codes] - 1 - np.arange(codes.size)
+    latest = age < RECENT_RECORDS
+    # z-scores need a baseline; hour and check-out rules apply from day one
+    trusted = latest & (counts[codes] >= MIN_HISTORY)
+    outside_hours = (minutes < LAB_OPEN_MINUTE) | (minutes >= LAB_CLOSE_MINUTE)
+
+    def per_user_max(values: np.ndarray) -> np.ndarray:
+        out = np.zeros(n_users)
+        np.maximum.at(out, codes[trusted], values[trusted])
+        return out
+
+    def per_user_count(mask: np.ndarray) -> np.ndarray:
+        return np.bincount(codes[latest & mask], minlength=n_users)
+
+    max_z_in = per_user_max(np.abs(z_check_in))
+    max_z_dur = per_user_max(np.abs(z_duration))
+    n_outside = per_user_count(outside_hours)
+    n_missing = per_user_count(missing_out)
+    max_isolation = per_user_max(isolation) if isolation is not None else None
+
+    score = np.minimum(np.maximum(max_z_in, max_z_dur) / (2 * ROBUST_Z_THRESHOLD), 1.0)
+    if max_isolation is not None:
+        score = np.maximum(score, max_isolation * 0.6)
+    counted_missing = np.where(n_missing >= MIN_MISSING_CHECK_OUTS, n_missing, 0)
+    score = np.minimum(score + n_outside * OUTSIDE_HOURS_WEIGHT + counted_missing * MISSING_CHECK_OUT_WEIGHT, 1.0)
+
+    results = {}
+    for uid, i in ids.items():
+        reasons = []
+        if max_z_in[i] >= ROBUST_Z_THRESHOLD:
+            reasons.append(f"check-in time {max_z_in[i]:.1f} robust SDs from usual")
+        if max_z_dur[i] >= ROBUST_Z_THRESHOLD:
+            reasons.append(f"session length {max_z_dur[i]:.1f} robust SDs from usual")
+        if n_outside[i]:
+            reasons.append(f"{n_outside[i]} recent check-in(s) outside lab hours")
+        if counted_missing[i]:
+            reasons.append(f"{n_missing[i]} recent session(s) without check-out")
+        isolated = max_isolation is not None and max_isolation[i] >= 0.8
+        if isolated:
+            reasons.append("unusual time/duration combination for the lab")
+
+        user_score = float(score[i])
+        suspicious = user_score >= SUSPICIOUS_SCORE or isolated
+        results[uid] = {
+            "user_id": uid,
+            "score": round(user_score, 3),
+            "status": "SUSPICIOUS" if suspicious else "NORMAL",
+            "reasons": reasons,
+            "features": {
+                "history": int(counts[i]),
+                "max_check_in_z": round(float(max_z_in[i]), 2),
+                "max_duration_z": round(float(max_z_dur[i]), 2),
+                "outside_hours": int(n_outside[i]),
+                "missing_check_out": int(n_missing[i]),
+            },
+        }
+    return results
+
+_anomaly_cache: Dict[str, Any] = {"result": None, "computed_at": None, "generation": 0}
+_anomaly_lock = asyncio.Lock()
+
+def invalidate_anomaly_scores(**_):
+    _anomaly_cache["result"] = None
+    _anomaly_cache["generation"] += 1
+
+events.subscribe(events.ATTENDANCE, invalidate_anomaly_scores)
+events.subscribe(events.USERS, invalidate_anomaly_scores)
+
+async def get_anomaly_scores() -> Dict[Any, Dict[str, Any]]:
+    """Scores for every user, recomputed in one batch after attendance writes"""
+    async with _anomaly_lock:
+        if _anomaly_cache["result"] is not None:
+            return _anomaly_cache["result"]
+
+        generation = _anomaly_cache["generation"]
+        db = await get_database()
+        records = await db.attendance.find(
+            {}, {"user_id": 1, "check_in": 1, "check_out": 1, "timestamp": 1, "status": 1}
+        ).to_list(length=None)
+        members = await db.users.find({"role": "member"}, {"_id": 1}).to_list(length=None)
+
+        result = await asyncio.to_thread(score_records, records, [m["_id"] for m in members])
+        if generation == _anomaly_cache["generation"]:
+            _anomaly_cache.update(result=result, computed_at=datetime.now(NEPAL_TZ))
+        return result
+
+async def get_user_anomaly(user_id: str) -> Dict[str, Any]:
+    scores = await get_anomaly_scores()
+    return scores.get(user_id) or {
+        "user_id": user_id, "score": 0.0, "status": "NORMAL", "reasons": [],
+        "features": {"history": 0}
+    }
@@ -0,0 +1,163 @@
+"""
+Agent batch runner
+Runs the attendance, progress, security and prediction agents for every
+member in the background (nightly, or on demand) with bounded
+concurrency, and keeps the latest result per (user, agent) in
+`agent_results` so the agent endpoints can answer instantly.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import pytz
+
+from backend.config import get_settings
+from backend.database.connection import get_database
+from backend.modules.ai.agents import (
+    AttendanceAgent, ProgressAgent, SecurityAgent, PredictionAgent
+)
+from backend.modules.ai.forecast import train_forecast_model
+from backend.modules.ai.llm_client import LLMClient
+from backend.utils.logger import get_logger
+from backend.utils.shared_state import shared_state
+from backend.utils.timezone import to_nepal_time
+
+settings = get_settings()
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+logger = get_logger(__name__)
+
+# job name -> (agent class, how to run it for one user)
+AGENT_JOBS: Dict[str, Tuple[type, Callable[..., Awaitable[Any]]]] = {
+    "attendance_insights": (AttendanceAgent, lambda agent, user_id, name: agent.get_attendance_insights(user_id, name)),
+    "anomaly": (AttendanceAgent, lambda agent, user_id, name: agent.detect_anomaly(user_id, name)),
+    "learning": (ProgressAgent, lambda agent, user_id, name: agent.analyze_and_recommend(user_id)),
+    "security": (SecurityAgent, lambda agent, user_id, name: agent.detect_suspicious_pattern(user_id, name)),
+    "forecast": (PredictionAgent, lambda agent, user_id, name: agent.forecast(user_id)),
+    # On demand only: the narrative costs an LLM call the nightly run doesn't need
+    "forecast_narrative": (PredictionAgent, lambda agent, user_id, name: agent.forecast(user_id, narrative=True)),
+}
+BATCH_JOBS = ["attendance_insights", "anomaly", "learning", "security", "forecast"]
+
+_batch_state: Dict[str, Any] = {
+    "running": False,
+    "started_at": None,
+    "finished_at": None,
+    "users": 0,
+    "results": 0,
+    "errors": 0,
+}
+
+def _user_name(user: dict) -> str:
+    return user.get("name", f"User_{user.get('_id')}")
+
+async def compute_result(job: str, user: dict, llm: LLMClient) -> Dict[str, Any]:
+    """Run one agent job for one user and store it as the latest result"""
+    agent_class, run = AGENT_JOBS[job]
+    agent = agent_class(agent_class.__name__, llm)
+    result = await run(agent, user["_id"], _user_name(user))
+
+    doc = {
+        "user_id": user["_id"],
+        "agent": job,
+        "result": result,
+        "generated_at": datetime.now(NEPAL_TZ)
+    }
+    db = await get_database()
+    await db.agent_results.replace_one({"user_id": user["_id"], "agent": job}, doc, upsert=True)
+    return doc
+
+async def get_result(job: str, user: dict, llm: LLMClient, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Latest stored result for (user, job)
+
+    Falls back to computing it when nothing is stored yet (new members,
+    before the first batch) or when the caller asks for a refresh.
+    """
+    if not refresh:
+        db = await get_database()
+        stored = await db.agent_results.find_one({"user_id": user["_id"], "agent": job}, {"_id": 0})
+        if stored is not None:
+            stored["generated_at"] = to_nepal_time(stored["generated_at"])
+            return stored
+    return await compute_result(job, user, llm)
+
+async def run_agent_batch(llm: LLMClient, concurrency: int = None) -> Dict[str, Any]:
+    """Run every batch job for every member, `concurrency` members at a time"""
+    if _batch_state["running"]:
+        return dict(_batch_state)
+
+    _batch_state.update(running=True, started_at=datetime.now(NEPAL_TZ), finished_at=None, users=0, results=0, errors=0)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=(concurrency or settings.AGENT_BATCH_CONCURRENCY) * 2)
+
+    async def worker():
+        while True:
+            user = await queue.get()
+            try:
+                if user is None:
+                    return
+                for job in BATCH_JOBS:
+                    try:
+                        await compute_result(job, user, llm)
+                        _batch_state["results"] += 1
+                    except Exception as e:
+                        _batch_state["errors"] += 1
+                        logger.error("Agent batch error (%s, %s): %s", job, user.get('_id'), e)
+                _batch_state["users"] += 1
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency or settings.AGENT_BATCH_CONCURRENCY)]
+    try:
+        db = await get_database()
+        async for user in db.users.find({"role": "member"}, {"_id": 1, "name": 1}):
+            await queue.put(user)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+        _batch_state.update(running=False, finished_at=datetime.now(NEPAL_TZ))
+    return dict(_batch_state)
+
+_batch_task: Optional[asyncio.Task] = None
+
+def start_agent_batch(llm: LLMClient) -> bool:
+    """Start a batch in the background unless one is already running"""
+    global _batch_task
+    if _batch_task is not None and not _batch_task.done():
+        return False
+    _batch_task = asyncio.create_task(run_agent_batch(llm))
+    return True
+
+def get_batch_status() -> Dict[str, Any]:
+    return dict(_batch_state, jobs=BATCH_JOBS)
+
+def seconds_until(hour: int, now: Optional[datetime] = None) -> float:
+    """Seconds from now until the next `hour`:00 Nepal time"""
+    now = now or datetime.now(NEPAL_TZ)
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+async def agent_batch_loop(llm: LLMClient):
+    """Nightly scheduler started with the app"""
+    while True:
+        await asyncio.sleep(seconds_until(settings.AGENT_BATCH_HOUR))
+        try:
+            # Every worker wakes up; the lease makes sure one of them runs the batch
+            if not await shared_state.claim("agent_batch", 12 * 3600):
+                continue
+            # Fresh forecasts first, so the prediction agent reads tonight's model
+            try:
+                training = await train_forecast_model()
+                logger.info("Forecast model retrained: %s samples, %s users", training["n_samples"], training["users"])
+            except Exception as e:
+                logger.error("Forecast training failed: %s", e)
+            summary = await run_agent_batch(llm)
+            logger.info("Agent batch done: %s users, %s results, %s errors", summary['users'], summary['results'], summary['errors'])
+        except Exception as e:
+            logger.error("Agent batch failed: %s", e)
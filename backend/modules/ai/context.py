@@ -0,0 +1,145 @@
+"""
+Prompt context builder
+Turns a user's full attendance history into a fixed-size numeric summary
+(rates, check-in mean/spread, streaks, weekday profile, recent deltas)
+and renders it under a per-agent token budget, so prompt size stays
+constant however long the history is.
+"""
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.database.connection import get_database
+from backend.modules.ai.forecast import open_days_between
+from backend.modules.ai.llm_cache import estimate_tokens
+from backend.modules.analytics.records import record_day_and_minute
+from backend.modules.analytics.service import get_user_analytics
+from backend.utils.timezone import get_nepal_date, NEPAL_TZ, WEEKDAYS
+
+# Maximum prompt-context tokens per agent (the rest of the prompt is fixed text)
+AGENT_CONTEXT_BUDGETS = {
+    "AttendanceAgent": 120,
+    "ProgressAgent": 200,  # work-log text
+    "chat": 120,
+}
+DEFAULT_CONTEXT_BUDGET = 100
+
+RECENT_DAYS = 7
+BASELINE_DAYS = 28
+PROFILE_WEEKS = 12
+
+def _clock(minute: Optional[float]) -> str:
+    if minute is None or np.isnan(minute):
+        return "n/a"
+    minute = int(round(minute))
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+def _pct(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value * 100:.0f}%"
+
+def _rate(present: np.ndarray, open_days: np.ndarray) -> Optional[float]:
+    return float(np.isin(open_days, present).mean()) if open_days.size else None
+
+def summarize_history(records: List[dict], today: Optional[date] = None) -> Dict[str, Any]:
+    """Fixed-size numeric summary of one user's attendance records"""
+    today_ord = (today or get_nepal_date()).toordinal()
+    parsed: List[Tuple[int, float]] = [record_day_and_minute(r) for r in records]
+    parsed = [(d, m) for d, m in parsed if d is not None and d <= today_ord]
+    days = np.asarray([d for d, _ in parsed], dtype=np.int64)
+    minutes = np.asarray([m for _, m in parsed], dtype=np.float64)
+
+    present = ~np.isnan(minutes)
+    present_days = np.unique(days[present])
+
+    recent_open = open_days_between(today_ord - RECENT_DAYS + 1, today_ord)
+    baseline_open = open_days_between(today_ord - BASELINE_DAYS - RECENT_DAYS + 1, today_ord - RECENT_DAYS)
+    window_open = open_days_between(today_ord - BASELINE_DAYS - RECENT_DAYS + 1, today_ord)
+
+    in_window = present & (days > today_ord - BASELINE_DAYS - RECENT_DAYS)
+    in_recent = present & (days > today_ord - RECENT_DAYS)
+    window_minutes = minutes[in_window]
+    mean = float(window_minutes.mean()) if window_minutes.size else None
+    std = float(window_minutes.std()) if window_minutes.size > 1 else None
+    recent_mean = float(minutes[in_recent].mean()) if in_recent.any() else None
+
+    # Share of each open weekday attended over the profile window
+    profile_open = open_days_between(today_ord - PROFILE_WEEKS * 7 + 1, today_ord)
+    weekday = (profile_open - 1) % 7  # date.fromordinal(1) is a Monday
+    attended = np.isin(profile_open, present_days)
+    opens = np.bincount(weekday, minlength=7)
+    hits = np.bincount(weekday, weights=attended, minlength=7)
+    weekday_profile = {
+        WEEKDAYS[i][:3]: (round(float(hits[i] / opens[i]) * 100) if opens[i] else None) for i in range(7)
+    }
+
+    last = int(np.flatnonzero(present)[np.argmax(days[present])]) if present.any() else None
+    recent_rate, baseline_rate = _rate(present_days, recent_open), _rate(present_days, baseline_open)
+    return {
+        "rate": _rate(present_days, window_open),
+        "recent_rate": recent_rate,
+        "rate_delta": (recent_rate - baseline_rate) if recent_rate is not None and baseline_rate is not None else None,
+        "check_in_mean": mean,
+        "check_in_std": std,
+        "check_in_shift": (recent_mean - mean) if recent_mean is not None and mean is not None else None,
+        "weekday_profile": weekday_profile,
+        "last_check_in": (date.fromordinal(int(days[last])).isoformat(), _clock(minutes[last])) if last is not None else None,
+        "checked_in_today": bool((present & (days == today_ord)).any()),
+        "days_tracked": int(np.unique(days).size),
+    }
+
+def render_context(summary: Dict[str, Any], analytics: Dict[str, Any], budget: int) -> str:
+    """
+    Render the summary as `key=value` fields, most important first,
+    dropping trailing fields until it fits the token budget
+    """
+    fields = [
+        f"rate_{BASELINE_DAYS + RECENT_DAYS}d={_pct(summary['rate'])}",
+        f"rate_{RECENT_DAYS}d={_pct(summary['recent_rate'])}"
+        + (f" ({summary['rate_delta'] * 100:+.0f}pts vs before)" if summary["rate_delta"] is not None else ""),
+        f"today={'checked in' if summary['checked_in_today'] else 'not yet'}",
+        f"check_in_avg={_clock(summary['check_in_mean'])}"
+        + (f" sd={summary['check_in_std']:.0f}m" if summary["check_in_std"] is not None else ""),
+        f"streak={analytics.get('streak', 0)} (best {analytics.get('longest_streak', 0)})",
+        f"pattern={analytics.get('pattern', 'Newcomer')}",
+    ]
+    if summary["check_in_shift"] is not None:
+        fields.append(f"recent_check_in_shift={summary['check_in_shift']:+.0f}m")
+    if summary["last_check_in"] is not None:
+        fields.append(f"last={summary['last_check_in'][0]} {summary['last_check_in'][1]}")
+    profile = " ".join(f"{day}:{value}" for day, value in summary["weekday_profile"].items() if value is not None)
+    if profile:
+        fields.append(f"weekday_%=[{profile}]")
+    fields.append(f"present_days_total={analytics.get('present_days', summary['days_tracked'])}")
+
+    while len(fields) > 1 and estimate_tokens("; ".join(fields)) > budget:
+        fields.pop()
+    return fit_text("; ".join(fields), budget)
+
+def fit_text(text: str, budget: int) -> str:
+    """Trim free text (e.g. work logs) to roughly `budget` tokens"""
+    limit = budget * 4
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+def context_budget(agent: str) -> int:
+    return AGENT_CONTEXT_BUDGETS.get(agent, DEFAULT_CONTEXT_BUDGET)
+
+async def build_user_context(user_id: str, agent: str = None, budget: int = None) -> str:
+    """Compact, budgeted description of a user's attendance for an LLM prompt"""
+    # Only the profile window is read; lifetime totals come from the cohort analytics
+    today = get_nepal_date()
+    since = date.fromordinal(today.toordinal() - PROFILE_WEEKS * 7 + 1)
+    db = await get_database()
+    records = await db.attendance.find(
+        {
+            "user_id": user_id,
+            # Face/kiosk records carry no `date`, only their timestamp
+            "$or": [
+                {"date": {"$gte": since.isoformat()}},
+                {"date": None, "timestamp": {"$gte": NEPAL_TZ.localize(datetime.combine(since, datetime.min.time()))}},
+            ],
+        },
+        {"date": 1, "check_in": 1, "timestamp": 1, "status": 1}
+    ).to_list(length=None)
+    analytics = await get_user_analytics(user_id)
+    return render_context(summarize_history(records, today), analytics, budget or context_budget(agent))
@@ -0,0 +1,86 @@
+"""
+Fake LLM server
+Minimal OpenAI-compatible /v1/chat/completions endpoint for exercising
+LLMClient timeouts, concurrency limits and cancellation without a key.
+
+    python -m backend.modules.ai.fake_llm_server --port 8089 --delay 0.5
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://127.0.0.1:8089/v1 uvicorn ...
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+
+def create_app(delay: float = 0.0, fail_every: int = 0, token_delay: float = 0.01) -> web.Application:
+    """
+    `delay` seconds per completion (or before the first streamed token),
+    `token_delay` between streamed tokens; every `fail_every`-th request returns 500
+    """
+    state = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "cancelled": 0, "aborted_streams": 0}
+
+    async def stream_completion(request: web.Request, body: dict, text: str) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = text.split(" ")
+        try:
+            for i, word in enumerate(words):
+                chunk = {"choices": [{"index": 0, "delta": {"content": word if i == len(words) - 1 else word + " "}}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                await asyncio.sleep(token_delay)
+            await response.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            state["aborted_streams"] += 1  # client went away mid-stream
+        return response
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        state["requests"] += 1
+        if fail_every and state["requests"] % fail_every == 0:
+            return web.json_response({"error": {"message": "injected failure"}}, status=500)
+
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        try:
+            await asyncio.sleep(float(request.query.get("delay", delay)))
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+        finally:
+            state["in_flight"] -= 1
+
+        prompt = body["messages"][-1]["content"]
+        if body.get("stream"):
+            return await stream_completion(request, body, f"[fake] {prompt[:80]}")
+        return web.json_response({
+            "id": f"fake-{state['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"[fake] {prompt[:80]}"},
+                "finish_reason": "stop"
+            }]
+        })
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(state)
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    web.run_app(create_app(args.delay, args.fail_every, args.token_delay), host=args.host, port=args.port)
@@ -0,0 +1,299 @@
+"""
+Attendance forecasting
+Lightweight scikit-learn model trained for all users in one batch job.
+Predictions (with confidence intervals) are precomputed per user so the
+prediction endpoint is a dictionary lookup instead of an LLM round trip.
+"""
+import asyncio
+import math
+import os
+import pickle
+from datetime import date, datetime
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+import pytz
+
+from backend.database.connection import get_database
+from backend.modules.analytics.records import record_day_and_minute
+from backend.utils import events
+from backend.utils.logger import get_logger
+from backend.utils.shared_state import shared_state
+from backend.utils.timezone import get_nepal_date, get_lab_weekmask, get_lab_holidays
+
+logger = get_logger(__name__)
+
+try:
+    from sklearn.linear_model import LogisticRegression
+except ImportError:
+    logger.warning("scikit-learn not installed. Forecasts will use empirical rates.")
+    LogisticRegression = None
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+FORECAST_MODEL_PATH = "ai-models/forecast.pkl"
+HORIZON_DAYS = 7  # open lab days ahead
+MIN_TRAINING_SAMPLES = 20
+Z_95 = 1.96
+
+FEATURE_NAMES = [f"weekday_{i}" for i in range(7)] + ["rate_7", "rate_28", "streak", "history"]
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+_state: Dict[str, Any] = {
+    "model": None,
+    "trained_at": None,
+    "n_samples": 0,
+    "predictions": {},  # user_id -> forecast dict
+    "loaded": False,
+}
+
+def _to_datetime64(ordinals: np.ndarray) -> np.ndarray:
+    return (np.asarray(ordinals, dtype=np.int64) - _EPOCH_ORDINAL).astype("datetime64[D]")
+
+def _weekmask() -> str:
+    weekmask = get_lab_weekmask()
+    return weekmask if "1" in weekmask else "1111111"
+
+def open_days_between(first_day: int, last_day: int) -> np.ndarray:
+    """Ordinals of lab-open days in [first_day, last_day]"""
+    span = np.arange(first_day, last_day + 1, dtype=np.int64)
+    is_open = np.is_busday(_to_datetime64(span), weekmask=_weekmask(), holidays=get_lab_holidays())
+    return span[is_open]
+
+def next_open_days(after_day: int, count: int) -> np.ndarray:
+    """Ordinals of the next `count` lab-open days after `after_day`"""
+    start = _to_datetime64(np.array([after_day]))[0] + np.timedelta64(1, "D")
+    offsets = np.busday_offset(start, np.arange(count), roll="forward",
+                               weekmask=_weekmask(), holidays=get_lab_holidays())
+    return offsets.astype(np.int64) + _EPOCH_ORDINAL
+
+def _rolling_rate(cumulative: np.ndarray, i: np.ndarray, window: int) -> np.ndarray:
+    """Presence rate over the `window` open days before position i"""
+    lo = np.maximum(i - window, 0)
+    return (cumulative[i] - cumulative[lo]) / np.maximum(i - lo, 1)
+
+def _features(weekdays: np.ndarray, rate_7: np.ndarray, rate_28: np.ndarray,
+              streak: np.ndarray, history: np.ndarray) -> np.ndarray:
+    onehot = np.eye(7)[weekdays]
+    return np.column_stack([
+        onehot, rate_7, rate_28,
+        np.minimum(streak, 30) / 30.0,
+        np.minimum(history, 28) / 28.0
+    ])
+
+def build_user_dataset(present_days: np.ndarray, first_day: int, today: int) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+    """
+    Training rows (one per open day before today) and the current state
+
+    Every open day from the user's first record until yesterday is a row;
+    features only look at days strictly before the labelled day.
+    """
+    days = open_days_between(first_day, today - 1)
+    presence = np.isin(days, present_days).astype(np.float64)
+    n = days.size
+
+    cumulative = np.r_[0.0, np.cumsum(presence)]
+    i = np.arange(n)
+    # Consecutive present days ending at position i, then shifted to "entering day i"
+    last_absent = np.maximum.accumulate(np.where(presence == 0, i, -1)) if n else np.zeros(0, dtype=np.int64)
+    streak_after = i - last_absent
+    streak_before = np.r_[0, streak_after[:-1]] if n else np.zeros(0)
+
+    weekdays = (_to_datetime64(days).astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    X = _features(weekdays, _rolling_rate(cumulative, i, 7), _rolling_rate(cumulative, i, 28), streak_before, i)
+
+    end = np.array([n])
+    state = {
+        "rate_7": float(_rolling_rate(cumulative, end, 7)[0]) if n else 0.0,
+        "rate_28": float(_rolling_rate(cumulative, end, 28)[0]) if n else 0.0,
+        "streak": float(streak_after[-1]) if n else 0.0,
+        "history": float(n),
+        "observed_rate": float(presence.mean()) if n else 0.0,
+        "observed_days": int(n),
+    }
+    return X, presence, state
+
+def _horizon_features(state: Dict[str, float], today: int) -> np.ndarray:
+    days = next_open_days(today - 1, HORIZON_DAYS)
+    weekdays = (_to_datetime64(days).astype(np.int64) + 3) % 7
+    ones = np.ones(HORIZON_DAYS)
+    return _features(weekdays, ones * state["rate_7"], ones * state["rate_28"],
+                     ones * state["streak"], ones * state["history"])
+
+def _interval(probabilities: np.ndarray) -> Tuple[float, float, float]:
+    """Expected rate and 95% interval of the share of days attended (Poisson-binomial)"""
+    n = probabilities.size
+    mean = float(probabilities.mean())
+    std = math.sqrt(float((probabilities * (1 - probabilities)).sum())) / n
+    return mean, max(mean - Z_95 * std, 0.0), min(mean + Z_95 * std, 1.0)
+
+def _wilson(rate: float, n: int) -> Tuple[float, float]:
+    if n == 0:
+        return 0.0, 1.0
+    denom = 1 + Z_95 ** 2 / n
+    centre = (rate + Z_95 ** 2 / (2 * n)) / denom
+    half = Z_95 * math.sqrt(rate * (1 - rate) / n + Z_95 ** 2 / (4 * n * n)) / denom
+    return max(centre - half, 0.0), min(centre + half, 1.0)
+
+def predict_from_state(model, state: Dict[str, float], today: int) -> Dict[str, Any]:
+    """Forecast next-week attendance for one user from their current state"""
+    if model is not None and state["observed_days"] > 0:
+        probabilities = model.predict_proba(_horizon_features(state, today))[:, 1]
+        mean, low, high = _interval(probabilities)
+        method = "logistic_regression"
+    else:
+        # No trained model yet: fall back to the observed rate with a Wilson interval
+        mean = state["observed_rate"] if state["observed_days"] else 0.5
+        low, high = _wilson(mean, state["observed_days"])
+        method = "empirical"
+
+    width = high - low
+    return {
+        "predicted_rate": round(mean * 100, 2),
+        "lower": round(low * 100, 2),
+        "upper": round(high * 100, 2),
+        "confidence": "high" if width < 0.25 else "medium" if width < 0.5 else "low",
+        "current_rate": round(state["observed_rate"] * 100, 2),
+        "horizon_days": HORIZON_DAYS,
+        "method": method,
+    }
+
+def _group_present_days(records: List[dict]) -> Dict[Any, Tuple[np.ndarray, int]]:
+    """user_id -> (sorted unique present day ordinals, first recorded day)"""
+    grouped: Dict[Any, Tuple[List[int], int]] = {}
+    for record in records:
+        day, minute = record_day_and_minute(record)
+        if day is None:
+            continue
+        present, first = grouped.get(record.get("user_id"), ([], day))
+        if not math.isnan(minute):
+            present.append(day)
+        grouped[record.get("user_id")] = (present, min(first, day))
+    return {uid: (np.unique(np.asarray(p, dtype=np.int64)), first) for uid, (p, first) in grouped.items()}
+
+def _fit(X: np.ndarray, y: np.ndarray):
+    if LogisticRegression is None or len(y) < MIN_TRAINING_SAMPLES or len(np.unique(y)) < 2:
+        return None
+    model = LogisticRegression(max_iter=500)
+    model.fit(X, y)
+    return model
+
+def _save():
+    os.makedirs(os.path.dirname(FORECAST_MODEL_PATH), exist_ok=True)
+    with open(FORECAST_MODEL_PATH, "wb") as f:
+        pickle.dump({key: _state[key] for key in ("model", "trained_at", "n_samples", "predictions")}, f)
+
+def _load():
+    _state["loaded"] = True
+    if not os.path.exists(FORECAST_MODEL_PATH):
+        return
+    try:
+        with open(FORECAST_MODEL_PATH, "rb") as f:
+            _state.update(pickle.load(f))
+    except Exception as e:
+        logger.error("Forecast model load error: %s", e)
+
+async def train_forecast_model() -> Dict[str, Any]:
+    """
+    Batch job: train one model on every user's history, then precompute
+    and persist a forecast for every user
+    """
+    db = await get_database()
+    records = await db.attendance.find(
+        {}, {"user_id": 1, "date": 1, "check_in": 1, "timestamp": 1, "status": 1}
+    ).to_list(length=None)
+
+    today = get_nepal_date().toordinal()
+    datasets = {
+        uid: build_user_dataset(present, first, today)
+        for uid, (present, first) in _group_present_days(records).items()
+    }
+
+    rows = [(X, y) for X, y, _ in datasets.values() if len(y)]
+    X = np.vstack([r[0] for r in rows]) if rows else np.zeros((0, len(FEATURE_NAMES)))
+    y = np.concatenate([r[1] for r in rows]) if rows else np.zeros(0)
+    model = await asyncio.to_thread(_fit, X, y)
+
+    _state.update(
+        model=model,
+        trained_at=datetime.now(NEPAL_TZ).isoformat(),
+        n_samples=int(len(y)),
+        predictions={uid: predict_from_state(model, state, today) for uid, (_, _, state) in datasets.items()},
+        loaded=True,
+    )
+    await asyncio.to_thread(_save)
+    events.publish(events.FORECAST, trained_at=_state["trained_at"])
+    return {
+        "trained_at": _state["trained_at"],
+        "n_samples": _state["n_samples"],
+        "users": len(_state["predictions"]),
+        "model": type(model).__name__ if model is not None else None,
+    }
+
+def _has_trained_model() -> bool:
+    """A saved payload with a fitted model (not the empirical-rate fallback of an empty history)"""
+    _load()
+    return _state["model"] is not None and (_state["n_samples"] or 0) > 0
+
+async def ensure_forecast_model():
+    """Train on startup unless a fitted model has already been saved (fresh deploy)"""
+    if _has_trained_model():
+        return
+    try:
+        # With several workers only one of them trains
+        if not await shared_state.claim("forecast_train", 3600):
+            return
+        summary = await train_forecast_model()
+        logger.info("Forecast model trained on startup: %s samples, %s users", summary["n_samples"], summary["users"])
+    except Exception as e:
+        logger.error("Startup forecast training failed: %s", e)
+
+def _mark_stale(user_id=None, **_):
+    """New attendance makes that user's precomputed forecast stale"""
+    if user_id is not None:
+        _state["predictions"].pop(user_id, None)
+
+def _mark_retrained(trained_at=None, **_):
+    """Another worker saved a newer model: reload it on the next read"""
+    if trained_at != _state["trained_at"]:
+        _state["loaded"] = False
+
+events.subscribe(events.ATTENDANCE, _mark_stale)
+events.subscribe(events.FORECAST, _mark_retrained)
+
+async def get_forecast(user_id: str) -> Dict[str, Any]:
+    """Precomputed forecast for a user; recomputed from their history if stale"""
+    if not _state["loaded"]:
+        _load()
+
+    cached = _state["predictions"].get(user_id)
+    if cached is not None:
+        return cached
+
+    db = await get_database()
+    records = await db.attendance.find(
+        {"user_id": user_id}, {"user_id": 1, "date": 1, "check_in": 1, "timestamp": 1, "status": 1}
+    ).to_list(length=None)
+
+    today = get_nepal_date().toordinal()
+    grouped = _group_present_days(records).get(user_id)
+    if grouped is None:
+        state = {"rate_7": 0.0, "rate_28": 0.0, "streak": 0.0, "history": 0.0, "observed_rate": 0.0, "observed_days": 0}
+    else:
+        _, _, state = build_user_dataset(grouped[0], grouped[1], today)
+
+    forecast = predict_from_state(_state["model"], state, today)
+    _state["predictions"][user_id] = forecast
+    return forecast
+
+def get_model_info() -> Dict[str, Any]:
+    if not _state["loaded"]:
+        _load()
+    return {
+        "trained_at": _state["trained_at"],
+        "n_samples": _state["n_samples"],
+        "model": type(_state["model"]).__name__ if _state["model"] is not None else None,
+        "features": FEATURE_NAMES,
+        "cached_predictions": len(_state["predictions"]),
+    }
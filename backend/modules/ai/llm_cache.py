@@ -0,0 +1,218 @@
+"""
+LLM Response Cache
+Memoizes LLMClient.chat by provider, model, normalized prompt and
+max_tokens. Entries live in an in-process LRU (optionally backed by
+SQLite), expire per agent type, and are keyed on a data-version stamp
+of the user's attendance so a new check-in retires them immediately.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from backend.config import get_settings
+from backend.database.connection import get_database
+from backend.utils import events
+
+settings = get_settings()
+
+LLM_CACHE_PATH = "ai-models/llm_cache.sqlite"
+
+# Seconds a response stays valid per agent (data changes are handled by the version stamp)
+AGENT_TTLS = {
+    "AttendanceAgent": 6 * 3600,
+    "SecurityAgent": 3600,
+    "PredictionAgent": 12 * 3600,
+    "ProgressAgent": 24 * 3600,
+    "MessageAgent": 600,
+}
+DEFAULT_TTL = 3600
+
+# Rough blended USD price per 1K tokens, only used to report savings
+PRICE_PER_1K_TOKENS = {"openai": 0.0006, "gemini": 0.0003, "mock": 0.0}
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so formatting-only differences share an entry"""
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token, good enough for cost reporting"""
+    return math.ceil(len(text) / 4)
+
+
+def make_key(provider: str, model: Optional[str], prompt: str, max_tokens: int, version: str = "") -> str:
+    raw = "\x1f".join([provider, model or "", normalize_prompt(prompt), str(max_tokens), version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskTier:
+    """SQLite table of key -> (response, expires_at); calls are blocking"""
+
+    def __init__(self, path: str = LLM_CACHE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache "
+            "(key TEXT PRIMARY KEY, response TEXT, provider TEXT, expires_at REAL)"
+        )
+        self.conn.commit()
+        self.lock = asyncio.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, str, float]]:
+        row = self.conn.execute(
+            "SELECT response, provider, expires_at FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[2] <= time.time():
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self.conn.commit()
+            return None
+        return row
+
+    def set(self, key: str, response: str, provider: str, expires_at: float):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)",
+            (key, response, provider, expires_at)
+        )
+        self.conn.commit()
+
+    def purge_expired(self) -> int:
+        deleted = self.conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        self.conn.commit()
+        return deleted
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class LLMResponseCache:
+    """LRU of prompt hash -> (response, provider, expires_at) with hit and cost accounting"""
+
+    def __init__(self, max_entries: int = None, disk: Optional[DiskTier] = None):
+        self.max_entries = max_entries or settings.LLM_CACHE_MAX_ENTRIES
+        self.disk = disk
+        self._entries: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.cost_saved = 0.0
+        self.by_agent: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, agent: Optional[str], field: str):
+        counters = self.by_agent.setdefault(agent or "direct", {"hits": 0, "misses": 0})
+        counters[field] += 1
+
+    def _credit(self, prompt: str, entry: Tuple[str, str, float]):
+        """A hit avoided one provider round trip: prompt plus completion tokens"""
+        tokens = estimate_tokens(prompt) + estimate_tokens(entry[0])
+        self.tokens_saved += tokens
+        self.cost_saved += tokens / 1000 * PRICE_PER_1K_TOKENS.get(entry[1], 0.0)
+
+    async def get(self, key: str, prompt: str, agent: Optional[str] = None) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] <= time.time():
+            del self._entries[key]
+            entry = None
+
+        if entry is None and self.disk is not None:
+            async with self.disk.lock:
+                entry = await asyncio.to_thread(self.disk.get, key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+
+        if entry is None:
+            self.misses += 1
+            self._count(agent, "misses")
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self._count(agent, "hits")
+        self._credit(prompt, entry)
+        return entry[0]
+
+    def _remember(self, key: str, entry: Tuple[str, str, float]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def set(self, key: str, response: str, provider: str, agent: Optional[str] = None):
+        expires_at = time.time() + AGENT_TTLS.get(agent, DEFAULT_TTL)
+        self._remember(key, (response, provider, expires_at))
+        if self.disk is not None:
+            async with self.disk.lock:
+                await asyncio.to_thread(self.disk.set, key, response, provider, expires_at)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk_entries": self.disk.count() if self.disk is not None else None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "estimated_cost_saved_usd": round(self.cost_saved, 4),
+            "by_agent": self.by_agent,
+        }
+
+
+llm_cache = LLMResponseCache(disk=DiskTier() if settings.LLM_CACHE_DISK else None)
+
+# user_id -> attendance version stamp, dropped whenever that user's attendance changes
+_versions: Dict[Any, str] = {}
+_version_generation = [0]
+
+
+def _forget_version(user_id=None, **_):
+    _version_generation[0] += 1
+    if user_id is None:
+        _versions.clear()
+    else:
+        _versions.pop(user_id, None)
+
+events.subscribe(events.ATTENDANCE, _forget_version)
+
+
+async def attendance_version(user_id: str) -> str:
+    """
+    Stamp that changes whenever the user's attendance does
+
+    Derived from the data (record count plus the newest record's id and
+    check-out) so it stays valid across restarts for the disk tier.
+    """
+    stamp = _versions.get(user_id)
+    if stamp is not None:
+        return stamp
+
+    generation = _version_generation[0]
+    db = await get_database()
+    count = await db.attendance.count_documents({"user_id": user_id})
+    latest = await db.attendance.find(
+        {"user_id": user_id}, {"_id": 1, "check_out": 1}
+    ).sort("_id", -1).limit(1).to_list(length=1)
+    newest = latest[0] if latest else {}
+    stamp = f"{count}:{newest.get('_id', '')}:{newest.get('check_out', '')}"
+    # A check-in that landed while reading makes this stamp stale: use it, don't keep it
+    if generation == _version_generation[0]:
+        _versions[user_id] = stamp
+    return stamp
@@ -1,109 +1,375 @@
 """
 LLM Client with auto-healing and fallback support
-Supports OpenAI, Google Gemini, and mock responses
+Supports OpenAI, Google Gemini, and mock responses through pluggable
+async transports with per-provider concurrency limits and timeouts
 """
-import os
-from typing import Optional
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple
 
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
+import aiohttp
+import numpy as np
 
-OPENAI_AVAILABLE = False
-GENAI_AVAILABLE = False
+from backend.config import get_settings
+from backend.modules.ai.llm_cache import llm_cache, make_key, attendance_version
+from backend.modules.ai.llm_router import ProviderRouter
+from backend.modules.ai.vector_store import SimpleVectorStore  # noqa: F401 (kept importable from here)
+from backend.utils.singleflight import SingleFlight
 
-if OPENAI_API_KEY:
-    try:
-        import openai
-        openai.api_key = OPENAI_API_KEY
-        OPENAI_AVAILABLE = True
-    except Exception:
-        pass
+settings = get_settings()
 
-if GEMINI_API_KEY:
-    try:
-        import google.generativeai as genai
-        genai.configure(api_key=GEMINI_API_KEY)
-        GENAI_AVAILABLE = True
-    except Exception:
+
+class LLMError(Exception):
+    """Raised by a transport when its provider fails or times out"""
+
+
+class Transport:
+    """A way of turning a prompt into a completion (one per provider)"""
+    
+    name = "base"
+    model: Optional[str] = None
+    
+    def __init__(self, max_concurrency: int = None):
+        self.semaphore = asyncio.Semaphore(max_concurrency or settings.LLM_MAX_CONCURRENCY)
+    
+    async def complete(self, prompt: str, max_tokens: int) -> str:
+        raise NotImplementedError
+    
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        """Yield the completion in chunks as they arrive (one chunk unless overridden)"""
+        yield await self.complete(prompt, max_tokens)
+    
+    async def close(self):
         pass
 
 
-class LLMClient:
-    """Universal LLM client with auto-healing and fallback"""
+class HTTPTransport(Transport):
+    """Shared aiohttp session with connect/read timeouts"""
+    
+    def __init__(self, connect_timeout: float = None, read_timeout: float = None, max_concurrency: int = None):
+        super().__init__(max_concurrency)
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout or settings.LLM_CONNECT_TIMEOUT,
+            sock_read=read_timeout or settings.LLM_READ_TIMEOUT
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
     
-    def __init__(self):
-        self.provider = None
-        self.retry_count = 0
+    async def post_json(self, url: str, payload: dict, headers: dict = None) -> dict:
+        try:
+            async with self.session().post(url, json=payload, headers=headers) as resp:
+                if resp.status >= 400:
+                    raise LLMError(f"{self.name} HTTP {resp.status}: {(await resp.text())[:200]}")
+                return await resp.json()
+        except asyncio.TimeoutError:
+            raise LLMError(f"{self.name} timed out")
+        except aiohttp.ClientError as e:
+            raise LLMError(f"{self.name} connection error: {e}")
+    
+    async def post_sse(self, url: str, payload: dict, headers: dict = None) -> AsyncIterator[dict]:
+        """
+        Yield each `data:` event of a server-sent event stream as JSON
         
-        if OPENAI_AVAILABLE:
-            self.provider = 'openai'
-        elif GENAI_AVAILABLE:
-            self.provider = 'gemini'
-        else:
-            self.provider = 'mock'
-    
-    def _try_openai(self, prompt: str, max_tokens: int = 200) -> str:
-        """Try OpenAI with auto-fallback"""
+        Closing the generator (e.g. the client went away) closes the
+        response, which aborts the upstream request.
+        """
         try:
-            import openai
-            resp = openai.ChatCompletion.create(
-                model='gpt-4o-mini',
-                messages=[{'role': 'user', 'content': prompt}],
-                max_tokens=max_tokens,
-                temperature=0.7
-            )
-            return resp['choices'][0]['message']['content'].strip()
-        except Exception as e:
-            print(f'🔧 OpenAI Error (auto-healing): {e}. Falling back to Gemini...')
-            return self._try_gemini(prompt, max_tokens)
-    
-    def _try_gemini(self, prompt: str, max_tokens: int = 200) -> str:
-        """Try Gemini with auto-fallback"""
+            async with self.session().post(url, json=payload, headers=headers) as resp:
+                if resp.status >= 400:
+                    raise LLMError(f"{self.name} HTTP {resp.status}: {(await resp.text())[:200]}")
+                async for raw in resp.content:
+                    line = raw.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        return
+                    yield json.loads(data)
+        except asyncio.TimeoutError:
+            raise LLMError(f"{self.name} timed out")
+        except aiohttp.ClientError as e:
+            raise LLMError(f"{self.name} connection error: {e}")
+    
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class OpenAITransport(HTTPTransport):
+    """OpenAI-compatible /chat/completions over HTTP"""
+    
+    name = "openai"
+    
+    def __init__(self, api_key: str, base_url: str = None, model: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+        self.base_url = (base_url or settings.OPENAI_BASE_URL).rstrip("/")
+        self.model = model or settings.OPENAI_MODEL
+    
+    async def complete(self, prompt: str, max_tokens: int) -> str:
+        data = await self.post_json(
+            f"{self.base_url}/chat/completions",
+            {
+                "model": self.model,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_tokens,
+                "temperature": 0.7
+            },
+            headers={"Authorization": f"Bearer {self.api_key}"}
+        )
         try:
-            import google.generativeai as genai
-            model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            response = model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            print(f'🔧 Gemini Error (auto-healing): {e}. Using mock...')
-            return self._mock_response(prompt)
-    
-    def _mock_response(self, prompt: str) -> str:
-        """Mock response for testing"""
-        if 'anomaly' in prompt.lower():
-            return 'NORMAL - No anomalies detected'
-        if 'attendance' in prompt.lower():
-            return 'Attendance pattern looks good. Keep up the consistency!'
-        if 'learning' in prompt.lower() or 'recommend' in prompt.lower():
-            return 'Recommended: Focus on core fundamentals, then advance to specialized topics'
-        return prompt[:120] + '...' if len(prompt) > 120 else prompt
-    
-    def chat(self, prompt: str, max_tokens: int = 200) -> str:
-        """Universal chat with auto-healing and fallback"""
-        if self.provider == 'openai':
-            return self._try_openai(prompt, max_tokens)
-        elif self.provider == 'gemini':
-            return self._try_gemini(prompt, max_tokens)
-        else:
-            return self._mock_response(prompt)
-    
-    def summarize(self, text: str, max_tokens: int = 200) -> str:
+            return data["choices"][0]["message"]["content"].strip()
+        except (KeyError, IndexError, TypeError, AttributeError):
+            raise LLMError("openai returned an unexpected payload")
+    
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        events = self.post_sse(
+            f"{self.base_url}/chat/completions",
+            {
+                "model": self.model,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_tokens,
+                "temperature": 0.7,
+                "stream": True
+            },
+            headers={"Authorization": f"Bearer {self.api_key}"}
+        )
+        async for event in events:
+            choices = event.get("choices") or [{}]
+            chunk = (choices[0].get("delta") or {}).get("content")
+            if chunk:
+                yield chunk
+
+
+class GeminiTransport(HTTPTransport):
+    """Gemini generateContent over HTTP"""
+    
+    name = "gemini"
+    
+    def __init__(self, api_key: str, base_url: str = None, model: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+        self.base_url = (base_url or settings.GEMINI_BASE_URL).rstrip("/")
+        self.model = model or settings.GEMINI_MODEL
+    
+    async def complete(self, prompt: str, max_tokens: int) -> str:
+        data = await self.post_json(
+            f"{self.base_url}/models/{self.model}:generateContent?key={self.api_key}",
+            {
+                "contents": [{"parts": [{"text": prompt}]}],
+                "generationConfig": {"maxOutputTokens": max_tokens}
+            }
+        )
+        try:
+            return data["candidates"][0]["content"]["parts"][0]["text"].strip()
+        except (KeyError, IndexError, TypeError, AttributeError):
+            raise LLMError("gemini returned an unexpected payload")
+    
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        events = self.post_sse(
+            f"{self.base_url}/models/{self.model}:streamGenerateContent?alt=sse&key={self.api_key}",
+            {
+                "contents": [{"parts": [{"text": prompt}]}],
+                "generationConfig": {"maxOutputTokens": max_tokens}
+            }
+        )
+        async for event in events:
+            try:
+                chunk = event["candidates"][0]["content"]["parts"][0]["text"]
+            except (KeyError, IndexError, TypeError):
+                continue
+            if chunk:
+                yield chunk
+
+
+class MockTransport(Transport):
+    """Canned responses for offline use and testing"""
+    
+    name = "mock"
+    model = "mock"
+    
+    async def complete(self, prompt: str, max_tokens: int) -> str:
+        return mock_response(prompt)
+    
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        async for chunk in stream_words(mock_response(prompt)):
+            yield chunk
+
+
+def mock_response(prompt: str) -> str:
+    """Mock response for testing"""
+    if 'anomaly' in prompt.lower():
+        return 'NORMAL - No anomalies detected'
+    if 'attendance' in prompt.lower():
+        return 'Attendance pattern looks good. Keep up the consistency!'
+    if 'learning' in prompt.lower() or 'recommend' in prompt.lower():
+        return 'Recommended: Focus on core fundamentals, then advance to specialized topics'
+    return prompt[:120] + '...' if len(prompt) > 120 else prompt
+
+
+MOCK_STREAM_DELAY = 0.02  # seconds between mock tokens, so streaming is observable offline
+
+
+async def stream_words(text: str, delay: float = MOCK_STREAM_DELAY) -> AsyncIterator[str]:
+    """Yield `text` word by word (keeping the spaces) like a provider would"""
+    words = text.split(" ")
+    for i, word in enumerate(words):
+        if i:
+            await asyncio.sleep(delay)
+        yield word if i == len(words) - 1 else word + " "
+
+
+def default_transports() -> List[Transport]:
+    """OpenAI, then Gemini (when keys are configured), then mock"""
+    transports: List[Transport] = []
+    if settings.OPENAI_API_KEY:
+        transports.append(OpenAITransport(settings.OPENAI_API_KEY))
+    if settings.GEMINI_API_KEY:
+        transports.append(GeminiTransport(settings.GEMINI_API_KEY))
+    transports.append(MockTransport())
+    return transports
+
+
+async def run_until_disconnected(request, coro: Awaitable, poll_interval: float = 0.25):
+    """
+    Await `coro`, cancelling it (and any upstream LLM request) if the
+    HTTP client goes away first
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise asyncio.CancelledError("client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+class TTFBTracker:
+    """Recent time-to-first-byte samples per response mode"""
+    
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self.counts: Dict[str, int] = {}
+    
+    def record(self, mode: str, seconds: float):
+        self._samples.setdefault(mode, deque(maxlen=self.window)).append(seconds)
+        self.counts[mode] = self.counts.get(mode, 0) + 1
+    
+    def stats(self) -> Dict[str, Any]:
+        out = {}
+        for mode, samples in self._samples.items():
+            values = np.fromiter(samples, dtype=np.float64) * 1000
+            out[mode] = {
+                "count": self.counts[mode],
+                "p50_ms": round(float(np.percentile(values, 50)), 1),
+                "p95_ms": round(float(np.percentile(values, 95)), 1),
+                "last_ms": round(float(values[-1]), 1),
+            }
+        return out
+
+
+ttfb_tracker = TTFBTracker()
+
+
+class LLMClient:
+    """Universal async LLM client with auto-healing and fallback"""
+    
+    def __init__(self, transports: Optional[List[Transport]] = None, cache=llm_cache):
+        self.transports = transports or default_transports()
+        self.provider = self.transports[0].name
+        self.cache = cache
+        self.flight = SingleFlight()
+        self.router = ProviderRouter(self.transports)
+    
+    async def _complete_with_fallback(self, prompt: str, max_tokens: int) -> Tuple[Transport, str]:
+        """Best available provider via the router (circuit breakers, hedging, mock last)"""
+        return await self.router.complete(prompt, max_tokens)
+    
+    async def chat(self, prompt: str, max_tokens: int = 200, agent: str = None, user_id: str = None) -> str:
+        """
+        Universal chat with auto-healing and fallback
+        
+        Responses are cached per agent; passing `user_id` also keys the
+        entry on that user's attendance so new check-ins invalidate it.
+        """
+        if self.cache is None:
+            return (await self.flight.do(
+                (prompt, max_tokens), lambda: self._complete_with_fallback(prompt, max_tokens)
+            ))[1]
+        
+        primary = self.transports[0]
+        version = await attendance_version(user_id) if user_id is not None else ""
+        key = make_key(primary.name, primary.model, prompt, max_tokens, version)
+        cached = await self.cache.get(key, prompt, agent)
+        if cached is not None:
+            return cached
+        
+        async def fetch() -> str:
+            transport, response = await self._complete_with_fallback(prompt, max_tokens)
+            # Last-resort mock answers are a degraded result for this key: don't keep them
+            if transport is primary or transport is not self.router.fallback:
+                await self.cache.set(key, response, transport.name, agent)
+            return response
+        
+        # Identical prompts already on their way to the provider share that request
+        return await self.flight.do(key, fetch)
+    
+    async def stream(self, prompt: str, max_tokens: int = 200, agent: str = None) -> AsyncIterator[str]:
+        """
+        Yield the completion as the provider produces it
+        
+        A cached answer is yielded in one chunk; a fresh one is cached
+        once the stream finishes, like `chat`.
+        """
+        primary = self.transports[0]
+        key = make_key(primary.name, primary.model, prompt, max_tokens) if self.cache is not None else None
+        if key is not None:
+            cached = await self.cache.get(key, prompt, agent)
+            if cached is not None:
+                yield cached
+                return
+        
+        chunks, answered_by = [], None
+        async for transport, chunk in self.router.stream(prompt, max_tokens):
+            answered_by = transport
+            chunks.append(chunk)
+            yield chunk
+        
+        if key is not None and answered_by is not None and (answered_by is primary or answered_by is not self.router.fallback):
+            await self.cache.set(key, "".join(chunks).strip(), answered_by.name, agent)
+    
+    async def close(self):
+        for transport in self.transports:
+            await transport.close()
+    
+    async def summarize(self, text: str, max_tokens: int = 200, **scope) -> str:
         """Summarize with intelligent fallback"""
         prompt = f"Summarize concisely: {text}"
-        return self.chat(prompt, max_tokens)
+        return await self.chat(prompt, max_tokens, **scope)
     
-    def detect_anomaly_ai(self, data: str) -> str:
+    async def detect_anomaly_ai(self, data: str, **scope) -> str:
         """AI-powered anomaly detection"""
         prompt = f"Analyze this attendance data for anomalies: {data}. Return: 'NORMAL' or describe the anomaly."
-        result = self.chat(prompt, max_tokens=100)
+        result = await self.chat(prompt, max_tokens=100, **scope)
         return result
     
-    def analyze_attendance(self, user_data: str) -> str:
+    async def analyze_attendance(self, user_data: str, **scope) -> str:
         """Intelligent attendance analysis"""
         prompt = f"Analyze attendance patterns: {user_data}. Provide insights and recommendations (2-3 lines)."
-        return self.chat(prompt, max_tokens=150)
+        return await self.chat(prompt, max_tokens=150, **scope)
     
-    def recommend_learning_path(self, logs_text: str) -> str:
+    async def recommend_learning_path(self, logs_text: str, **scope) -> str:
         """AI learning path recommendation"""
         if self.provider == 'mock':
             if 'tensorflow' in logs_text.lower() or 'pytorch' in logs_text.lower():
@@ -113,37 +379,4 @@ class LLMClient:
             return 'Core ML: Linear Models → Neural Networks → Advanced'
         
         prompt = f"Learning path for: {logs_text}\nProvide 2-line recommendation."
-        return self.chat(prompt, max_tokens=150)
-
-
-class SimpleVectorStore:
-    """Simple vector store for semantic search"""
-    
-    def __init__(self, dim: int = 32):
-        self.dim = dim
-        self.items = []
-    
-    def _text_to_vec(self, text: str):
-        """Convert text to vector using hash"""
-        import hashlib
-        h = hashlib.sha256(text.encode()).digest()
-        vec = [b for b in h[:self.dim]]
-        norm = sum(v * v for v in vec) ** 0.5
-        if norm == 0:
-            norm = 1.0
-        return [v / norm for v in vec]
-    
-    def add(self, _id: str, text: str):
-        """Add item to vector store"""
-        v = self._text_to_vec(text)
-        self.items.append((_id, text, v))
-    
-    def query(self, text: str, k: int = 3):
-        """Query vector store"""
-        qv = self._text_to_vec(text)
-        sims = []
-        for _id, t, v in self.items:
-            dot = sum(a * b for a, b in zip(qv, v))
-            sims.append((_id, t, dot))
-        sims.sort(key=lambda x: x[2], reverse=True)
-        return sims[:k]
+        return await self.chat(prompt, max_tokens=150, **scope)
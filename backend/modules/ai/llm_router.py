@@ -0,0 +1,279 @@
+"""
+LLM Provider Router
+Orders providers by an EWMA latency/error score, skips providers whose
+circuit breaker is open, optionally hedges slow calls to the next
+provider, and always keeps the mock as the last resort
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.config import get_settings
+from backend.utils.logger import get_logger
+from backend.utils.metrics import llm_latency
+
+settings = get_settings()
+
+logger = get_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+EWMA_ALPHA = 0.2
+LATENCY_WINDOW = 200       # recent latencies kept for the hedging percentile
+MIN_HEDGE_DELAY = 0.05     # seconds; never hedge faster than this
+MIN_HEDGE_SAMPLES = 20
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider's circuit refuses a call"""
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open probe after a cool-down"""
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self.failure_threshold = failure_threshold or settings.LLM_BREAKER_FAILURES
+        self.reset_timeout = reset_timeout if reset_timeout is not None else settings.LLM_BREAKER_RESET
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+
+    def _refresh(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self.probing = False
+
+    def available(self) -> bool:
+        """Whether a call would currently be let through (no side effects)"""
+        self._refresh()
+        return self.state == CLOSED or (self.state == HALF_OPEN and not self.probing)
+
+    def allow(self) -> bool:
+        """Claim permission for one call; in half-open only a single probe gets it"""
+        if not self.available():
+            return False
+        if self.state == HALF_OPEN:
+            self.probing = True
+        return True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """A probe that was cancelled tells us nothing: let the next request probe"""
+        self.probing = False
+
+
+class ProviderHealth:
+    """EWMA latency and error rate plus a latency window for percentiles"""
+
+    def __init__(self):
+        self.ewma_latency: Optional[float] = None
+        self.ewma_error = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.failures = 0
+
+    def observe(self, latency: float, ok: bool):
+        self.requests += 1
+        self.ewma_error = (1 - EWMA_ALPHA) * self.ewma_error + EWMA_ALPHA * (0.0 if ok else 1.0)
+        if ok:
+            self.latencies.append(latency)
+            self.ewma_latency = latency if self.ewma_latency is None else (
+                (1 - EWMA_ALPHA) * self.ewma_latency + EWMA_ALPHA * latency
+            )
+        else:
+            self.failures += 1
+
+    def score(self) -> float:
+        """Lower is better: expected latency inflated by the recent error rate"""
+        return (self.ewma_latency or 0.0) * (1 + 4 * self.ewma_error) + self.ewma_error
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return float(np.percentile(np.fromiter(self.latencies, dtype=np.float64), q))
+
+
+class ProviderRouter:
+    """Routes one completion across transports; the last transport is the fallback of last resort"""
+
+    def __init__(self, transports: List[Any], hedge_percentile: float = None):
+        self.transports = transports
+        self.fallback = transports[-1]
+        self.hedge_percentile = settings.LLM_HEDGE_PERCENTILE if hedge_percentile is None else hedge_percentile
+        self.breakers = {t.name: CircuitBreaker() for t in transports}
+        self.health = {t.name: ProviderHealth() for t in transports}
+        self.fast_fails = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def candidates(self) -> List[Any]:
+        """Providers whose circuit allows a call, best score first (mock excluded)"""
+        ranked = sorted(self.transports[:-1], key=lambda t: self.health[t.name].score())
+        return [t for t in ranked if self.breakers[t.name].available()]
+
+    async def _call(self, transport, prompt: str, max_tokens: int) -> str:
+        breaker, health = self.breakers[transport.name], self.health[transport.name]
+        if transport is not self.fallback and not breaker.allow():
+            raise CircuitOpenError(f"{transport.name} circuit is {breaker.state}")
+        started = time.perf_counter()
+        try:
+            async with transport.semaphore:
+                result = await transport.complete(prompt, max_tokens)
+        except asyncio.CancelledError:
+            llm_latency.observe(time.perf_counter() - started, transport.name, "complete", "cancelled")
+            breaker.release()
+            raise
+        except Exception:
+            elapsed = time.perf_counter() - started
+            llm_latency.observe(elapsed, transport.name, "complete", "error")
+            health.observe(elapsed, ok=False)
+            breaker.record_failure()
+            raise
+        elapsed = time.perf_counter() - started
+        llm_latency.observe(elapsed, transport.name, "complete", "ok")
+        health.observe(elapsed, ok=True)
+        breaker.record_success()
+        return result
+
+    async def _hedged(self, first, second, prompt: str, max_tokens: int, delay: float) -> Tuple[Any, str]:
+        """
+        Start `first`; if it is still running after `delay`, race `second` against it
+
+        If `first` fails before the delay, `second` is tried straight away
+        so a hedge partner is never skipped on a fast failure.
+        """
+        tasks = {asyncio.ensure_future(self._call(first, prompt, max_tokens)): first}
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                hedged = True
+                self.hedges += 1
+                tasks[asyncio.ensure_future(self._call(second, prompt, max_tokens))] = second
+            elif next(iter(done)).exception() is not None:
+                tasks[asyncio.ensure_future(self._call(second, prompt, max_tokens))] = second
+            errors = []
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    transport = tasks.pop(task)
+                    if task.exception() is None:
+                        if hedged and transport is second:
+                            self.hedge_wins += 1
+                        return transport, task.result()
+                    errors.append(task.exception())
+            raise errors[-1]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def complete(self, prompt: str, max_tokens: int) -> Tuple[Any, str]:
+        """(transport that answered, text), falling back down the ranked providers"""
+        candidates = self.candidates()
+        if not candidates:
+            # Every real provider is open: answer now instead of waiting on timeouts
+            if len(self.transports) > 1:
+                self.fast_fails += 1
+            return self.fallback, await self._call(self.fallback, prompt, max_tokens)
+
+        while candidates:
+            transport = candidates.pop(0)
+            delay = self.health[transport.name].percentile(self.hedge_percentile) if self.hedge_percentile else None
+            try:
+                if delay is not None and candidates:
+                    return await self._hedged(transport, candidates.pop(0), prompt, max_tokens, max(delay, MIN_HEDGE_DELAY))
+                return transport, await self._call(transport, prompt, max_tokens)
+            except Exception as e:
+                logger.warning("%s error (auto-healing): %s. Falling back...", transport.name, e)
+
+        return self.fallback, await self._call(self.fallback, prompt, max_tokens)
+
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[Tuple[Any, str]]:
+        """
+        Yield (transport, chunk) from the best available provider
+
+        Falls back only until the first chunk has been sent; after that
+        a provider error ends the stream. Hedging does not apply.
+        """
+        candidates = self.candidates()
+        if not candidates and len(self.transports) > 1:
+            self.fast_fails += 1
+
+        for transport in candidates + [self.fallback]:
+            breaker, health = self.breakers[transport.name], self.health[transport.name]
+            if transport is not self.fallback and not breaker.allow():
+                continue
+            started = time.perf_counter()
+            emitted = False
+            try:
+                async with transport.semaphore:
+                    async for chunk in transport.stream(prompt, max_tokens):
+                        if not emitted:
+                            emitted = True
+                            breaker.record_success()
+                        yield transport, chunk
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                llm_latency.observe(elapsed, transport.name, "stream", "error")
+                health.observe(elapsed, ok=False)
+                breaker.record_failure()
+                if emitted:
+                    raise
+                logger.warning("%s stream error (auto-healing): %s. Falling back...", transport.name, e)
+                continue
+            except BaseException:
+                # Cancelled or closed by the consumer: no verdict on the provider
+                llm_latency.observe(time.perf_counter() - started, transport.name, "stream", "cancelled")
+                if not emitted:
+                    breaker.release()
+                raise
+            elapsed = time.perf_counter() - started
+            llm_latency.observe(elapsed, transport.name, "stream", "ok")
+            health.observe(elapsed, ok=True)
+            breaker.record_success()
+            return
+
+    def status(self) -> Dict[str, Any]:
+        providers = {}
+        for t in self.transports:
+            breaker, health = self.breakers[t.name], self.health[t.name]
+            p50, p95 = health.percentile(50), health.percentile(95)
+            providers[t.name] = {
+                "model": t.model,
+                "circuit": breaker.state,
+                "consecutive_failures": breaker.failures,
+                "times_opened": breaker.times_opened,
+                "ewma_latency_ms": round(health.ewma_latency * 1000, 1) if health.ewma_latency is not None else None,
+                "ewma_error_rate": round(health.ewma_error, 4),
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "requests": health.requests,
+                "failures": health.failures,
+                "score": round(health.score(), 4),
+            }
+        return {
+            "providers": providers,
+            "order": [t.name for t in self.candidates()] + [self.fallback.name],
+            "fast_fails": self.fast_fails,
+            "hedging": {"percentile": self.hedge_percentile or None, "hedges": self.hedges, "hedge_wins": self.hedge_wins},
+        }
@@ -1,28 +1,81 @@
-from fastapi import APIRouter, HTTPException
+import json
+import time
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from backend.modules.ai.llm import llm_service
-from backend.modules.attendance.service import get_attendance_history
+from backend.modules.ai.llm_client import run_until_disconnected, ttfb_tracker
+from backend.modules.ai.context import build_user_context
 from backend.database.connection import get_database
 
 router = APIRouter(tags=["AI"])
 
+STREAM_MEDIA_TYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+def _frame(fmt: str, payload: dict, event: str = None) -> str:
+    data = json.dumps(payload)
+    if fmt == "ndjson":
+        return data + "\n"
+    return (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
+
+async def _stream_chat(fmt: str, prompt: str, context: str, started: float):
+    """
+    Forward provider chunks as they arrive
+
+    Each chunk is only pulled from the provider once the previous one has
+    been handed to the server (backpressure), and a client disconnect
+    closes this generator, which aborts the upstream request.
+    """
+    ttfb = None
+    try:
+        async for chunk in llm_service.stream_response(prompt, context):
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+                ttfb_tracker.record("stream", ttfb)
+            yield _frame(fmt, {"token": chunk})
+    except Exception as e:
+        yield _frame(fmt, {"error": str(e)}, event="error")
+        return
+    yield _frame(fmt, {
+        "done": True,
+        "ttfb_ms": round(ttfb * 1000, 1) if ttfb is not None else None,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1)
+    }, event="done")
+
 @router.post("/chat")
-async def chat(prompt: str, context: str = ""):
-    response = await llm_service.generate_response(prompt, context)
+async def chat(request: Request, prompt: str, context: str = "", stream: Optional[str] = None):
+    """Chat with the assistant; ?stream=sse or ?stream=ndjson streams tokens as they arrive"""
+    started = time.perf_counter()
+    if stream is not None:
+        if stream not in STREAM_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail="stream must be 'sse' or 'ndjson'")
+        return StreamingResponse(
+            _stream_chat(stream, prompt, context, started),
+            media_type=STREAM_MEDIA_TYPES[stream],
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    response = await run_until_disconnected(request, llm_service.generate_response(prompt, context))
+    ttfb_tracker.record("full", time.perf_counter() - started)
     return {"response": response}
 
+@router.get("/chat/stats")
+async def chat_stats():
+    """Time-to-first-byte of streamed vs. full chat responses"""
+    return {"ttfb": ttfb_tracker.stats()}
+
 @router.get("/insights/{user_id}")
-async def get_insights(user_id: str):
+async def get_insights(request: Request, user_id: str):
     try:
         # Fetch user name (mock for now, should fetch from DB)
         db = await get_database()
         user = await db.users.find_one({"_id": user_id})
         user_name = user["name"] if user else "User"
         
-        history = await get_attendance_history(user_id)
-        # Convert datetime objects to string for JSON serialization/prompt
-        history_str = [{"timestamp": str(h["timestamp"]), "status": h.get("status", "Present")} for h in history[:10]]
+        # Fixed-size numeric summary of the whole history instead of raw records
+        summary = await build_user_context(user_id, agent="chat")
         
-        insight = await llm_service.analyze_attendance(history_str, user_name)
+        insight = await run_until_disconnected(request, llm_service.analyze_attendance(summary, user_name))
         return {"insight": insight}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
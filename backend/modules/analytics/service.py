@@ -1,7 +1,19 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+import asyncio
 import numpy as np
+import pytz
 from backend.database.connection import get_database
-from typing import List, Dict, Any
+from backend.modules.analytics.records import record_day_and_minute, segment_starts
+from backend.modules.analytics.streaks import compute_streaks, prime_streaks
+from backend.utils import events
+from backend.utils.timezone import get_nepal_date
+from typing import List, Dict, Any, Optional
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+# Look-back window used for anomaly scores and pattern classification
+ANALYTICS_WINDOW_DAYS = 30
+MIN_CHECKINS_FOR_PATTERN = 5
 
 async def get_user_attendance_history(user_id: str, days: int = 30) -> List[datetime]:
     db = await get_database()
@@ -56,29 +68,166 @@ def classify_pattern(check_in_times: List[datetime]) -> str:
     else:
         return "Regular"
 
+# ---------------------------------------------------------------------------
+# Lab-wide (cohort) analytics
+# ---------------------------------------------------------------------------
+
+def compute_lab_analytics(records: List[dict], user_ids: List[str], today: Optional[date] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Compute analytics for every user in one vectorized pass
+
+    Records are flattened into NumPy arrays, sorted into one contiguous
+    segment per user and reduced with `np.add.reduceat`, so the cost is a
+    single sort regardless of how many members the lab has.
+    """
+    today_ord = (today or get_nepal_date()).toordinal()
+    window_start = today_ord - ANALYTICS_WINDOW_DAYS
+
+    ids = list(dict.fromkeys(list(user_ids) + [r.get("user_id") for r in records if r.get("user_id") is not None]))
+    index = {uid: i for i, uid in enumerate(ids)}
+    n_users = len(ids)
+
+    codes, days, minutes = [], [], []
+    for record in records:
+        uid = record.get("user_id")
+        if uid is None:
+            continue
+        day, minute = record_day_and_minute(record)
+        if day is None:
+            continue
+        codes.append(index[uid])
+        days.append(day)
+        minutes.append(minute)
+
+    codes = np.asarray(codes, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    minutes = np.asarray(minutes, dtype=np.float64)
+
+    order = np.lexsort((days, codes))
+    codes, days, minutes = codes[order], days[order], minutes[order]
+
+    present = ~np.isnan(minutes)
+    in_window = present & (days >= window_start)
+
+    total_records = np.bincount(codes, minlength=n_users)
+    present_days = np.bincount(codes, weights=present, minlength=n_users).astype(np.int64)
+
+    count = np.zeros(n_users, dtype=np.int64)
+    total = np.zeros(n_users)
+    total_sq = np.zeros(n_users)
+    latest = np.full(n_users, np.nan)
+
+    starts = segment_starts(codes)
+    if starts.size:
+        users = codes[starts]
+        w_minutes = np.where(in_window, minutes, 0.0)
+        count[users] = np.add.reduceat(in_window.astype(np.int64), starts)
+        total[users] = np.add.reduceat(w_minutes, starts)
+        total_sq[users] = np.add.reduceat(w_minutes * w_minutes, starts)
+        # Position of the last in-window check-in of each segment
+        last_pos = np.maximum.reduceat(np.where(in_window, np.arange(codes.size), -1), starts)
+        has_last = last_pos >= 0
+        latest[users[has_last]] = minutes[last_pos[has_last]]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(total_sq / count - mean * mean, 0.0))
+
+        # z-score of the latest check-in against all earlier ones in the window
+        prev_n = count - 1
+        prev_mean = (total - latest) / prev_n
+        prev_std = np.sqrt(np.maximum((total_sq - latest * latest) / prev_n - prev_mean * prev_mean, 0.0))
+        z_score = np.abs(latest - prev_mean) / prev_std
+
+    scorable = (count >= MIN_CHECKINS_FOR_PATTERN) & (prev_std > 0)
+    z_score = np.where(scorable, z_score, 0.0)
+    anomaly = np.minimum(z_score / 3.0, 1.0)
+
+    # Same thresholds as classify_pattern (9:00 AM = 540 minutes)
+    pattern = np.select(
+        [
+            count < MIN_CHECKINS_FOR_PATTERN,
+            (std < 30) & (mean < 540),
+            (std < 30) & (mean > 600),
+            std < 30,
+            std > 60,
+        ],
+        ["Newcomer", "Early Bird", "Night Owl", "Consistent", "Flexible"],
+        default="Regular",
+    )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate = np.where(total_records > 0, present_days / np.maximum(total_records, 1) * 100, 0.0)
+
+    current, longest = compute_streaks(codes[present], days[present], n_users, today_ord)
+
+    result = {}
+    for i, uid in enumerate(ids):
+        result[uid] = {
+            "anomaly_score": float(anomaly[i]),
+            "z_score": round(float(z_score[i]), 3),
+            "pattern": str(pattern[i]),
+            "streak": int(current[i]),
+            "longest_streak": int(longest[i]),
+            "total_days": int(count[i]),
+            "present_days": int(present_days[i]),
+            "total_records": int(total_records[i]),
+            "attendance_rate": round(float(rate[i]), 2),
+            "average_check_in_minute": round(float(mean[i]), 1) if count[i] else None,
+        }
+    return result
+
+_lab_cache: Dict[str, Any] = {"result": None, "computed_for": None, "computed_at": None, "generation": 0}
+_lab_lock = asyncio.Lock()
+
+def invalidate_lab_analytics(**_):
+    """Drop the cached cohort result (subscribed to write events)"""
+    _lab_cache["result"] = None
+    _lab_cache["generation"] += 1
+
+events.subscribe(events.ATTENDANCE, invalidate_lab_analytics)
+events.subscribe(events.USERS, invalidate_lab_analytics)
+
+async def get_lab_analytics() -> Dict[str, Any]:
+    """Cohort analytics for every user, recomputed only after writes or at day rollover"""
+    today = get_nepal_date()
+    async with _lab_lock:
+        if _lab_cache["result"] is not None and _lab_cache["computed_for"] == today:
+            return {
+                "computed_at": _lab_cache["computed_at"].isoformat(),
+                "members": _lab_cache["result"]
+            }
+
+        generation = _lab_cache["generation"]
+        db = await get_database()
+        projection = {"user_id": 1, "date": 1, "check_in": 1, "timestamp": 1, "status": 1}
+        records = await db.attendance.find({}, projection).to_list(length=None)
+        members = await db.users.find({"role": "member"}, {"_id": 1}).to_list(length=None)
+
+        result = await asyncio.to_thread(compute_lab_analytics, records, [m["_id"] for m in members], today)
+        computed_at = datetime.now(NEPAL_TZ)
+
+        # Only keep the result if no write landed while the records were loading
+        if generation == _lab_cache["generation"]:
+            _lab_cache.update(result=result, computed_for=today, computed_at=computed_at)
+            for user_id, analytics in result.items():
+                prime_streaks(user_id, {
+                    "current_streak": analytics["streak"],
+                    "longest_streak": analytics["longest_streak"]
+                }, today)
+
+        return {"computed_at": computed_at.isoformat(), "members": result}
+
 async def get_user_analytics(user_id: str) -> Dict[str, Any]:
-    history = await get_user_attendance_history(user_id)
-    
-    if not history:
+    lab = await get_lab_analytics()
+    analytics = lab["members"].get(user_id)
+
+    if not analytics:
         return {
             "anomaly_score": 0.0,
             "pattern": "Newcomer",
             "streak": 0,
             "total_days": 0
         }
-        
-    anomaly_score = calculate_anomaly_score(history)
-    pattern = classify_pattern(history)
-    
-    # Calculate streak
-    streak = 0
-    today = datetime.now().date()
-    # Simplified streak logic
-    # In real app, check consecutive days properly handling weekends
-    
-    return {
-        "anomaly_score": anomaly_score,
-        "pattern": pattern,
-        "streak": len(history), # Placeholder for actual streak logic
-        "total_days": len(history)
-    }
+
+    return analytics
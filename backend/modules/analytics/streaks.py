@@ -0,0 +1,104 @@
+"""
+Streak engine
+Current and longest attendance streaks computed from sorted day ordinals
+on the lab calendar: days the lab is closed never break a streak
+"""
+from datetime import date
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from backend.database.connection import get_database
+from backend.modules.analytics.records import record_day_and_minute, segment_starts
+from backend.utils import events
+from backend.utils.timezone import get_nepal_date, get_lab_weekmask, get_lab_holidays
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def open_day_index(day_ordinals: np.ndarray) -> np.ndarray:
+    """
+    Map day ordinals onto consecutive lab-open-day numbers
+
+    Two attendance days are "consecutive" when their indices differ by one,
+    however many closed days lie between them. A day the lab was closed
+    maps onto the next open day.
+    """
+    weekmask = get_lab_weekmask()
+    if "1" not in weekmask:
+        weekmask = "1111111"
+    days = (np.asarray(day_ordinals, dtype=np.int64) - _EPOCH_ORDINAL).astype("datetime64[D]")
+    return np.busday_count(
+        np.datetime64("1970-01-01"), days,
+        weekmask=weekmask, holidays=get_lab_holidays()
+    ).astype(np.int64)
+
+def compute_streaks(codes: np.ndarray, days: np.ndarray, n_users: int, today: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Current and longest streaks for every user in one vectorized pass
+
+    `codes`/`days` describe present records only, sorted by (code, day).
+    Runs are found with a diff over open-day indices; a current streak is
+    alive if it reaches today or the last open day before today.
+    """
+    current = np.zeros(n_users, dtype=np.int64)
+    longest = np.zeros(n_users, dtype=np.int64)
+    if days.size == 0:
+        return current, longest
+
+    idx = open_day_index(days)
+    # Collapse duplicate (user, open day) pairs so double check-ins don't extend runs
+    keep = np.r_[True, (codes[1:] != codes[:-1]) | (idx[1:] != idx[:-1])]
+    codes, idx = codes[keep], idx[keep]
+
+    breaks = np.r_[True, (codes[1:] != codes[:-1]) | (np.diff(idx) != 1)]
+    run_id = np.cumsum(breaks) - 1
+    run_len = np.bincount(run_id)
+
+    starts = segment_starts(codes)
+    ends = np.r_[starts[1:], codes.size] - 1
+    users = codes[starts]
+
+    today_idx = open_day_index(np.array([today]))[0]
+    longest[users] = np.maximum.reduceat(run_len[run_id], starts)
+    alive = idx[ends] >= today_idx - 1
+    current[users] = np.where(alive, run_len[run_id[ends]], 0)
+    return current, longest
+
+def streaks_from_records(records: List[dict], today: Optional[date] = None) -> Dict[str, int]:
+    """Streaks for a single user's attendance records"""
+    days = [day for day, minute in map(record_day_and_minute, records) if day is not None and not np.isnan(minute)]
+    days = np.unique(np.asarray(days, dtype=np.int64))
+    codes = np.zeros(days.size, dtype=np.int64)
+    current, longest = compute_streaks(codes, days, 1, (today or get_nepal_date()).toordinal())
+    return {"current_streak": int(current[0]), "longest_streak": int(longest[0])}
+
+# Per-user cache: user_id -> (date computed for, streaks)
+_streak_cache: Dict[Any, Tuple[date, Dict[str, int]]] = {}
+
+def invalidate_streaks(user_id=None, **_):
+    """Drop cached streaks for one user (or everyone)"""
+    if user_id is None:
+        _streak_cache.clear()
+    else:
+        _streak_cache.pop(user_id, None)
+
+def prime_streaks(user_id, streaks: Dict[str, int], today: date):
+    """Seed the cache from a cohort computation"""
+    _streak_cache[user_id] = (today, streaks)
+
+events.subscribe(events.ATTENDANCE, invalidate_streaks)
+
+async def get_user_streaks(user_id: str) -> Dict[str, int]:
+    """Cached current/longest streak for a user, invalidated on new attendance"""
+    today = get_nepal_date()
+    cached = _streak_cache.get(user_id)
+    if cached and cached[0] == today:
+        return cached[1]
+
+    db = await get_database()
+    records = await db.attendance.find(
+        {"user_id": user_id},
+        {"date": 1, "check_in": 1, "timestamp": 1, "status": 1}
+    ).to_list(length=None)
+
+    streaks = streaks_from_records(records, today)
+    _streak_cache[user_id] = (today, streaks)
+    return streaks
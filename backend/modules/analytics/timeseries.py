@@ -0,0 +1,187 @@
+"""
+Lab time series
+Per-day x per-hour occupancy and arrival counts kept as compact arrays.
+Closed (past) days are computed once with a difference-array sweep and
+cached; only today is recomputed on each request.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple, Union
+import numpy as np
+import pytz
+from backend.database.connection import get_database
+from backend.utils import events
+from backend.modules.analytics.records import (
+    PRESENT_STATUSES, record_check_in_time, record_check_out_time
+)
+from backend.utils.timezone import get_nepal_date, get_nepal_time, WEEKDAYS
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+MINUTES_PER_DAY = 24 * 60
+LAB_CLOSE_MINUTE = 17 * 60
+MAX_RANGE_DAYS = 3660
+
+_RANGE_UNITS = {"d": 1, "w": 7, "m": 30, "y": 365}
+
+# day ordinal -> (occupancy[24] float32, arrivals[24] int32), closed days only
+_day_cache: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+def parse_range(value: str) -> int:
+    """Parse a range like '7d', '4w', '6m' or '1y' into a number of days"""
+    match = re.fullmatch(r"\s*(\d+)\s*([dwmy])\s*", (value or "").lower())
+    if not match:
+        raise ValueError("range must look like 7d, 4w, 6m or 1y")
+    days = int(match.group(1)) * _RANGE_UNITS[match.group(2)]
+    if not 1 <= days <= MAX_RANGE_DAYS:
+        raise ValueError(f"range must be between 1 day and {MAX_RANGE_DAYS} days")
+    return days
+
+def sweep_occupancy(day_index: np.ndarray, start: np.ndarray, end: np.ndarray, n_days: int) -> np.ndarray:
+    """
+    Occupancy per (day, hour) from check-in/check-out intervals
+
+    Each interval adds +1 at its start minute and -1 at its end minute of a
+    (n_days, 1441) difference array; a cumulative sum along the minute axis
+    gives head-count per minute, averaged into 24 hourly buckets.
+    """
+    diff = np.zeros((n_days, MINUTES_PER_DAY + 1), dtype=np.int32)
+    np.add.at(diff, (day_index, start), 1)
+    np.add.at(diff, (day_index, end), -1)
+    per_minute = np.cumsum(diff[:, :MINUTES_PER_DAY], axis=1)
+    return per_minute.reshape(n_days, 24, 60).mean(axis=2).astype(np.float32)
+
+def count_arrivals(day_index: np.ndarray, start: np.ndarray, n_days: int) -> np.ndarray:
+    """Check-ins per (day, hour) with a single bincount"""
+    counts = np.bincount(day_index * 24 + start // 60, minlength=n_days * 24)
+    return counts.reshape(n_days, 24).astype(np.int32)
+
+def _intervals(records: List[dict], first_day: int, today: int, now_minute: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Flatten records into (day offset, start minute, end minute) arrays"""
+    day_index, starts, ends = [], [], []
+    for record in records:
+        check_in = record_check_in_time(record)
+        if check_in is None:
+            continue
+        day = check_in.date().toordinal()
+        start = check_in.hour * 60 + check_in.minute
+
+        check_out = record_check_out_time(record)
+        if check_out is not None and check_out.date().toordinal() == day:
+            end = check_out.hour * 60 + check_out.minute
+        elif check_out is not None:
+            end = MINUTES_PER_DAY
+        elif day == today:
+            end = now_minute  # still in the lab
+        else:
+            # Never checked out: assume they stayed until closing (or an hour)
+            end = LAB_CLOSE_MINUTE if start < LAB_CLOSE_MINUTE else start + 60
+
+        day_index.append(day - first_day)
+        starts.append(start)
+        ends.append(min(max(end, start), MINUTES_PER_DAY))
+
+    return (
+        np.asarray(day_index, dtype=np.int64),
+        np.asarray(starts, dtype=np.int64),
+        np.asarray(ends, dtype=np.int64),
+    )
+
+async def _load_days(first_day: int, last_day: int, today: int) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """Compute occupancy/arrival rows for every day in [first_day, last_day]"""
+    db = await get_database()
+    # Face/kiosk records carry no `date`, only a timestamp
+    range_start = NEPAL_TZ.localize(datetime.combine(date.fromordinal(first_day), datetime.min.time()))
+    range_end = range_start + timedelta(days=last_day - first_day + 1)
+    records = await db.attendance.find(
+        {
+            "$or": [
+                {"date": {"$gte": date.fromordinal(first_day).isoformat(), "$lte": date.fromordinal(last_day).isoformat()}},
+                {"date": None, "timestamp": {"$gte": range_start, "$lt": range_end}},
+            ],
+            "status": {"$in": PRESENT_STATUSES}
+        },
+        {"check_in": 1, "check_out": 1, "timestamp": 1, "status": 1}
+    ).to_list(length=None)
+
+    now = get_nepal_time()
+    n_days = last_day - first_day + 1
+    day_index, start, end = _intervals(records, first_day, today, now.hour * 60 + now.minute)
+    keep = (day_index >= 0) & (day_index < n_days)
+    day_index, start, end = day_index[keep], start[keep], end[keep]
+
+    occupancy = sweep_occupancy(day_index, start, end, n_days)
+    arrivals = count_arrivals(day_index, start, n_days)
+    return {first_day + i: (occupancy[i], arrivals[i]) for i in range(n_days)}
+
+async def get_day_matrix(days: int) -> Tuple[List[int], np.ndarray, np.ndarray]:
+    """
+    (day ordinals, occupancy[days, 24], arrivals[days, 24]) ending today
+
+    Missing closed days are loaded in one query and cached; today is
+    always recomputed because people are still checking in and out.
+    """
+    today = get_nepal_date().toordinal()
+    ordinals = list(range(today - days + 1, today + 1))
+
+    missing = [d for d in ordinals[:-1] if d not in _day_cache]
+    if missing:
+        _day_cache.update({
+            d: rows for d, rows in (await _load_days(missing[0], missing[-1], today)).items()
+            if d < today
+        })
+
+    today_rows = (await _load_days(today, today, today))[today]
+    rows = [_day_cache[d] for d in ordinals[:-1]] + [today_rows]
+    occupancy = np.stack([r[0] for r in rows])
+    arrivals = np.stack([r[1] for r in rows])
+    return ordinals, occupancy, arrivals
+
+def invalidate_timeseries(date: Optional[Union[str, date]] = None, **_):
+    """
+    Forget the cached closed day an attendance write touched
+
+    Without a `date` in the event every cached day is dropped.
+    """
+    if date is None:
+        _day_cache.clear()
+        return
+    day = date if not isinstance(date, str) else datetime.fromisoformat(date).date()
+    _day_cache.pop(day.toordinal(), None)
+
+events.subscribe(events.ATTENDANCE, invalidate_timeseries)
+
+async def get_occupancy(days: int) -> Dict[str, Any]:
+    ordinals, occupancy, arrivals = await get_day_matrix(days)
+    occupancy = occupancy.astype(np.float64)
+    return {
+        "days": [date.fromordinal(d).isoformat() for d in ordinals],
+        "hours": list(range(24)),
+        "occupancy": np.round(occupancy, 2).tolist(),
+        "arrivals": arrivals.tolist(),
+        "daily_peak": np.round(occupancy.max(axis=1), 2).tolist(),
+        "daily_arrivals": arrivals.sum(axis=1).tolist()
+    }
+
+async def get_heatmap(days: int) -> Dict[str, Any]:
+    """Weekday x hour mean occupancy plus arrival histograms"""
+    ordinals, occupancy, arrivals = await get_day_matrix(days)
+    weekday = np.asarray([date.fromordinal(d).weekday() for d in ordinals], dtype=np.int64)
+
+    day_counts = np.bincount(weekday, minlength=7)
+    occupancy_sum = np.zeros((7, 24), dtype=np.float64)
+    np.add.at(occupancy_sum, weekday, occupancy)
+    mean_occupancy = occupancy_sum / np.maximum(day_counts, 1)[:, None]
+
+    # Arrival histogram: bincount over (weekday, hour) cells weighted by counts
+    cells = (weekday[:, None] * 24 + np.arange(24)[None, :]).ravel()
+    arrival_hist = np.bincount(cells, weights=arrivals.ravel(), minlength=7 * 24).reshape(7, 24)
+
+    return {
+        "range_days": days,
+        "weekdays": WEEKDAYS,
+        "hours": list(range(24)),
+        "occupancy": np.round(mean_occupancy, 2).tolist(),
+        "arrivals": arrival_hist.astype(int).tolist(),
+        "days_per_weekday": day_counts.tolist()
+    }
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends
 from backend.database.connection import get_database
 from backend.utils.security import get_current_user
+from backend.utils import events
+from backend.modules.analytics.incremental import record_check_in
 from datetime import datetime
 import pytz
 
@@ -35,7 +37,10 @@ async def check_in(current_user = Depends(get_current_user)):
     }
     
     await db.attendance.insert_one(record)
-    return {"message": "Checked in successfully", "time": record["check_in"]}
+    events.publish(events.ATTENDANCE, user_id=user_id, date=record["date"])
+
+    anomaly = await record_check_in(current_user, record["timestamp"])
+    return {"message": "Checked in successfully", "time": record["check_in"], **anomaly}
 
 @router.post("/check-out")
 async def check_out(current_user = Depends(get_current_user)):
@@ -58,6 +63,7 @@ async def check_out(current_user = Depends(get_current_user)):
         {"_id": record["_id"]},
         {"$set": {"check_out": check_out_time}}
     )
+    events.publish(events.ATTENDANCE, user_id=user_id, date=record["date"])
     
     return {"message": "Checked out successfully", "time": check_out_time}
 
@@ -1,4 +1,7 @@
 from backend.database.connection import get_database
+from backend.modules.analytics.incremental import record_check_in
+from backend.utils import events
+from backend.utils.timezone import get_nepal_time
 from datetime import datetime
 
 async def mark_attendance(user_id: str):
@@ -21,6 +24,12 @@ async def mark_attendance(user_id: str):
     }
     
     new_record = await db.attendance.insert_one(record)
+    events.publish(events.ATTENDANCE, user_id=user_id, date=record["timestamp"].date())
+
+    # Same running-stats update and real-time alert as the check-in route
+    user = await db.users.find_one({"_id": user_id}, {"name": 1})
+    if user is not None:
+        await record_check_in(user, get_nepal_time())
     created_record = await db.attendance.find_one({"_id": new_record.inserted_id})
     
     return created_record
@@ -1,6 +1,7 @@
 from backend.database.connection import get_database
 from backend.database.schemas import UserCreate, UserInDB
 from backend.utils.security import get_password_hash, verify_password
+from backend.utils import events
 from fastapi import HTTPException, status
 
 async def create_user(user: UserCreate):
@@ -38,6 +39,7 @@ async def create_user(user: UserCreate):
     )
     
     new_user = await db.users.insert_one(user_in_db.dict())
+    events.publish(events.USERS, user_id=new_user.inserted_id)
     created_user = await db.users.find_one({"_id": new_user.inserted_id})
     
     return created_user
@@ -0,0 +1,298 @@
+"""
+Presence Broadcasting
+Keeps today's who-is-in-the-lab state and resource status in memory and
+pushes changes to Socket.IO rooms (one per lab and role). Write events
+are debounced: a burst of check-ins or auto-absent marks becomes one
+delta carrying a sequence number. Clients get a full snapshot on connect
+and ask for a new one (presence:sync) if they see a gap in the sequence.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+import pytz
+from jose import jwt
+
+from backend.config import get_settings
+from backend.database.connection import get_database
+from backend.modules.analytics.records import record_check_in_time, record_check_out_time, is_present
+from backend.utils import events
+from backend.utils.logger import get_logger
+from backend.utils.timezone import get_nepal_date
+
+settings = get_settings()
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+logger = get_logger(__name__)
+
+SNAPSHOT_EVENT = "presence:snapshot"
+DELTA_EVENT = "presence:delta"
+SYNC_EVENT = "presence:sync"
+
+ROLES = ("admin", "member")
+
+def room_for(lab: str, role: str) -> str:
+    return f"lab:{lab}:{role}"
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+def member_entry(user_id: str, record: dict) -> Dict[str, Any]:
+    """Presence of one user from their latest attendance record today"""
+    check_in = record_check_in_time(record)
+    check_out = record_check_out_time(record)
+    if not is_present(record):
+        status = "absent"
+    elif check_out is not None:
+        status = "out"
+    else:
+        status = "in"
+    return {
+        "user_id": user_id,
+        "name": record.get("user_name"),
+        "status": status,
+        "check_in": _iso(check_in) if is_present(record) else None,
+        "check_out": _iso(check_out),
+    }
+
+def resource_entry(resource: dict) -> Dict[str, Any]:
+    return {
+        "resource_id": str(resource["_id"]),
+        "name": resource.get("name"),
+        "status": resource.get("status"),
+        "current_user": resource.get("current_user"),
+    }
+
+class PresenceHub:
+    """In-memory presence state for one lab plus its Socket.IO fan-out"""
+
+    def __init__(self, lab: str, debounce: float, max_delay: float):
+        self.lab = lab
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.sio = None
+        self.seq = 0
+        self.day: Optional[str] = None
+        self.members: Dict[str, Dict[str, Any]] = {}
+        self.resources: Dict[str, Dict[str, Any]] = {}
+        self._pending_users: Set[str] = set()
+        self._pending_resources = False
+        self._first_pending: Optional[float] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.deltas = 0
+        self.coalesced_events = 0
+        self.snapshots = 0
+
+    # --- Socket.IO wiring -------------------------------------------------
+
+    def attach(self, sio):
+        """Register connect/disconnect/sync handlers on the Socket.IO server"""
+        self.sio = sio
+
+        @sio.event
+        async def connect(sid, environ, auth=None):
+            user = await self._authenticate(environ, auth)
+            if user is None:
+                return False
+            role = "admin" if user.get("role") == "admin" else "member"
+            await sio.save_session(sid, {"user_id": user["_id"], "role": role})
+            await sio.enter_room(sid, room_for(self.lab, role))
+            await sio.emit(SNAPSHOT_EVENT, await self.snapshot(role), to=sid)
+
+        @sio.on(SYNC_EVENT)
+        async def sync(sid, data=None):
+            session = await sio.get_session(sid)
+            await sio.emit(SNAPSHOT_EVENT, await self.snapshot(session.get("role", "member")), to=sid)
+
+    async def _authenticate(self, environ: dict, auth: Optional[dict]) -> Optional[dict]:
+        """JWT from the Socket.IO auth payload ({"token": ...}) or a ?token= query parameter"""
+        token = (auth or {}).get("token") if isinstance(auth, dict) else None
+        if not token:
+            query = environ.get("QUERY_STRING", "")
+            token = next((part[6:] for part in query.split("&") if part.startswith("token=")), None)
+        if not token:
+            return None
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except jwt.JWTError:
+            return None
+        db = await get_database()
+        return await db.users.find_one({"email": payload.get("sub")}, {"role": 1})
+
+    # --- State --------------------------------------------------------------
+
+    async def _today_records(self, user_ids: Optional[List[str]] = None) -> Dict[str, dict]:
+        """Latest attendance record per user for today"""
+        today = get_nepal_date()
+        day_start = NEPAL_TZ.localize(datetime.combine(today, datetime.min.time()))
+        query: Dict[str, Any] = {"$or": [{"date": today.isoformat()}, {"date": None, "timestamp": {"$gte": day_start}}]}
+        if user_ids is not None:
+            query["user_id"] = {"$in": user_ids}
+        db = await get_database()
+        latest: Dict[str, dict] = {}
+        async for record in db.attendance.find(query, {"_id": 0}).sort("timestamp", 1):
+            if record.get("user_id") is not None:
+                latest[str(record["user_id"])] = record
+        return latest
+
+    async def _load_resources(self) -> Dict[str, Dict[str, Any]]:
+        db = await get_database()
+        resources = await db.resources.find({}, {"name": 1, "status": 1, "current_user": 1}).to_list(length=None)
+        return {str(r["_id"]): resource_entry(r) for r in resources}
+
+    async def _ensure_loaded(self):
+        """Full reload on first use and when the day rolls over"""
+        today = get_nepal_date().isoformat()
+        if self.day == today:
+            return
+        records = await self._today_records()
+        self.members = {uid: member_entry(uid, record) for uid, record in records.items()}
+        self.resources = await self._load_resources()
+        self.day = today
+        self.seq += 1
+
+    def counts(self) -> Dict[str, int]:
+        statuses = [m["status"] for m in self.members.values()]
+        return {
+            "in_lab": statuses.count("in"),
+            "checked_out": statuses.count("out"),
+            "absent": statuses.count("absent"),
+            "resources_in_use": sum(1 for r in self.resources.values() if r["status"] == "in_use"),
+        }
+
+    async def snapshot(self, role: str = "admin") -> Dict[str, Any]:
+        async with self._lock:
+            await self._ensure_loaded()
+            self.snapshots += 1
+            data = {
+                "seq": self.seq,
+                "lab": self.lab,
+                "day": self.day,
+                "counts": self.counts(),
+                "resources": list(self.resources.values()),
+            }
+            if role == "admin":
+                data["members"] = list(self.members.values())
+            return data
+
+    # --- Debounced deltas -------------------------------------------------
+
+    def _schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        now = time.monotonic()
+        if self._first_pending is None:
+            self._first_pending = now
+        else:
+            self.coalesced_events += 1
+        if self._timer is not None:
+            self._timer.cancel()
+        # Trailing debounce, but never hold a change back longer than max_delay
+        delay = min(self.debounce, max(self._first_pending + self.max_delay - now, 0.0))
+        self._timer = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        self._timer = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self.flush())
+        else:
+            # A flush is still running; pick the rest up right after it
+            self._flush_task.add_done_callback(lambda _: self._schedule())
+
+    def on_attendance(self, user_id=None, **_):
+        if user_id is None or self.day is None:
+            return  # nothing loaded yet: the first snapshot reads fresh state
+        self._pending_users.add(str(user_id))
+        self._schedule()
+
+    def on_resources(self, **_):
+        if self.day is None:
+            return
+        self._pending_resources = True
+        self._schedule()
+
+    async def flush(self) -> Optional[Dict[str, Any]]:
+        """Apply pending changes and broadcast them as one delta"""
+        async with self._lock:
+            user_ids, self._pending_users = list(self._pending_users), set()
+            resources_changed, self._pending_resources = self._pending_resources, False
+            self._first_pending = None
+            if self.day != get_nepal_date().isoformat():
+                # New day: everyone gets a fresh snapshot instead of a delta
+                await self._ensure_loaded()
+                await self._broadcast_snapshots()
+                return None
+
+            member_changes = []
+            if user_ids:
+                records = await self._today_records(user_ids)
+                for uid in user_ids:
+                    entry = member_entry(uid, records[uid]) if uid in records else None
+                    if entry != self.members.get(uid):
+                        if entry is None:
+                            self.members.pop(uid, None)
+                            entry = {"user_id": uid, "status": None}
+                        else:
+                            self.members[uid] = entry
+                        member_changes.append(entry)
+
+            resource_changes = []
+            if resources_changed:
+                fresh = await self._load_resources()
+                resource_changes = [r for rid, r in fresh.items() if self.resources.get(rid) != r]
+                resource_changes += [{"resource_id": rid, "status": None} for rid in self.resources if rid not in fresh]
+                self.resources = fresh
+
+            if not member_changes and not resource_changes:
+                return None
+            self.seq += 1
+            self.deltas += 1
+            delta = {"seq": self.seq, "lab": self.lab, "counts": self.counts(), "resources": resource_changes}
+            await self._emit(DELTA_EVENT, {**delta, "members": member_changes}, "admin")
+            await self._emit(DELTA_EVENT, delta, "member")
+            return delta
+
+    async def _broadcast_snapshots(self):
+        for role in ROLES:
+            data = {"seq": self.seq, "lab": self.lab, "day": self.day, "counts": self.counts(),
+                    "resources": list(self.resources.values())}
+            if role == "admin":
+                data["members"] = list(self.members.values())
+            await self._emit(SNAPSHOT_EVENT, data, role)
+
+    async def _emit(self, event: str, data: Dict[str, Any], role: str):
+        if self.sio is None:
+            return
+        try:
+            # Every worker runs its own hub off the shared event stream, so it
+            # only reaches its own clients (no relay through other workers)
+            await self.sio.emit(event, data, room=room_for(self.lab, role), ignore_queue=True)
+        except Exception as e:
+            logger.error("Presence broadcast failed (%s): %s", event, e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lab": self.lab,
+            "seq": self.seq,
+            "day": self.day,
+            "members": len(self.members),
+            "deltas": self.deltas,
+            "coalesced_events": self.coalesced_events,
+            "snapshots": self.snapshots,
+            "pending_users": len(self._pending_users),
+        }
+
+presence_hub = PresenceHub(
+    settings.LAB_ID,
+    debounce=settings.PRESENCE_DEBOUNCE_MS / 1000,
+    max_delay=settings.PRESENCE_MAX_DELAY_MS / 1000,
+)
+
+events.subscribe(events.ATTENDANCE, presence_hub.on_attendance)
+events.subscribe(events.RESOURCES, presence_hub.on_resources)
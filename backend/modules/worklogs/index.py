@@ -0,0 +1,138 @@
+"""
+Work-log search index
+Inverted index (term -> postings of term frequencies) with the document
+lengths BM25 needs, updated incrementally as logs are ingested instead
+of being rebuilt
+"""
+import bisect
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+class InvertedIndex:
+    """BM25 index over work logs with prefix expansion and user/date filters"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {doc_id: tf}
+        self.docs: Dict[str, Dict[str, Any]] = {}      # doc_id -> {user_id, date, length, text}
+        self.terms: List[str] = []                     # sorted vocabulary, for prefix lookups
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @property
+    def average_length(self) -> float:
+        return self.total_length / len(self.docs) if self.docs else 0.0
+
+    def add(self, doc_id: str, text: str, user_id: str = None, date: str = None):
+        """Index (or re-index) one document"""
+        if doc_id in self.docs:
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                bisect.insort(self.terms, term)
+            postings[doc_id] = tf
+        self.docs[doc_id] = {"user_id": user_id, "date": date, "length": len(tokens), "text": text}
+        self.total_length += len(tokens)
+
+    def remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc["length"]
+        for term in set(tokenize(doc["text"])):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+                self.terms.pop(bisect.bisect_left(self.terms, term))
+
+    def expand(self, prefix: str, limit: int = 50) -> List[str]:
+        """Vocabulary terms starting with `prefix` (most frequent first)"""
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + "\uffff")
+        matches = self.terms[start:end]
+        if len(matches) > limit:
+            matches = sorted(matches, key=lambda t: len(self.postings[t]), reverse=True)[:limit]
+        return matches
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        user_id: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        prefix: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        Top-k documents by BM25
+
+        With `prefix`, the last query term (or any term ending in `*`) also
+        matches every indexed term that starts with it, for search-as-you-type.
+        """
+        tokens = query.lower().split()
+        terms: Dict[str, float] = {}
+        for i, raw in enumerate(tokens):
+            wildcard = raw.endswith("*") or (prefix and i == len(tokens) - 1)
+            for token in tokenize(raw):
+                for term in (self.expand(token) if wildcard else [token]):
+                    terms[term] = max(terms.get(term, 0.0), self.idf(term))
+
+        def allowed(doc: Dict[str, Any]) -> bool:
+            if user_id is not None and doc["user_id"] != user_id:
+                return False
+            if date_from is not None and (doc["date"] or "") < date_from:
+                return False
+            if date_to is not None and (doc["date"] or "") > date_to:
+                return False
+            return True
+
+        avgdl = self.average_length or 1.0
+        scores: Dict[str, float] = {}
+        for term, idf in terms.items():
+            for doc_id, tf in self.postings.get(term, {}).items():
+                doc = self.docs[doc_id]
+                if not allowed(doc):
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * doc["length"] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            {
+                "id": doc_id,
+                "user_id": self.docs[doc_id]["user_id"],
+                "date": self.docs[doc_id]["date"],
+                "raw_input": self.docs[doc_id]["text"],
+                "score": round(score, 4),
+            }
+            for doc_id, score in top
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.docs),
+            "terms": len(self.terms),
+            "postings": sum(len(p) for p in self.postings.values()),
+            "average_length": round(self.average_length, 2),
+        }
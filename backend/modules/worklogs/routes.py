@@ -0,0 +1,49 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends
+from backend.database.schemas import WorkLogBatch
+from backend.utils.security import get_current_user
+from backend.modules.worklogs.service import (
+    ingest_work_logs, search_work_logs, ensure_index, MAX_BATCH
+)
+
+router = APIRouter(tags=["Work Logs"])
+
+@router.post("")
+async def add_work_logs(batch: WorkLogBatch, current_user = Depends(get_current_user)):
+    """Add a batch of work logs for the current user"""
+    if len(batch.logs) > MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH} logs per request")
+    
+    try:
+        ids = await ingest_work_logs(current_user, batch.logs)
+        return {"message": f"{len(ids)} work logs added", "ids": ids}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/search")
+async def search(
+    q: str,
+    user_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 10,
+    prefix: bool = True,
+    current_user = Depends(get_current_user)
+):
+    """Ranked (BM25) work-log search; members only see their own logs"""
+    if current_user.get("role") != "admin":
+        user_id = current_user["_id"]
+    
+    try:
+        results = await search_work_logs(q, user_id, start, end, min(max(limit, 1), 100), prefix)
+        return {"query": q, "count": len(results), "results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/index/stats")
+async def index_stats(current_user = Depends(get_current_user)):
+    """Work-log index size (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return (await ensure_index()).stats()
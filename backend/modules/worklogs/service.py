@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime
+from typing import List, Optional, Dict, Any
+import pytz
+from backend.database.connection import get_database
+from backend.database.schemas import WorkLogCreate
+from backend.modules.worklogs.index import InvertedIndex
+from backend.utils import events
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+MAX_BATCH = 500
+
+work_log_index = InvertedIndex()
+_index_state = {"built": False, "pending": []}
+_index_lock = asyncio.Lock()
+
+async def ensure_index() -> InvertedIndex:
+    """Build the index from the database once; later ingestion keeps it current"""
+    if _index_state["built"]:
+        return work_log_index
+    async with _index_lock:
+        if not _index_state["built"]:
+            db = await get_database()
+            async for log in db.work_logs.find({}, {"user_id": 1, "date": 1, "raw_input": 1}):
+                if log.get("raw_input"):
+                    work_log_index.add(str(log["_id"]), log["raw_input"], log.get("user_id"), log.get("date"))
+            # Logs announced while the build was reading; re-adding one it already saw is harmless
+            for doc in _index_state["pending"]:
+                work_log_index.add(*doc)
+            _index_state.update(built=True, pending=[])
+    return work_log_index
+
+async def ingest_work_logs(user: dict, logs: List[WorkLogCreate]) -> List[str]:
+    """Insert a batch of work logs in one write and index them"""
+    await ensure_index()
+    now = datetime.now(NEPAL_TZ)
+    docs = [
+        {
+            "user_id": user["_id"],
+            "user_name": user.get("name"),
+            "raw_input": log.raw_input.strip(),
+            "date": log.date or now.date().isoformat(),
+            "tags": log.tags,
+            "timestamp": now
+        }
+        for log in logs if log.raw_input.strip()
+    ]
+    if not docs:
+        return []
+
+    db = await get_database()
+    result = await db.work_logs.insert_many(docs)
+    ids = [str(_id) for _id in result.inserted_ids]
+    # Indexed by the subscriber below, here and on every other worker
+    events.publish(events.WORKLOGS, docs=[
+        (doc_id, doc["raw_input"], doc["user_id"], doc["date"]) for doc_id, doc in zip(ids, docs)
+    ])
+    return ids
+
+def index_work_logs(docs=(), **_):
+    """Add newly ingested logs to this worker's index, or hold them until its first build finishes"""
+    if not _index_state["built"]:
+        if _index_lock.locked():
+            _index_state["pending"].extend(docs)
+        return  # an index built later reads them from the database
+    for doc in docs:
+        work_log_index.add(*doc)
+
+events.subscribe(events.WORKLOGS, index_work_logs)
+
+async def search_work_logs(
+    query: str,
+    user_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 10,
+    prefix: bool = True,
+) -> List[Dict[str, Any]]:
+    index = await ensure_index()
+    return index.search(query, k=limit, user_id=user_id, date_from=start, date_to=end, prefix=prefix)
@@ -0,0 +1,34 @@
+import asyncio
+
+from backend.modules.ai.llm_client import MockTransport, Transport
+from backend.modules.ai.llm_router import MIN_HEDGE_SAMPLES, ProviderRouter
+
+
+class FailingTransport(Transport):
+    name = "primary"
+
+    async def complete(self, prompt: str, max_tokens: int) -> str:
+        raise ConnectionError("refused")
+
+
+class SlowTransport(Transport):
+    name = "secondary"
+
+    async def complete(self, prompt: str, max_tokens: int) -> str:
+        await asyncio.sleep(0.01)
+        return "from secondary"
+
+
+def test_fast_failing_primary_fails_over_to_hedge_partner():
+    router = ProviderRouter([FailingTransport(), SlowTransport(), MockTransport()], hedge_percentile=95)
+    # Enough history for a hedge delay, primary ranked first
+    for _ in range(MIN_HEDGE_SAMPLES):
+        router.health["primary"].observe(0.5, ok=True)
+        router.health["secondary"].observe(1.0, ok=True)
+
+    transport, text = asyncio.run(router.complete("hello", 16))
+
+    assert transport.name == "secondary"
+    assert text == "from secondary"
+    assert router.hedges == 0
+    assert router.hedge_wins == 0
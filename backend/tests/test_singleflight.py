@@ -0,0 +1,43 @@
+import asyncio
+
+from backend.utils.singleflight import SingleFlight
+
+
+def test_shared_task_survives_one_cancelled_waiter():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("key", fn))
+        second = asyncio.ensure_future(flight.do("key", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, flight.executions
+
+    assert asyncio.run(scenario()) == ("done", 1)
+
+
+def test_shared_task_is_cancelled_with_its_last_waiter():
+    async def scenario():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fn():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.ensure_future(flight.do("key", fn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        return flight.stats()["in_flight"]
+
+    assert asyncio.run(scenario()) == 0
@@ -3,9 +3,14 @@ Audit Logging Utility
 Tracks all important system actions for security and compliance
 """
 from backend.database.connection import get_database
-from backend.utils.timezone import get_nepal_time_str
+from backend.utils.log_writer import log_writer
+from backend.utils.logger import get_logger
+from backend.utils.timezone import get_nepal_time
+from datetime import timedelta
 from typing import Optional
 
+logger = get_logger(__name__)
+
 async def log_audit(actor: str, action: str, details: Optional[dict] = None):
     """
     Log an audit event
@@ -16,27 +21,27 @@ async def log_audit(actor: str, action: str, details: Optional[dict] = None):
         details: Optional additional details as dict
     """
     try:
-        db = await get_database()
-        
         audit_entry = {
             "actor": actor,
             "action": action,
             "details": details or {},
-            "timestamp": get_nepal_time_str()
+            "timestamp": get_nepal_time()
         }
         
-        await db.audit_logs.insert_one(audit_entry)
+        # Written in the background by the shared log writer
+        await log_writer.write("audit_logs", audit_entry)
     except Exception as e:
         # Don't fail the main operation if audit logging fails
-        print(f"Audit logging error: {e}")
+        logger.error("Audit logging error: %s", e)
 
-async def get_audit_logs(limit: int = 100, actor: Optional[str] = None):
+async def get_audit_logs(limit: int = 100, actor: Optional[str] = None, days: Optional[int] = 7):
     """
-    Retrieve audit logs
+    Retrieve recent audit logs
     
     Args:
         limit: Maximum number of logs to retrieve
         actor: Optional filter by actor
+        days: Only look this many days back (None for every raw log still retained)
     """
     try:
         db = await get_database()
@@ -44,11 +49,13 @@ async def get_audit_logs(limit: int = 100, actor: Optional[str] = None):
         query = {}
         if actor:
             query["actor"] = actor
+        if days is not None:
+            query["timestamp"] = {"$gte": get_nepal_time() - timedelta(days=days)}
         
-        cursor = db.audit_logs.find(query).sort("timestamp", -1).limit(limit)
+        cursor = db.audit_logs.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit)
         logs = await cursor.to_list(length=limit)
         
         return logs
     except Exception as e:
-        print(f"Error retrieving audit logs: {e}")
+        logger.error("Error retrieving audit logs: %s", e)
         return []
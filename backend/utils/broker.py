@@ -0,0 +1,293 @@
+"""
+Shared-State Broker
+Small local process that every uvicorn worker on the host connects to
+(Unix socket, or loopback TCP where Unix sockets are unavailable). It owns
+the one in-memory database and relays pub/sub messages (write events,
+Socket.IO fan-out) and short leases (which worker runs a periodic job).
+Frames are length-prefixed pickles, exchanged only after both sides
+prove they know SECRET_KEY.
+
+Started on demand by the first worker that cannot reach it; run
+`python -m backend.utils.broker` to start it by hand.
+"""
+import asyncio
+import hashlib
+import hmac
+import itertools
+import os
+import pickle
+import struct
+import tempfile
+import time
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+import mongomock
+
+from backend.config import get_settings
+from backend.utils.logger import get_logger, setup_logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: loopback TCP, where bind() is already exclusive
+    fcntl = None
+
+settings = get_settings()
+
+logger = get_logger(__name__)
+
+HEADER = struct.Struct(">I")
+NONCE_SIZE = 16
+DEFAULT_BATCH = 500
+
+# --- Wire format (shared with the client in backend.utils.shared_state) ----
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """"host:port" is loopback TCP, anything else a Unix socket path"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit() and "/" not in address and "\\" not in address:
+        return "tcp", (host, int(port))
+    return "unix", address
+
+def digest(role: bytes, nonce: bytes) -> bytes:
+    return hmac.new(settings.SECRET_KEY.encode(), role + nonce, hashlib.sha256).digest()
+
+async def read_frame(reader: asyncio.StreamReader) -> Any:
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+def write_frame(writer: asyncio.StreamWriter, message: Any):
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(HEADER.pack(len(payload)) + payload)
+
+# --- Broker -----------------------------------------------------------------
+
+class Connection:
+    """One connected worker"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.id = next(self._ids)
+        self.writer = writer
+        self.cursors: Dict[int, Iterator] = {}
+        self.channels: Set[str] = set()
+
+class Broker:
+    """Database, channels and leases shared by the workers"""
+
+    def __init__(self, db_name: str):
+        self.db = mongomock.MongoClient()[db_name]
+        self.connections: Dict[int, Connection] = {}
+        self.channels: Dict[str, Set[Connection]] = {}
+        # lease name -> (holder connection id, expires at)
+        self.leases: Dict[str, Tuple[int, float]] = {}
+        self._cursor_ids = itertools.count(1)
+        self.idle_since: Optional[float] = time.monotonic()
+        self.requests = 0
+        self.messages = 0
+
+    async def _handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """Mutual HMAC challenge, so nothing is unpickled from (or sent to) a stranger"""
+        nonce = os.urandom(NONCE_SIZE)
+        writer.write(nonce)
+        client_nonce = await reader.readexactly(NONCE_SIZE)
+        proof = await reader.readexactly(hashlib.sha256().digest_size)
+        if not hmac.compare_digest(proof, digest(b"client", nonce)):
+            return False
+        writer.write(digest(b"broker", client_nonce))
+        await writer.drain()
+        return True
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            if not await asyncio.wait_for(self._handshake(reader, writer), timeout=5):
+                logger.warning("Shared-state client failed the handshake")
+                writer.close()
+                return
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+
+        conn = Connection(writer)
+        self.connections[conn.id] = conn
+        self.idle_since = None
+        logger.info("Worker connected to shared state (%s connected)", len(self.connections))
+        try:
+            while True:
+                request_id, op, args = await read_frame(reader)
+                self.requests += 1
+                try:
+                    result = (True, self.dispatch(conn, op, args))
+                except Exception as e:
+                    result = (False, e)
+                if request_id:
+                    try:
+                        write_frame(writer, (request_id,) + result)
+                    except Exception as e:
+                        write_frame(writer, (request_id, False, RuntimeError(f"Unpicklable result: {e}")))
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._drop(conn)
+            writer.close()
+
+    def _drop(self, conn: Connection):
+        self.connections.pop(conn.id, None)
+        for channel in conn.channels:
+            self.channels.get(channel, set()).discard(conn)
+        self.leases = {name: lease for name, lease in self.leases.items() if lease[0] != conn.id}
+        if not self.connections:
+            self.idle_since = time.monotonic()
+        logger.info("Worker disconnected from shared state (%s connected)", len(self.connections))
+
+    def dispatch(self, conn: Connection, op: str, args: tuple) -> Any:
+        handler = getattr(self, f"op_{op}", None)
+        if handler is None:
+            raise ValueError(f"Unknown shared-state operation: {op}")
+        return handler(conn, *args)
+
+    # --- Database -----------------------------------------------------------
+
+    @staticmethod
+    def _public(name: str) -> str:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return name
+
+    def op_database(self, conn, method: str, args: tuple, kwargs: dict):
+        return getattr(self.db, self._public(method))(*args, **kwargs)
+
+    def op_collection(self, conn, collection: str, method: str, args: tuple, kwargs: dict):
+        return getattr(self.db[collection], self._public(method))(*args, **kwargs)
+
+    def _cursor(self, collection: str, method: str, args: tuple, kwargs: dict, chain: list):
+        cursor = getattr(self.db[collection], self._public(method))(*args, **kwargs)
+        for name, chain_args, chain_kwargs in chain:
+            if name != "batch_size":
+                cursor = getattr(cursor, self._public(name))(*chain_args, **chain_kwargs)
+        return cursor
+
+    def _batch(self, conn: Connection, cursor_id: int, documents: Iterator, size: int):
+        batch = list(itertools.islice(documents, size))
+        if len(batch) < size:
+            conn.cursors.pop(cursor_id, None)
+            return batch, 0
+        conn.cursors[cursor_id] = documents
+        return batch, cursor_id
+
+    def op_cursor(self, conn, collection: str, method: str, args: tuple, kwargs: dict, chain: list, size: int):
+        """Open a find/aggregate cursor and return its first batch plus an id for getmore"""
+        documents = iter(self._cursor(collection, method, args, kwargs, chain))
+        return self._batch(conn, next(self._cursor_ids), documents, size)
+
+    def op_getmore(self, conn, cursor_id: int, size: int):
+        documents = conn.cursors.get(cursor_id)
+        if documents is None:
+            return [], 0
+        return self._batch(conn, cursor_id, documents, size)
+
+    def op_killcursor(self, conn, cursor_id: int):
+        conn.cursors.pop(cursor_id, None)
+
+    def op_explain(self, conn, collection: str, method: str, args: tuple, kwargs: dict, chain: list):
+        return self._cursor(collection, method, args, kwargs, chain).explain()
+
+    # --- Pub/sub and leases -------------------------------------------------
+
+    def op_subscribe(self, conn, channel: str):
+        conn.channels.add(channel)
+        self.channels.setdefault(channel, set()).add(conn)
+
+    def op_publish(self, conn, channel: str, message: Any):
+        """Relay to every other subscriber; the sender has already handled it locally"""
+        self.messages += 1
+        frame = None
+        for peer in self.channels.get(channel, ()):
+            if peer is conn:
+                continue
+            if frame is None:
+                payload = pickle.dumps((0, channel, message), protocol=pickle.HIGHEST_PROTOCOL)
+                frame = HEADER.pack(len(payload)) + payload
+            peer.writer.write(frame)
+
+    def op_claim(self, conn, name: str, ttl: float) -> bool:
+        """Take or renew a lease; False while another live worker holds it"""
+        now = time.monotonic()
+        holder = self.leases.get(name)
+        if holder is not None and holder[0] != conn.id and holder[1] > now:
+            return False
+        self.leases[name] = (conn.id, now + ttl)
+        return True
+
+    def op_stats(self, conn) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "workers": len(self.connections),
+            "collections": len(self.db.list_collection_names()),
+            "open_cursors": sum(len(c.cursors) for c in self.connections.values()),
+            "channels": {name: len(peers) for name, peers in self.channels.items()},
+            "leases": {name: round(expires - now, 1) for name, (_, expires) in self.leases.items() if expires > now},
+            "requests": self.requests,
+            "messages": self.messages,
+        }
+
+def _lock_file(path: str):
+    """Exclusive lock held for the broker's lifetime; None if another broker has it"""
+    while True:
+        handle = open(path + ".lock", "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+        try:
+            # A stopping broker unlinks the file; a lock on the old one guards nothing
+            if os.stat(path + ".lock").st_ino == os.fstat(handle.fileno()).st_ino:
+                return handle
+        except FileNotFoundError:
+            pass
+        handle.close()
+
+async def serve(address: str, idle_exit: float):
+    kind, target = parse_address(address)
+    broker = Broker(settings.DB_NAME)
+    lock = None
+    if kind == "unix":
+        if fcntl is not None:
+            lock = _lock_file(target)
+            if lock is None:
+                logger.info("Shared-state broker already running at %s", target)
+                return
+        if os.path.exists(target):
+            os.unlink(target)  # stale socket from a broker that died
+        server = await asyncio.start_unix_server(broker.handle, path=target)
+        os.chmod(target, 0o600)
+    else:
+        try:
+            server = await asyncio.start_server(broker.handle, host=target[0], port=target[1])
+        except OSError:
+            logger.info("Shared-state broker already running at %s", address)
+            return
+    logger.info("Shared-state broker listening on %s", address)
+
+    try:
+        async with server:
+            # Exit once no worker has been connected for a while
+            while broker.idle_since is None or time.monotonic() - broker.idle_since < idle_exit:
+                await asyncio.sleep(min(idle_exit, 1.0))
+    finally:
+        if kind == "unix" and os.path.exists(target):
+            os.unlink(target)
+        if lock is not None:
+            # Removed while still held, so no new broker can lock the file on its way out
+            os.unlink(lock.name)
+            lock.close()
+        logger.info("Shared-state broker stopped")
+
+def default_address() -> str:
+    return settings.SHARED_STATE_ADDRESS or os.path.join(tempfile.gettempdir(), f"{settings.DB_NAME}-shared-state.sock")
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(serve(default_address(), settings.SHARED_STATE_IDLE_EXIT))
@@ -0,0 +1,154 @@
+"""
+Response Cache
+Bounded TTL + LRU cache for JSON responses, invalidated by write events
+and served with ETag / If-None-Match support
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from backend.utils import events
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    expires_at: float
+    tags: Tuple[str, ...] = field(default_factory=tuple)
+
+class ResponseCache:
+    """LRU cache bounded by entry count and total body size"""
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 8 * 1024 * 1024, default_ttl: float = 300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key: str, body: bytes, tags: Iterable[str] = (), ttl: Optional[float] = None,
+            store: bool = True) -> CacheEntry:
+        self._drop(key)
+        entry = CacheEntry(
+            body=body,
+            etag='"' + hashlib.sha1(body).hexdigest() + '"',
+            expires_at=time.monotonic() + (ttl if ttl is not None else self.default_ttl),
+            tags=tuple(tags),
+        )
+        if not store or len(body) > self.max_bytes:
+            return entry  # not kept, but still usable by the caller
+        self._entries[key] = entry
+        self._bytes += len(body)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+        return entry
+
+    def generation(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        """Snapshot of the tags' invalidation counters"""
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def invalidate(self, tag: str) -> int:
+        """Drop every entry carrying a tag, returns how many were dropped"""
+        self._generations[tag] = self._generations.get(tag, 0) + 1
+        stale = [key for key, entry in self._entries.items() if tag in entry.tags]
+        for key in stale:
+            self._drop(key)
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+response_cache = ResponseCache()
+
+# Write events invalidate every response tagged with the same topic
+for _topic in (events.ATTENDANCE, events.USERS, events.RESOURCES):
+    events.subscribe(_topic, lambda _topic=_topic, **_: response_cache.invalidate(_topic))
+
+def cache_key(request: Request, *extra: Any) -> str:
+    """Endpoint path + sorted query parameters + any extra discriminators"""
+    params = sorted(request.query_params.multi_items())
+    return json.dumps([request.url.path, params, [str(e) for e in extra]], separators=(",", ":"))
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip() for tag in header.split(",")}
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+async def cached_json(
+    request: Request,
+    compute: Callable[[], Awaitable[Any]],
+    tags: Iterable[str] = (),
+    ttl: Optional[float] = None,
+    key_extra: Tuple[Any, ...] = (),
+) -> Response:
+    """
+    Serve a JSON response from the cache, computing it on a miss
+
+    Returns 304 Not Modified when the client's If-None-Match already
+    names the current entity, without running `compute` at all.
+    """
+    tags = tuple(tags)
+    key = cache_key(request, *key_extra)
+    entry = response_cache.get(key)
+    if entry is None:
+        generation = response_cache.generation(tags)
+        payload = await compute()
+        body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode("utf-8")
+        # A write that landed while computing makes this result stale: serve it, don't keep it
+        store = response_cache.generation(tags) == generation
+        entry = response_cache.set(key, body, tags, ttl, store=store)
+
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, entry.etag):
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
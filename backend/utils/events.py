@@ -0,0 +1,61 @@
+"""
+Write Events
+Lightweight in-process publish/subscribe used to invalidate caches
+when attendance, users, resources or work logs change. With a shared-state backend
+every event is also relayed to the other workers, so their caches and
+presence state follow writes they did not serve.
+"""
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from backend.utils.logger import get_logger
+from backend.utils.shared_state import shared_state
+
+logger = get_logger(__name__)
+
+# Topics published by the routes that write to the database
+ATTENDANCE = "attendance"
+USERS = "users"
+RESOURCES = "resources"
+WORKLOGS = "worklogs"
+FORECAST = "forecast"
+ANOMALY_ALERT = "anomaly_alert"
+
+EVENTS_CHANNEL = "events"
+
+_subscribers: Dict[str, List[Callable]] = defaultdict(list)
+
+def subscribe(topic: str, handler: Callable) -> Callable:
+    """Register a handler for a topic"""
+    _subscribers[topic].append(handler)
+    return handler
+
+def on(topic: str):
+    """Decorator form of subscribe"""
+    def decorator(handler: Callable) -> Callable:
+        return subscribe(topic, handler)
+    return decorator
+
+def publish(topic: str, **payload):
+    """
+    Notify every handler subscribed to a topic
+
+    Handlers run synchronously and must be cheap; a failing handler
+    never breaks the write that triggered it.
+    """
+    _dispatch(topic, payload)
+    shared_state.publish(EVENTS_CHANNEL, (topic, payload))
+
+def _dispatch(topic: str, payload: dict):
+    for handler in list(_subscribers[topic]):
+        try:
+            handler(**payload)
+        except Exception as e:
+            logger.error("Event handler error (%s): %s", topic, e)
+
+def _from_peer(message):
+    """An event published by another worker"""
+    topic, payload = message
+    _dispatch(topic, payload)
+
+shared_state.subscribe(EVENTS_CHANNEL, _from_peer)
@@ -1,13 +1,17 @@
-try:
-    import face_recognition
-except ImportError:
-    print("WARNING: face_recognition not installed. Face features will be disabled.")
-    face_recognition = None
-
 import numpy as np
 import pickle
 import os
 from typing import List, Optional
+from backend.utils.logger import get_logger
+from backend.utils.metrics import face_latency, timed
+
+logger = get_logger(__name__)
+
+try:
+    import face_recognition
+except ImportError:
+    logger.warning("face_recognition not installed. Face features will be disabled.")
+    face_recognition = None
 
 FACE_MODEL_PATH = "face-models/encodings.pkl"
 
@@ -22,6 +26,7 @@ def save_face_encodings(encodings):
     with open(FACE_MODEL_PATH, "wb") as f:
         pickle.dump(encodings, f)
 
+@timed(face_latency, "encode")
 def get_face_encoding(image_file) -> Optional[List[float]]:
     if face_recognition is None:
         return None # Mock behavior
@@ -33,9 +38,10 @@ def get_face_encoding(image_file) -> Optional[List[float]]:
             return encodings[0].tolist()
         return None
     except Exception as e:
-        print(f"Error encoding face: {e}")
+        logger.error("Error encoding face: %s", e)
         return None
 
+@timed(face_latency, "compare")
 def compare_faces(known_encodings: List[List[float]], face_encoding: List[float], tolerance=0.6) -> List[bool]:
     if face_recognition is None:
         return [False] * len(known_encodings) # Mock behavior
@@ -0,0 +1,144 @@
+"""
+Background Log Writer
+Audit and agent-action documents are queued instead of written inline,
+then flushed with insert_many by size or time from one background task
+"""
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.config import get_settings
+from backend.database.connection import get_database
+from backend.utils.logger import get_logger
+
+settings = get_settings()
+
+logger = get_logger(__name__)
+
+DROP = "drop"
+BLOCK = "block"
+
+class LogWriter:
+    """Bounded queue of (collection, document) drained in batches"""
+
+    def __init__(self, max_queue: int = None, batch_size: int = None,
+                 flush_interval: float = None, policy: str = None):
+        self.max_queue = max_queue or settings.LOG_WRITER_QUEUE_SIZE
+        self.batch_size = batch_size or settings.LOG_WRITER_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.LOG_WRITER_FLUSH_INTERVAL
+        self.policy = policy or settings.LOG_WRITER_FULL_POLICY
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        """Start the flusher on the running loop (idempotent)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First start, or the app was restarted on a new loop (tests, reload): rebind,
+            # carrying over anything still queued
+            pending = []
+            while self._queue is not None and not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            for item in pending[-self.max_queue:]:
+                self._queue.put_nowait(item)
+            self._loop, self._task = loop, None
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def write(self, collection: str, document: Dict[str, Any]) -> bool:
+        """
+        Queue a document for `collection`
+
+        When the queue is full the "drop" policy discards the document
+        (returns False) and "block" waits for room.
+        """
+        self.start()
+        if self.policy == BLOCK:
+            await self._queue.put((collection, document))
+            return True
+        try:
+            self._queue.put_nowait((collection, document))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _next_batch(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Wait for the first item, then take what arrives within the flush interval (up to batch_size)"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        grouped: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for collection, document in batch:
+            grouped[collection].append(document)
+
+        started = time.perf_counter()
+        db = await get_database()
+        for collection, documents in grouped.items():
+            try:
+                await db[collection].insert_many(documents, ordered=False)
+                self.written += len(documents)
+            except Exception as e:
+                self.errors += 1
+                logger.error("Log writer error (%s, %s docs): %s", collection, len(documents), e)
+        self.flushes += 1
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        for _ in batch:
+            self._queue.task_done()
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            await self._flush(batch)
+
+    async def drain(self, timeout: float = 10.0):
+        """Wait until everything queued has been written, then stop (called on shutdown)"""
+        if self._queue is None or self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Log writer drain timed out with %s documents unwritten", self._queue.qsize())
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "policy": self.policy,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+log_writer = LogWriter()
@@ -0,0 +1,187 @@
+"""
+Structured Logging
+JSON-line logs written off the event loop: records go through a bounded
+QueueHandler to a QueueListener thread that owns stdout. Each record
+carries the request id of the request that produced it (via contextvars),
+and repeated warnings/errors are rate limited per message template.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+from backend.config import get_settings
+
+settings = get_settings()
+
+ROOT_LOGGER = "backend"
+REQUEST_ID_HEADER = b"x-request-id"
+
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "suppressed"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class ContextFilter(logging.Filter):
+    """Stamp the caller's request id (must run on the producing side of the queue)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most `burst` records per message template through every
+    `window` seconds; the next record that gets through reports how many
+    were dropped. Only WARNING and above are limited.
+    """
+
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        # (logger, level, template) -> [window start, emitted, suppressed]
+        self._buckets: Dict[Tuple[str, int, str], list] = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None or now - bucket[0] >= self.window:
+            suppressed = bucket[2] if bucket is not None else 0
+            if len(self._buckets) > 10000:
+                self._buckets.clear()
+            self._buckets[key] = [now, 1, 0]
+            record.suppressed = suppressed
+            return True
+        if bucket[1] < self.burst:
+            bucket[1] += 1
+            return True
+        bucket[2] += 1
+        self.suppressed += 1
+        return False
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: a full queue drops the record and counts it"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_state: Dict[str, Optional[object]] = {"listener": None, "handler": None, "rate_limit": None}
+
+def setup_logging():
+    """Install the queue pipeline on the `backend` logger (idempotent)"""
+    if _state["listener"] is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    rate_limit = RateLimitFilter(settings.LOG_RATE_LIMIT_BURST, settings.LOG_RATE_LIMIT_WINDOW)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(rate_limit)
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    root.addHandler(handler)
+    root.propagate = False
+
+    listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(shutdown_logging)
+    _state.update(listener=listener, handler=handler, rate_limit=rate_limit)
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    listener = _state["listener"]
+    if listener is None:
+        return
+    listener.stop()
+    logging.getLogger(ROOT_LOGGER).removeHandler(_state["handler"])
+    _state.update(listener=None, handler=None, rate_limit=None)
+
+def flush_logging():
+    """Write out everything queued so far and keep logging (app shutdown, before exit)"""
+    listener = _state["listener"]
+    if listener is not None:
+        listener.stop()
+        listener.start()
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the `backend` namespace, e.g. get_logger(__name__)"""
+    setup_logging()
+    return logging.getLogger(name if name.startswith(ROOT_LOGGER) else f"{ROOT_LOGGER}.{name}")
+
+def logging_stats() -> Dict[str, int]:
+    handler, rate_limit = _state["handler"], _state["rate_limit"]
+    return {
+        "queued": handler.queue.qsize() if handler else 0,
+        "dropped": handler.dropped if handler else 0,
+        "rate_limited": rate_limit.suppressed if rate_limit else 0,
+    }
+
+class RequestIdMiddleware:
+    """Adopt the caller's X-Request-ID (or mint one) for the request's context and echo it back"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = next((v for k, v in scope.get("headers", []) if k == REQUEST_ID_HEADER), None)
+        request_id = incoming.decode("latin-1")[:64] if incoming else uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
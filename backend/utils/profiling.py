@@ -0,0 +1,228 @@
+"""
+Request Profiling
+Admin-triggered (X-Profile header) or sampled cProfile runs of single
+requests, kept in a bounded in-memory store for /admin/profiles. Every
+request also counts its database calls so N+1 query patterns are
+flagged even when the request was not profiled.
+"""
+import contextvars
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import random
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import pytz
+from jose import jwt
+
+from backend.config import get_settings
+from backend.utils.metrics import route_template
+
+settings = get_settings()
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+PROFILE_HEADER = b"x-profile"
+TOP_FUNCTIONS = 30
+
+class RequestProfile:
+    """Per-request state shared with every task the request spawns"""
+
+    __slots__ = ("db_calls",)
+
+    def __init__(self):
+        self.db_calls: Counter = Counter()
+
+    def n_plus_one(self) -> List[Dict[str, Any]]:
+        """(collection, op) pairs repeated often enough to look like a query in a loop"""
+        return [
+            {"collection": collection, "op": op, "count": count}
+            for (collection, op), count in self.db_calls.most_common()
+            if count >= settings.PROFILING_N_PLUS_ONE_THRESHOLD
+        ]
+
+_current: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar("request_profile", default=None)
+
+def record_db_call(collection: str, op: str):
+    """Called by the instrumented database for every operation"""
+    profile = _current.get()
+    if profile is not None:
+        profile.db_calls[(collection, op)] += 1
+
+class ProfileStore:
+    """Last N profiles, newest first"""
+
+    def __init__(self, max_profiles: int):
+        self._profiles: Deque[Dict[str, Any]] = deque(maxlen=max_profiles)
+        self._stats: Dict[int, pstats.Stats] = {}
+        self._ids = itertools.count(1)
+        self.profiled = 0
+        self.flagged = 0
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add(self, entry: Dict[str, Any], stats: Optional[pstats.Stats] = None, profile_id: Optional[int] = None) -> int:
+        entry["id"] = profile_id if profile_id is not None else self.next_id()
+        if len(self._profiles) == self._profiles.maxlen:
+            self._stats.pop(self._profiles[-1]["id"], None)
+        self._profiles.appendleft(entry)
+        if stats is not None:
+            self._stats[entry["id"]] = stats
+            self.profiled += 1
+        if entry["n_plus_one"]:
+            self.flagged += 1
+        return entry["id"]
+
+    def list(self, limit: int = 50, flagged_only: bool = False) -> List[Dict[str, Any]]:
+        profiles = [p for p in self._profiles if p["n_plus_one"]] if flagged_only else list(self._profiles)
+        return [{k: v for k, v in p.items() if k != "top"} for p in profiles[:limit]]
+
+    def get(self, profile_id: int) -> Optional[Dict[str, Any]]:
+        return next((p for p in self._profiles if p["id"] == profile_id), None)
+
+    def get_stats(self, profile_id: int) -> Optional[pstats.Stats]:
+        return self._stats.get(profile_id)
+
+    def clear(self):
+        self._profiles.clear()
+        self._stats.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "stored": len(self._profiles),
+            "max_profiles": self._profiles.maxlen,
+            "profiled": self.profiled,
+            "n_plus_one_flagged": self.flagged,
+            "sample_rate": settings.PROFILING_SAMPLE_RATE,
+        }
+
+profile_store = ProfileStore(settings.PROFILING_MAX_PROFILES)
+
+def top_functions(stats: pstats.Stats, limit: int = TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+    """Most expensive functions by cumulative time"""
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "own_ms": round(own * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        })
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:limit]
+
+def format_stats(stats: pstats.Stats, limit: int = TOP_FUNCTIONS) -> str:
+    """Classic pstats text report"""
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
+
+def dump_stats(stats: pstats.Stats) -> bytes:
+    """Same bytes as pstats.Stats.dump_stats, so `pstats.Stats(path)` / snakeviz can load them"""
+    return marshal.dumps(stats.stats)
+
+def _header(scope: dict, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+async def _is_admin_request(scope: dict) -> bool:
+    """Bearer token of an admin user, checked only when X-Profile is present"""
+    authorization = _header(scope, b"authorization") or ""
+    if not authorization.lower().startswith("bearer "):
+        return False
+    try:
+        payload = jwt.decode(authorization[7:], settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except jwt.JWTError:
+        return False
+    from backend.database.connection import get_database
+    db = await get_database()
+    user = await db.users.find_one({"email": payload.get("sub")}, {"role": 1})
+    return user is not None and user.get("role") == "admin"
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware running selected requests under cProfile
+
+    cProfile hooks the whole thread, so only one request is profiled at a
+    time: anything else on the event loop while it awaits shows up in its
+    profile too. DB calls are counted per request via a context variable.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = False
+
+    async def _should_profile(self, scope: dict) -> Tuple[bool, str]:
+        """Claims the profiler slot when it returns True; the caller must release it"""
+        if self._busy:
+            return False, ""
+        # Claim before awaiting the admin lookup so concurrent requests can't both pass
+        self._busy = True
+        try:
+            if _header(scope, PROFILE_HEADER) and await _is_admin_request(scope):
+                return True, "header"
+            if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+                return True, "sampled"
+        except BaseException:
+            self._busy = False
+            raise
+        self._busy = False
+        return False, ""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile_it, trigger = await self._should_profile(scope)
+        profile_id = profile_store.next_id() if profile_it else None
+        request_profile = RequestProfile()
+        token = _current.set(request_profile)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if profile_id is not None:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", str(profile_id).encode())]
+            await send(message)
+
+        profiler = cProfile.Profile() if profile_it else None
+        started = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._busy = False
+            _current.reset(token)
+            duration = time.perf_counter() - started
+            flagged = request_profile.n_plus_one()
+            if profiler is not None or flagged:
+                stats = pstats.Stats(profiler) if profiler is not None else None
+                route = route_template(scope)
+                profile_store.add({
+                    "method": scope.get("method"),
+                    "path": scope.get("path"),
+                    "route": route,
+                    "status": status["code"],
+                    "trigger": trigger or "n_plus_one",
+                    "duration_ms": round(duration * 1000, 2),
+                    "db_calls": sum(request_profile.db_calls.values()),
+                    "db_by_op": {f"{c}.{op}": n for (c, op), n in request_profile.db_calls.most_common()},
+                    "n_plus_one": flagged,
+                    "profiled": stats is not None,
+                    "top": top_functions(stats) if stats is not None else [],
+                    "created_at": datetime.now(NEPAL_TZ).isoformat(),
+                }, stats, profile_id)
@@ -0,0 +1,148 @@
+"""
+Log Retention
+Keeps audit_logs and agent_actions bounded: raw events older than each
+collection's retention window are compacted into daily per-actor,
+per-action aggregates (`<collection>_daily`) and then deleted
+"""
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+import pytz
+
+from backend.config import get_settings
+from backend.database.connection import get_database
+from backend.utils.logger import get_logger
+from backend.utils.shared_state import shared_state
+from backend.utils.timezone import to_nepal_time
+
+settings = get_settings()
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+logger = get_logger(__name__)
+
+COMPACT_CHUNK = 1000
+
+# collection -> which fields identify the actor and the action, and how long raw events are kept
+RETENTION_POLICIES: Dict[str, Dict[str, Any]] = {
+    "audit_logs": {"actor_field": "actor", "action_field": "action", "keep_days": settings.AUDIT_RETENTION_DAYS},
+    "agent_actions": {"actor_field": "agent_name", "action_field": "action", "keep_days": settings.AGENT_ACTION_RETENTION_DAYS},
+}
+
+_last_run: Dict[str, Any] = {"finished_at": None, "summary": None}
+
+def rollup_collection(collection: str) -> str:
+    return f"{collection}_daily"
+
+async def ensure_retention_indexes():
+    """Indexes for recent-window queries and rollup upserts"""
+    db = await get_database()
+    for collection, policy in RETENTION_POLICIES.items():
+        await db[collection].create_index([("timestamp", -1)])
+        await db[collection].create_index([(policy["actor_field"], 1), ("timestamp", -1)])
+        await db[rollup_collection(collection)].create_index(
+            [("day", 1), ("actor", 1), ("action", 1)], unique=True
+        )
+
+async def migrate_string_timestamps(collection: str) -> int:
+    """Convert legacy "YYYY-MM-DD HH:MM:SS" (Nepal time) timestamps to datetimes"""
+    db = await get_database()
+    migrated = 0
+    async for doc in db[collection].find({"timestamp": {"$type": "string"}}, {"timestamp": 1}):
+        try:
+            value = NEPAL_TZ.localize(datetime.strptime(doc["timestamp"][:19], "%Y-%m-%d %H:%M:%S"))
+        except ValueError:
+            continue
+        await db[collection].update_one({"_id": doc["_id"]}, {"$set": {"timestamp": value}})
+        migrated += 1
+    return migrated
+
+async def _flush_rollups(collection: str, groups: Dict[Tuple[str, str, str], Dict[str, Any]]):
+    db = await get_database()
+    rollups = db[rollup_collection(collection)]
+    for (day, actor, action), group in groups.items():
+        await rollups.update_one(
+            {"day": day, "actor": actor, "action": action},
+            {
+                "$inc": {"count": group["count"]},
+                "$min": {"first": group["first"]},
+                "$max": {"last": group["last"]},
+            },
+            upsert=True
+        )
+
+async def compact_collection(collection: str, keep_days: int = None) -> Dict[str, Any]:
+    """
+    Roll raw events older than the retention window into daily aggregates, then delete them
+
+    Works in chunks: each chunk's counts are added to the rollups before
+    exactly those documents are deleted, so an interrupted run never
+    loses events (at worst the next run finishes the job).
+    """
+    policy = RETENTION_POLICIES[collection]
+    keep_days = policy["keep_days"] if keep_days is None else keep_days
+    cutoff = datetime.now(NEPAL_TZ) - timedelta(days=keep_days)
+    db = await get_database()
+
+    migrated = await migrate_string_timestamps(collection)
+    compacted = 0
+    while True:
+        chunk: List[dict] = await db[collection].find(
+            {"timestamp": {"$lt": cutoff}},
+            {"timestamp": 1, policy["actor_field"]: 1, policy["action_field"]: 1}
+        ).limit(COMPACT_CHUNK).to_list(length=COMPACT_CHUNK)
+        if not chunk:
+            break
+
+        groups: Dict[Tuple[str, str, str], Dict[str, Any]] = defaultdict(lambda: {"count": 0, "first": None, "last": None})
+        for doc in chunk:
+            moment = to_nepal_time(doc["timestamp"])
+            group = groups[(moment.date().isoformat(), str(doc.get(policy["actor_field"])), str(doc.get(policy["action_field"])))]
+            group["count"] += 1
+            group["first"] = moment if group["first"] is None else min(group["first"], moment)
+            group["last"] = moment if group["last"] is None else max(group["last"], moment)
+
+        await _flush_rollups(collection, groups)
+        await db[collection].delete_many({"_id": {"$in": [doc["_id"] for doc in chunk]}})
+        compacted += len(chunk)
+        if len(chunk) < COMPACT_CHUNK:
+            break
+
+    return {
+        "collection": collection,
+        "cutoff": cutoff.isoformat(),
+        "migrated_timestamps": migrated,
+        "compacted": compacted,
+        "remaining": await db[collection].count_documents({}),
+    }
+
+async def run_retention() -> Dict[str, Any]:
+    """Apply every collection's policy once"""
+    summary = {collection: await compact_collection(collection) for collection in RETENTION_POLICIES}
+    _last_run.update(finished_at=datetime.now(NEPAL_TZ).isoformat(), summary=summary)
+    return summary
+
+def get_retention_status() -> Dict[str, Any]:
+    return {
+        "policies": {c: {"keep_days": p["keep_days"], "rollups": rollup_collection(c)} for c, p in RETENTION_POLICIES.items()},
+        "interval_hours": settings.RETENTION_INTERVAL_HOURS,
+        "last_run": _last_run,
+    }
+
+async def retention_loop():
+    """Periodic purge started with the app"""
+    try:
+        await ensure_retention_indexes()
+    except Exception as e:
+        logger.error("Retention index error: %s", e)
+    interval = settings.RETENTION_INTERVAL_HOURS * 3600
+    while True:
+        try:
+            # With several workers only the lease holder compacts this round
+            if await shared_state.claim("retention", interval):
+                await run_retention()
+        except Exception as e:
+            logger.error("Retention run failed: %s", e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,240 @@
+"""
+Shared State
+State that has to agree across uvicorn workers: the database, write
+events (which drive every in-process cache's invalidation), Socket.IO
+fan-out and leases for jobs that must run on one worker only.
+
+SHARED_STATE_BACKEND="local" keeps everything in this process (single
+worker, the default). "ipc" routes it through the broker process in
+backend.utils.broker, started on demand, so `uvicorn --workers N` shares
+one database and event stream without any external service.
+"""
+import asyncio
+import hashlib
+import itertools
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from backend.config import get_settings
+from backend.utils.broker import (
+    NONCE_SIZE, default_address, digest, parse_address, read_frame, write_frame,
+)
+from backend.utils.logger import get_logger
+
+settings = get_settings()
+
+logger = get_logger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+CONNECT_ATTEMPTS = 50
+CONNECT_RETRY_DELAY = 0.1
+
+class LocalSharedState:
+    """Single-process backend: nothing leaves this worker"""
+
+    enabled = False
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, channel: str, handler: Callable):
+        pass  # local publishers already call their handlers directly
+
+    def publish(self, channel: str, message: Any):
+        pass
+
+    async def claim(self, name: str, ttl: float) -> bool:
+        return True
+
+    def socketio_manager(self) -> Optional[socketio.AsyncManager]:
+        return None
+
+    async def stats(self) -> Dict[str, Any]:
+        return {"backend": "local", "pid": os.getpid()}
+
+class BrokerSharedState:
+    """Client side of the shared-state broker (one connection per worker)"""
+
+    enabled = True
+
+    def __init__(self, address: str):
+        self.address = address
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._handlers: Dict[str, List[Callable]] = defaultdict(list)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self.reconnects = 0
+
+    # --- Connection ---------------------------------------------------------
+
+    async def start(self):
+        self._stopping = False
+        await self._ensure_connected()
+
+    async def stop(self):
+        self._stopping = True
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        self._reader = self._writer = self._reader_task = None
+
+    async def _open(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            return await asyncio.open_unix_connection(target)
+        return await asyncio.open_connection(*target)
+
+    def _spawn_broker(self):
+        """Start the broker detached from this worker; extra brokers from racing workers exit at once"""
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(PROJECT_ROOT), env.get("PYTHONPATH")]))
+        env["SHARED_STATE_ADDRESS"] = self.address
+        subprocess.Popen([sys.executable, "-m", "backend.utils.broker"], env=env, start_new_session=True)
+        logger.info("Started shared-state broker at %s", self.address)
+
+    async def _connect(self):
+        spawned = False
+        for _ in range(CONNECT_ATTEMPTS):
+            try:
+                reader, writer = await self._open()
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if not spawned:
+                    self._spawn_broker()
+                    spawned = True
+                await asyncio.sleep(CONNECT_RETRY_DELAY)
+        else:
+            raise RuntimeError(f"Shared-state broker not reachable at {self.address}")
+
+        nonce = await reader.readexactly(NONCE_SIZE)
+        my_nonce = os.urandom(NONCE_SIZE)
+        writer.write(my_nonce + digest(b"client", nonce))
+        proof = await reader.readexactly(hashlib.sha256().digest_size)
+        if proof != digest(b"broker", my_nonce):
+            writer.close()
+            raise RuntimeError("Shared-state broker failed the handshake (SECRET_KEY mismatch?)")
+
+        self._reader, self._writer = reader, writer
+        self._loop = asyncio.get_running_loop()
+        self._reader_task = asyncio.create_task(self._read_loop(reader))
+        for channel in self._handlers:
+            write_frame(writer, (0, "subscribe", (channel,)))
+
+    async def _ensure_connected(self):
+        if self._writer is not None:
+            return
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is None:
+                await self._connect()
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                request_id, first, second = await read_frame(reader)
+                if request_id:
+                    future = self._pending.pop(request_id, None)
+                    if future is not None and not future.done():
+                        if first:
+                            future.set_result(second)
+                        else:
+                            future.set_exception(second)
+                else:
+                    self._deliver(first, second)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if not self._stopping:
+                logger.error("Lost connection to the shared-state broker, reconnecting on next use")
+                self.reconnects += 1
+        finally:
+            if self._reader is reader:
+                self._reader = self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Shared-state broker connection lost"))
+            self._pending.clear()
+
+    def _deliver(self, channel: str, message: Any):
+        for handler in list(self._handlers.get(channel, ())):
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error("Shared-state handler error (%s): %s", channel, e)
+
+    async def request(self, op: str, *args) -> Any:
+        await self._ensure_connected()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        write_frame(self._writer, (request_id, op, args))
+        await self._writer.drain()
+        return await future
+
+    # --- Pub/sub and leases -------------------------------------------------
+
+    def subscribe(self, channel: str, handler: Callable):
+        """`handler(message)` runs for messages published on the channel by other workers"""
+        first = channel not in self._handlers
+        self._handlers[channel].append(handler)
+        if first and self._writer is not None:
+            write_frame(self._writer, (0, "subscribe", (channel,)))
+
+    def publish(self, channel: str, message: Any):
+        """Fire and forget; the publishing worker handles its own message locally"""
+        if self._writer is None or self._loop is None:
+            return  # not started (import time, scripts) or reconnecting
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                write_frame(self._writer, (0, "publish", (channel, message)))
+                return
+        except RuntimeError:
+            pass
+        self._loop.call_soon_threadsafe(self.publish, channel, message)
+
+    async def claim(self, name: str, ttl: float) -> bool:
+        """Take or renew a lease for `ttl` seconds; only the holder should run the job"""
+        return await self.request("claim", name, ttl)
+
+    def socketio_manager(self) -> socketio.AsyncManager:
+        return BrokerClientManager(self)
+
+    async def stats(self) -> Dict[str, Any]:
+        broker = await self.request("stats")
+        return {"backend": "ipc", "address": self.address, "pid": os.getpid(),
+                "reconnects": self.reconnects, "broker": broker}
+
+class BrokerClientManager(AsyncPubSubManager):
+    """Socket.IO client manager relaying emits and room changes to the other workers"""
+
+    name = "shared_state"
+
+    def __init__(self, state: BrokerSharedState, channel: str = "socketio"):
+        super().__init__(channel=channel)
+        self.state = state
+        self._queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        state.subscribe(channel, self._queue.put_nowait)
+
+    async def _publish(self, data):
+        self.state.publish(self.channel, data)
+
+    async def _listen(self):
+        while True:
+            yield await self._queue.get()
+
+shared_state = BrokerSharedState(default_address()) if settings.SHARED_STATE_BACKEND == "ipc" else LocalSharedState()
@@ -3,11 +3,15 @@ Nepal Timezone Utilities
 Provides timezone-aware datetime functions for Nepal (UTC+5:45)
 """
 from datetime import datetime, date, time
+from typing import List
 import pytz
+from backend.config import get_settings
 
 # Nepal Timezone (GMT+5:45)
 NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
 
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
 def get_nepal_time() -> datetime:
     """Get current time in Nepal timezone"""
     return datetime.now(NEPAL_TZ)
@@ -35,6 +39,26 @@ def is_lab_open() -> bool:
     current_hour = get_nepal_time().hour
     return 12 <= current_hour < 17
 
+def get_lab_closed_weekdays() -> List[str]:
+    """Weekday names the lab is closed on (LAB_CLOSED_WEEKDAYS setting)"""
+    configured = get_settings().LAB_CLOSED_WEEKDAYS
+    names = {name.strip().lower() for name in configured.split(",") if name.strip()}
+    return [day for day in WEEKDAYS if day.lower() in names or day[:3].lower() in names]
+
+def get_lab_holidays() -> List[str]:
+    """ISO dates the lab is closed on (LAB_HOLIDAYS setting)"""
+    configured = get_settings().LAB_HOLIDAYS
+    return sorted(d.strip() for d in configured.split(",") if d.strip())
+
+def get_lab_weekmask() -> str:
+    """Monday-first open-day mask in numpy busday format, e.g. '1111101'"""
+    closed = set(get_lab_closed_weekdays())
+    return "".join("0" if day in closed else "1" for day in WEEKDAYS)
+
+def is_lab_open_on(day: date) -> bool:
+    """Check if the lab calendar has the lab open on a given date"""
+    return WEEKDAYS[day.weekday()] not in get_lab_closed_weekdays() and day.isoformat() not in get_lab_holidays()
+
 def get_lab_status() -> str:
     """Get lab status: OPEN or CLOSED"""
     return "OPEN" if is_lab_open() else "CLOSED"
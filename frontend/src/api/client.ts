@@ -1,6 +1,7 @@
 import axios from 'axios';
 
-const API_URL = 'http://localhost:8000/api/v1';
+export const SERVER_URL = 'http://localhost:8000';
+const API_URL = `${SERVER_URL}/api/v1`;
 
 export const api = axios.create({
     baseURL: API_URL,
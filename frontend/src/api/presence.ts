@@ -0,0 +1,74 @@
+import { useEffect, useState } from 'react';
+import { io } from 'socket.io-client';
+import { SERVER_URL } from './client';
+
+export interface PresenceMember {
+    user_id: string;
+    name?: string | null;
+    status: 'in' | 'out' | 'absent' | null;
+    check_in?: string | null;
+    check_out?: string | null;
+}
+
+export interface PresenceCounts {
+    in_lab: number;
+    checked_out: number;
+    absent: number;
+    resources_in_use: number;
+}
+
+export interface Presence {
+    seq: number;
+    day?: string;
+    counts: PresenceCounts;
+    members: Record<string, PresenceMember>;
+}
+
+const byUserId = (members: PresenceMember[] = []) =>
+    Object.fromEntries(members.map((member) => [member.user_id, member]));
+
+/**
+ * Live lab presence: a snapshot on connect, then debounced deltas.
+ * A gap in the sequence numbers asks the server for a fresh snapshot.
+ */
+export function usePresence(): Presence | null {
+    const [presence, setPresence] = useState<Presence | null>(null);
+
+    useEffect(() => {
+        // Websocket only: long-polling needs sticky sessions with several workers
+        const socket = io(SERVER_URL, {
+            transports: ['websocket'],
+            auth: { token: localStorage.getItem('token') },
+        });
+        let seq = -1;
+
+        socket.on('presence:snapshot', (data) => {
+            seq = data.seq;
+            setPresence({ seq, day: data.day, counts: data.counts, members: byUserId(data.members) });
+        });
+
+        socket.on('presence:delta', (data) => {
+            if (data.seq <= seq) return;
+            if (data.seq !== seq + 1) {
+                socket.emit('presence:sync');
+                return;
+            }
+            seq = data.seq;
+            setPresence((previous) => {
+                if (!previous) return previous;
+                const members = { ...previous.members };
+                for (const member of data.members || []) {
+                    if (member.status === null) delete members[member.user_id];
+                    else members[member.user_id] = member;
+                }
+                return { ...previous, seq, counts: data.counts, members };
+            });
+        });
+
+        return () => {
+            socket.disconnect();
+        };
+    }, []);
+
+    return presence;
+}
@@ -1,29 +1,34 @@
 import React, { useEffect, useState } from 'react';
 import { api } from '../api/client';
+import { usePresence } from '../api/presence';
 import { Users, UserCheck, UserX, Settings, BarChart3 } from 'lucide-react';
 import { useNavigate } from 'react-router-dom';
 
 export default function AdminPanel() {
     const [stats, setStats] = useState<any>(null);
     const [members, setMembers] = useState<any[]>([]);
-    const [todayAttendance, setTodayAttendance] = useState<any[]>([]);
+    const presence = usePresence();
     const navigate = useNavigate();
 
+    // Today's attendance is pushed over Socket.IO; only the member roster is fetched
+    const todayAttendance = presence
+        ? Object.values(presence.members).filter((member) => member.status === 'in' || member.status === 'out')
+        : [];
+    const presentToday = presence ? presence.counts.in_lab + presence.counts.checked_out : stats?.present_today;
+
     useEffect(() => {
         fetchData();
     }, []);
 
     const fetchData = async () => {
         try {
-            const [statsRes, membersRes, attendanceRes] = await Promise.all([
+            const [statsRes, membersRes] = await Promise.all([
                 api.get('/admin/stats'),
-                api.get('/admin/members'),
-                api.get('/admin/attendance/today')
+                api.get('/admin/members')
             ]);
 
             setStats(statsRes.data);
             setMembers(membersRes.data);
-            setTodayAttendance(attendanceRes.data);
         } catch (error) {
             console.error('Error fetching admin data:', error);
         }
@@ -90,7 +95,7 @@ export default function AdminPanel() {
                         <div className="flex items-center justify-between">
                             <div>
                                 <p className="text-gray-400 text-sm">Present Today</p>
-                                <h3 className="text-2xl font-bold">{stats.present_today}</h3>
+                                <h3 className="text-2xl font-bold">{presentToday}</h3>
                             </div>
                             <UserCheck className="w-8 h-8 text-green-500" />
                         </div>
@@ -100,7 +105,7 @@ export default function AdminPanel() {
                         <div className="flex items-center justify-between">
                             <div>
                                 <p className="text-gray-400 text-sm">Absent Today</p>
-                                <h3 className="text-2xl font-bold">{stats.total_members - stats.present_today}</h3>
+                                <h3 className="text-2xl font-bold">{stats.total_members - presentToday}</h3>
                             </div>
                             <UserX className="w-8 h-8 text-red-500" />
                         </div>
@@ -163,10 +168,10 @@ export default function AdminPanel() {
                     <h2 className="text-xl font-bold mb-4">Today's Attendance</h2>
                     <div className="space-y-2">
                         {todayAttendance.map((record) => (
-                            <div key={record._id} className="flex justify-between items-center p-3 bg-gray-700/50 rounded">
+                            <div key={record.user_id} className="flex justify-between items-center p-3 bg-gray-700/50 rounded">
                                 <div>
-                                    <p className="font-semibold">{record.user_name}</p>
-                                    <p className="text-sm text-gray-400">Check-in: {new Date(record.check_in).toLocaleTimeString()}</p>
+                                    <p className="font-semibold">{record.name}</p>
+                                    <p className="text-sm text-gray-400">Check-in: {record.check_in ? new Date(record.check_in).toLocaleTimeString() : 'N/A'}</p>
                                 </div>
                                 <div className="text-right">
                                     {record.check_out ? (